@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from itertools import count
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from db_utils import get_corpus_version
+
+# Semantic answer cache configuration
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Minimum cosine similarity between standalone questions for a cached answer to be reused
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+@dataclass
+class CachedAnswer:
+    """An answer produced for one standalone question against one corpus version"""
+    model_name: str
+    question: str
+    answer: str
+    source_documents: List[Document]
+    # None for answers stored without embedding the question; only exact repeats find them
+    vector: Optional[np.ndarray] = field(repr=False)
+    created: float
+    hits: int = 0
+
+class SemanticAnswerCache:
+    """In-process cache of RAG answers keyed on the embedding of the standalone question.
+
+    A lookup returns the most similar cached question for the same model if its
+    cosine similarity reaches `threshold`. Entries are scoped to the corpus
+    version in the database: any change to the indexed documents, from this or
+    another process, empties the cache at the next lookup. Entries also expire
+    `ttl` seconds after they were answered and the least recently used ones are
+    evicted beyond `max_entries`.
+
+    `lookup_question` finds an answer by the exact standalone question instead,
+    for callers that want to avoid embedding it.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl: float = ANSWER_CACHE_TTL,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        corpus_version=get_corpus_version
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.corpus_version = corpus_version
+        self._entries = OrderedDict()
+        # (model name, normalised question) -> entry id of its latest answer
+        self._questions = {}
+        # Per model: (entry ids, stacked unit vectors), rebuilt after that model's entries change
+        self._matrices = {}
+        self._ids = count()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _clear(self):
+        self._entries.clear()
+        self._questions.clear()
+        self._matrices.clear()
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        key = (entry.model_name, _normalize_question(entry.question))
+        if self._questions.get(key) == entry_id:
+            del self._questions[key]
+        self._matrices.pop(entry.model_name, None)
+
+    def sync_version(self) -> int:
+        """Read the corpus version, dropping every entry if the documents changed; returns the version"""
+        version = self.corpus_version()
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self.invalidations += 1
+                self._clear()
+                self._version = version
+        return version
+
+    def invalidate(self):
+        """Drop every cached answer"""
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._clear()
+
+    def _matrix(self, model_name: str):
+        matrix = self._matrices.get(model_name)
+        if matrix is None:
+            ids = [
+                entry_id for entry_id, entry in self._entries.items()
+                if entry.model_name == model_name and entry.vector is not None
+            ]
+            vectors = np.stack([self._entries[entry_id].vector for entry_id in ids]) if ids else None
+            matrix = self._matrices[model_name] = (ids, vectors)
+        return matrix
+
+    def lookup(self, model_name: str, vector: List[float]) -> Optional[CachedAnswer]:
+        """The cached answer whose question is most similar to `vector`, if it is similar enough"""
+        if not self.enabled:
+            return None
+        query = _normalize(vector)
+        now = time.time()
+        with self._lock:
+            while True:
+                ids, vectors = self._matrix(model_name)
+                if vectors is None:
+                    self.misses += 1
+                    return None
+                similarities = vectors @ query
+                best = int(np.argmax(similarities))
+                entry = self._entries[ids[best]]
+                if now - entry.created <= self.ttl:
+                    break
+                # Expired: drop it and look again among the rest
+                self._remove(ids[best])
+                self.expirations += 1
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(ids[best])
+            entry.hits += 1
+            self.hits += 1
+            return entry
+
+    def lookup_question(self, model_name: str, question: str) -> Optional[CachedAnswer]:
+        """The cached answer to exactly `question` (ignoring case and spacing), without embedding it"""
+        if not self.enabled:
+            return None
+        key = (model_name, _normalize_question(question))
+        with self._lock:
+            entry_id = self._questions.get(key)
+            entry = self._entries.get(entry_id) if entry_id is not None else None
+            if entry is not None and time.time() - entry.created > self.ttl:
+                self._remove(entry_id)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_id)
+            entry.hits += 1
+            self.hits += 1
+            return entry
+
+    def store(self, model_name: str, question: str, vector: Optional[List[float]], answer: str,
+              source_documents: List[Document], corpus_version: int):
+        """Cache an answer computed against `corpus_version`; skipped if the corpus has changed since.
+
+        Without a `vector` the answer is only found again by `lookup_question`.
+        """
+        if not self.enabled or not answer:
+            return
+        with self._lock:
+            if corpus_version != self._version:
+                return
+            entry_id = next(self._ids)
+            self._entries[entry_id] = CachedAnswer(
+                model_name=model_name,
+                question=question,
+                answer=answer,
+                source_documents=list(source_documents),
+                vector=_normalize(vector) if vector is not None else None,
+                created=time.time()
+            )
+            self._questions[(model_name, _normalize_question(question))] = entry_id
+            self._matrices.pop(model_name, None)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "corpus_version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+def _normalize(vector) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+def _normalize_question(question: str) -> str:
+    return " ".join(question.lower().split())
+
+answer_cache = SemanticAnswerCache()
@@ -0,0 +1,86 @@
+"""Shared setup for the offline benchmark scripts.
+
+Each benchmark runs inside a throwaway working directory so it never touches
+the repo's chroma_db/ or rag_app.db, and imports the api modules directly.
+"""
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def setup_sandbox() -> str:
+    """Make the api modules importable and switch to a fresh working directory"""
+    if API_DIR not in sys.path:
+        sys.path.insert(0, API_DIR)
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark-key")
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    os.chdir(workdir)
+    return workdir
+
+def time_calls(func, iterations: int) -> list:
+    """Call `func` repeatedly and return the duration of each call in seconds"""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def report(name: str, samples: list):
+    """Print mean/p50/p95 for a list of durations in seconds"""
+    print(
+        f"{name:<32} n={len(samples):<6} "
+        f"mean={statistics.mean(samples) * 1e3:9.3f}ms "
+        f"p50={percentile(samples, 50) * 1e3:9.3f}ms "
+        f"p95={percentile(samples, 95) * 1e3:9.3f}ms"
+    )
+
+def serve_in_thread(app) -> str:
+    """Serve an ASGI app with uvicorn on a free local port and return its base URL.
+
+    Needed where the in-process httpx transport would hide behaviour, e.g. it
+    buffers streaming responses until they complete.
+    """
+    import uvicorn
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}"
+
+# Smallest set of parts that makes a DOCX readable by Docx2txtLoader
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+
+def write_docx(path: str, paragraphs: list):
+    """Write a minimal DOCX holding `paragraphs`, for benchmarks that need generated documents"""
+    body = "".join(f"<w:p><w:r><w:t>{paragraph}</w:t></w:r></w:p>" for paragraph in paragraphs)
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{body}</w:body></w:document>'
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", CONTENT_TYPES)
+        archive.writestr("word/document.xml", document)
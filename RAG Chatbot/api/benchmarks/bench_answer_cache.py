@@ -0,0 +1,94 @@
+"""Measure the semantic answer cache on a workload of repeated and rephrased questions.
+
+Usage: python benchmarks/bench_answer_cache.py [requests] [llm_latency_seconds]
+
+Replays questions drawn with a skewed popularity from a small set, each asked
+in several surface forms, once with the cache disabled and once enabled, and
+reports latency, LLM calls saved and the hit rate. Finally it changes the
+corpus version and checks that cached answers are invalidated.
+"""
+import asyncio
+import random
+import sys
+import time
+import uuid
+
+from _common import setup_sandbox, report
+
+setup_sandbox()
+
+import chroma_utils
+from answer_cache import answer_cache
+from db_utils import bump_corpus_version
+from fakes import BagOfWordsEmbeddings, FakeChatModel, StaticRetriever
+from langchain_utils import ainvoke_rag_chain, chain_registry
+
+TOPICS = [
+    "what does GreenGrow build",
+    "how does the EcoHarvest system save water",
+    "who founded GreenGrow Innovations",
+    "which crops does EcoHarvest support",
+    "what sensors does EcoHarvest use",
+    "how much does EcoHarvest cost",
+    "where is GreenGrow headquartered",
+    "what is the EcoHarvest warranty",
+    "how do I install the EcoHarvest controller",
+    "does EcoHarvest work offline",
+]
+
+def rephrase(topic: str, variant: int) -> str:
+    words = topic.split()
+    forms = [
+        topic.capitalize() + "?",
+        topic.upper() + "?!",
+        " ".join(words[1:] + words[:1]) + "?",
+        "  " + topic + " ...",
+    ]
+    return forms[variant % len(forms)]
+
+def workload(requests: int) -> list:
+    rng = random.Random(7)
+    weights = [1 / (rank + 1) for rank in range(len(TOPICS))]
+    return [rephrase(rng.choices(TOPICS, weights)[0], rng.randrange(4)) for _ in range(requests)]
+
+async def run(questions: list, llm: FakeChatModel, concurrency: int = 8) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def ask(question: str):
+        async with semaphore:
+            start = time.perf_counter()
+            await ainvoke_rag_chain(str(uuid.uuid4()), question)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(ask(question) for question in questions))
+    return latencies
+
+async def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+
+    chroma_utils.get_vectorstore()._embedding_function = BagOfWordsEmbeddings(latency=0.02)
+    llm = FakeChatModel(latency=latency)
+    chain_registry.llm_factory = lambda model_name: llm
+    chain_registry.retriever_factory = lambda model_name: StaticRetriever()
+    questions = workload(requests)
+
+    answer_cache.max_entries = 0
+    report("cache disabled", await run(questions, llm))
+    print(f"{'':<32} LLM calls={llm.calls}")
+
+    answer_cache.max_entries = 1000
+    llm.calls = 0
+    report("cache enabled", await run(questions, llm))
+    stats = answer_cache.stats()
+    print(f"{'':<32} LLM calls={llm.calls} hit_rate={stats['hit_rate']:.2f} entries={stats['entries']}")
+
+    bump_corpus_version()
+    llm.calls = 0
+    await run(questions[:1], llm)
+    stats = answer_cache.stats()
+    print(f"after corpus change: LLM calls={llm.calls} invalidations={stats['invalidations']} entries={stats['entries']}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""Bulk ingestion throughput vs. indexing one file at a time.
+
+Usage: python benchmarks/bench_bulk_ingest.py [files] [paragraphs_per_file]
+
+Writes synthetic DOCX corpora and indexes each with fake embeddings (50ms per
+request plus 1ms per text):
+  - one file at a time through index_document_to_chroma, as /upload-doc does,
+  - bulk_ingest with parsing in-process and with 2 and 4 worker processes.
+Each run gets its own corpus so no run can skip another's files. Finally the
+last corpus is ingested again, which should skip every file by content hash.
+"""
+import os
+import sys
+import time
+
+from _common import setup_sandbox, write_docx
+
+setup_sandbox()
+
+import chroma_utils
+from bulk_ingest import bulk_ingest
+from db_utils import insert_document_record
+from fakes import FakeEmbeddings
+
+WORDS = ("soil sensor harvest irrigation yield drone robotic greenhouse nutrient climate "
+         "quantum processor network latency cloud analytics battery solar turbine grid").split()
+
+def write_corpus(name: str, files: int, paragraphs: int) -> list:
+    os.makedirs(name)
+    paths = []
+    for number in range(files):
+        path = os.path.join(name, f"{name}-{number:04d}.docx")
+        write_docx(path, [
+            f"{name} document {number} section {index}: "
+            + " ".join(WORDS[(number * 7 + index * 3 + offset) % len(WORDS)] for offset in range(60))
+            for index in range(paragraphs)
+        ])
+        paths.append(path)
+    return paths
+
+def print_rate(name: str, files: int, chunks: int, seconds: float, detail: str = ""):
+    print(f"{name:<32} {files / seconds:7.1f} files/s {chunks / seconds:8.1f} chunks/s "
+          f"total={seconds:6.2f}s {detail}")
+
+def one_at_a_time(paths: list):
+    start = time.perf_counter()
+    chunks = 0
+    timings = {}
+    for path in paths:
+        result = chroma_utils.index_document_to_chroma(path, insert_document_record(os.path.basename(path)))
+        chunks += result.chunks
+        for stage, seconds in result.timings.items():
+            timings[stage] = timings.get(stage, 0.0) + seconds
+    stages = ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in timings.items())
+    print_rate("one file at a time", len(paths), chunks, time.perf_counter() - start, stages)
+
+def bulk(name: str, paths: list, workers: int):
+    report = bulk_ingest([(os.path.basename(path), path) for path in paths], workers=workers)
+    stages = ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in report.stage_seconds.items())
+    print_rate(name, report.files, report.chunks, report.seconds,
+               f"indexed={report.indexed} skipped={report.skipped} failed={report.failed} {stages}")
+    return report
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    paragraphs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    embeddings = FakeEmbeddings(latency=0.05, per_text_latency=0.001)
+    chroma_utils.set_embedding_function(embeddings)
+    print(f"{files} DOCX files of {paragraphs} paragraphs per run, {os.cpu_count()} CPUs")
+
+    one_at_a_time(write_corpus("single", files, paragraphs))
+    requests = embeddings.requests
+    print(f"{'':<32} embedding requests={requests}")
+    for workers in (0, 2, 4):
+        bulk(f"bulk, {workers} parse workers", write_corpus(f"bulk{workers}", files, paragraphs), workers)
+        print(f"{'':<32} embedding requests={embeddings.requests - requests}")
+        requests = embeddings.requests
+    report = bulk("bulk again, same files", [os.path.join("bulk4", name) for name in sorted(os.listdir("bulk4"))], 4)
+    print(f"{'':<32} embedding requests={embeddings.requests - requests}")
+    if report.skipped != files:
+        raise RuntimeError(f"expected {files} skipped files, got {report.skipped}")
+
+if __name__ == "__main__":
+    main()
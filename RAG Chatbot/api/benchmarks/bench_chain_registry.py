@@ -0,0 +1,37 @@
+"""Compare per-request chain construction with the cached chain registry.
+
+Usage: python benchmarks/bench_chain_registry.py [iterations]
+
+"per-request build" reproduces the old behaviour of creating a new Gemini
+client, retriever and ConversationalRetrievalChain for every /chat call;
+"registry lookup" is what the hot path does now. No network calls are made.
+"""
+import sys
+import uuid
+
+from _common import setup_sandbox, time_calls, report
+
+setup_sandbox()
+
+from langchain_utils import ChainRegistry, DEFAULT_MODEL, chain_registry, get_session_history
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    def per_request_build():
+        ChainRegistry().get_chain(DEFAULT_MODEL)
+
+    def registry_lookup():
+        chain_registry.get_chain(DEFAULT_MODEL)
+        get_session_history(str(uuid.uuid4()))
+
+    chain_registry.get_chain(DEFAULT_MODEL)  # warm the registry once
+
+    cold = time_calls(per_request_build, iterations)
+    warm = time_calls(registry_lookup, iterations)
+    report("per-request build", cold)
+    report("registry lookup", warm)
+    print(f"speedup: {sum(cold) / sum(warm):.0f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Load test /chat against a stubbed LLM at increasing concurrency.
+
+Usage: python benchmarks/bench_chat_load.py [requests_per_level] [llm_latency_seconds]
+
+Requests are driven in-process through the ASGI app with httpx, so the
+numbers reflect the endpoint itself: with the async path, throughput should
+grow roughly linearly with concurrency until the stub latency is saturated.
+"""
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+from _common import setup_sandbox, report
+
+setup_sandbox()
+# Take the limiter out of the picture; this measures the event loop, not the quota
+os.environ["CHAT_RATE_LIMIT_RPS"] = "1000000"
+os.environ["CHAT_RATE_LIMIT_BURST"] = "1000000"
+# The answer cache would embed every question with the real Gemini embeddings
+os.environ["ANSWER_CACHE_MAX_ENTRIES"] = "0"
+
+import httpx
+
+from fakes import FakeChatModel, StaticRetriever
+from langchain_utils import chain_registry
+from main import app
+
+CONCURRENCY_LEVELS = [1, 2, 4, 8, 16, 32]
+
+async def run_level(client, concurrency: int, total: int) -> tuple:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one_request():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/chat", json={
+                "question": "What does GreenGrow build?",
+                "session_id": str(uuid.uuid4())
+            })
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(total)))
+    return time.perf_counter() - start, latencies
+
+async def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    chain_registry.llm_factory = lambda model_name: FakeChatModel(latency=latency)
+    chain_registry.retriever_factory = lambda model_name: StaticRetriever()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for concurrency in CONCURRENCY_LEVELS:
+            elapsed, latencies = await run_level(client, concurrency, total)
+            report(f"concurrency={concurrency}", latencies)
+            print(f"{'':<32} throughput={total / elapsed:8.1f} req/s")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+"""Measure time-to-first-token on /chat/stream against total latency of /chat.
+
+Usage: python benchmarks/bench_chat_stream.py [iterations] [llm_latency_seconds]
+
+The stub LLM streams one word at a time, so the gap between the streamed
+TTFT and the blocking /chat latency is what the UI gains by streaming.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+
+from _common import setup_sandbox, report, serve_in_thread
+
+setup_sandbox()
+os.environ["CHAT_RATE_LIMIT_RPS"] = "1000000"
+os.environ["CHAT_RATE_LIMIT_BURST"] = "1000000"
+# The answer cache would embed every question with the real Gemini embeddings
+os.environ["ANSWER_CACHE_MAX_ENTRIES"] = "0"
+
+import httpx
+
+from fakes import FakeChatModel, StaticRetriever
+from langchain_utils import chain_registry
+from main import app
+
+ANSWER = " ".join(["EcoHarvest"] * 60)
+
+async def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+
+    chain_registry.llm_factory = lambda model_name: FakeChatModel(latency=latency, answer=ANSWER)
+    chain_registry.retriever_factory = lambda model_name: StaticRetriever()
+
+    blocking, first_token, streamed_total = [], [], []
+    base_url = serve_in_thread(app)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        for _ in range(iterations):
+            payload = {"question": "What is EcoHarvest?", "session_id": str(uuid.uuid4())}
+
+            start = time.perf_counter()
+            response = await client.post("/chat", json=payload)
+            response.raise_for_status()
+            blocking.append(time.perf_counter() - start)
+
+            payload["session_id"] = str(uuid.uuid4())
+            start = time.perf_counter()
+            async with client.stream("POST", "/chat/stream", json=payload) as response:
+                async for line in response.aiter_lines():
+                    if line.startswith("event: token") and len(first_token) < len(blocking):
+                        first_token.append(time.perf_counter() - start)
+                    elif line.startswith("data: ") and '"time_to_first_token"' in line:
+                        done = json.loads(line[len("data: "):])
+            streamed_total.append(time.perf_counter() - start)
+
+    report("/chat total", blocking)
+    report("/chat/stream first token", first_token)
+    report("/chat/stream total", streamed_total)
+    print(f"server-reported TTFT of last request: {done['time_to_first_token'] * 1e3:.1f}ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
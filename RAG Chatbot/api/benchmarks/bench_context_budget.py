@@ -0,0 +1,96 @@
+"""Show prompt size staying bounded over a long session with the context builder.
+
+Usage: python benchmarks/bench_context_budget.py [turns] [llm_latency_seconds]
+
+Replays one long conversation of follow-up questions through ainvoke_rag_chain
+and records the tokens of every prompt sent to the (fake) model, first with
+the whole history kept and sent to the condense-question prompt, then with the
+history window, rolling summaries and the CONTEXT_TOKEN_LIMIT budget.
+"""
+import asyncio
+import sys
+import time
+import uuid
+
+from _common import setup_sandbox, report
+
+setup_sandbox()
+
+import langchain_utils
+from answer_cache import answer_cache
+from context_builder import CONTEXT_TOKEN_LIMIT, HistorySummarizer
+from db_utils import insert_application_logs
+from fakes import FakeChatModel, StaticRetriever
+from langchain_utils import ainvoke_rag_chain, chain_registry
+from question_rewriter import QuestionRewriter
+from session_memory import SessionMemoryStore
+from token_utils import estimate_tokens
+
+QUESTIONS = ["How much water does it save?", "And what about its sensors?", "Tell me more about that",
+             "Who built it?", "When did they start?", "Why does that matter?"]
+ANSWER = ("The EcoHarvest System combines soil sensors, smart irrigation and automated harvesting "
+          "to cut water usage and raise yields for small farms. ") * 4
+
+class RecordingChatModel(FakeChatModel):
+    """Fake model that records the estimated tokens of every prompt it receives"""
+
+    prompt_tokens: list = []
+
+    def _record(self, messages):
+        self.prompt_tokens.append(sum(estimate_tokens(str(message.content)) for message in messages))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self._record(messages)
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self._record(messages)
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+async def run(store: SessionMemoryStore, turns: int) -> list:
+    session_id = str(uuid.uuid4())
+    latencies = []
+    for turn in range(turns):
+        question = QUESTIONS[turn % len(QUESTIONS)]
+        start = time.perf_counter()
+        result = await ainvoke_rag_chain(session_id, question)
+        latencies.append(time.perf_counter() - start)
+        # main.py logs every turn; the store reads it back on the next sync
+        insert_application_logs(session_id, question, result["answer"], langchain_utils.DEFAULT_MODEL)
+    store.wait_for_summaries()
+    return latencies
+
+async def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+
+    llm = RecordingChatModel(latency=latency, token_latency=0, answer=ANSWER)
+    summary_llm = FakeChatModel(latency=latency, token_latency=0, answer="The human asked about the EcoHarvest System.")
+    chain_registry.llm_factory = lambda model_name: llm
+    chain_registry.retriever_factory = lambda model_name: StaticRetriever()
+    answer_cache.max_entries = 0  # every turn reaches the model
+
+    unbounded = 10 ** 9
+    for name, store, rewriter in (
+        ("whole history",
+         SessionMemoryStore(max_turns=unbounded, max_tokens=unbounded, sync_interval=0),
+         QuestionRewriter(use_heuristic=False, cache_size=0, token_limit=unbounded, history_budget=unbounded)),
+        ("window + summary + budget",
+         SessionMemoryStore(sync_interval=0, summarizer=HistorySummarizer(lambda: summary_llm)),
+         QuestionRewriter(use_heuristic=False, cache_size=0)),
+    ):
+        langchain_utils.session_store = store
+        langchain_utils.question_rewriter = rewriter
+        llm.prompt_tokens = []
+        summary_llm.calls = 0
+        report(name, await run(store, turns))
+        # The first turn only calls the answer step; later turns condense first
+        condense = llm.prompt_tokens[1::2]
+        stats = store.stats()
+        print(f"{'':<32} condense prompt tokens: turn 2={condense[0]} last={condense[-1]} max={max(condense)} "
+              f"(limit {CONTEXT_TOKEN_LIMIT}); history truncations={rewriter.stats()['history_truncations']}")
+        print(f"{'':<32} summaries={stats['summaries']} summarized turns={stats['summarized_turns']} "
+              f"summary LLM calls={summary_llm.calls}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""Compare the pooled WAL SQLite layer with the original connect-per-call code.
+
+Usage: python benchmarks/bench_db.py [operations] [threads]
+
+Measures chat log inserts/sec and history reads/sec, single-threaded and
+from several threads at once, against separate database files.
+"""
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import setup_sandbox
+
+setup_sandbox()
+
+import db_utils
+from pydantic_models import ModelName
+
+SESSIONS = 50
+
+def legacy_connection():
+    conn = sqlite3.connect("legacy.db")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def legacy_log_interaction(session_id, user_query, gpt_response, model):
+    conn = legacy_connection()
+    conn.execute('INSERT INTO application_logs (session_id, user_query, gpt_response, model) VALUES (?, ?, ?, ?)',
+                 (session_id, user_query, gpt_response, model.value))
+    conn.commit()
+    conn.close()
+
+def legacy_get_chat_history(session_id):
+    conn = legacy_connection()
+    rows = conn.execute('SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? ORDER BY created_at',
+                        (session_id,)).fetchall()
+    conn.close()
+    return rows
+
+def setup_legacy():
+    conn = legacy_connection()
+    conn.execute('''CREATE TABLE IF NOT EXISTS application_logs
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, user_query TEXT,
+                     gpt_response TEXT, model TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    conn.close()
+
+def rate(func, operations: int, threads: int) -> float:
+    start = time.perf_counter()
+    if threads == 1:
+        for i in range(operations):
+            func(i)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(func, range(operations)))
+    return operations / (time.perf_counter() - start)
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    setup_legacy()
+
+    implementations = {
+        "connect-per-call": (legacy_log_interaction, legacy_get_chat_history),
+        "pooled WAL": (db_utils.log_interaction, db_utils.get_chat_history),
+    }
+    for name, (log_interaction, get_chat_history) in implementations.items():
+        def insert(i):
+            log_interaction(f"session-{i % SESSIONS}", "What is EcoHarvest?", "An answer " * 20, ModelName.GEMINI_PRO)
+
+        def read(i):
+            get_chat_history(f"session-{i % SESSIONS}")
+
+        for thread_count in (1, threads):
+            print(f"{name:<18} threads={thread_count:<3} "
+                  f"inserts/s={rate(insert, operations, thread_count):9.0f} "
+                  f"history reads/s={rate(read, operations, thread_count):9.0f}")
+
+if __name__ == "__main__":
+    main()
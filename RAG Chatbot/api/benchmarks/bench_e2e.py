@@ -0,0 +1,313 @@
+"""Offline end-to-end benchmark of ingestion and chat, compared against a stored baseline.
+
+Usage: python benchmarks/bench_e2e.py [--requests N] [--uploads N] [--concurrency 1,4,16]
+           [--repeat N] [--llm-latency S] [--embedding-latency S]
+           [--baseline PATH] [--save-baseline] [--tolerance 0.25]
+
+Runs the whole API in-process through the ASGI app, with deterministic
+local fakes in place of ChatGoogleGenerativeAI and GoogleGenerativeAIEmbeddings
+behind the real cache and rate-limited wrappers (limits off):
+  - ingestion: the Sample docs uploaded through /upload-doc, timed until
+    every job has completed,
+  - uploads: synthetic DOCX files uploaded at each concurrency level, timing
+    both the 202 response and the job's completion,
+  - chat: simulated users asking scripted follow-up questions on /chat at
+    each concurrency level, with the answer cache off so every request runs
+    retrieval and generation.
+Each level runs --repeat times and its samples are pooled, so tail
+percentiles rest on more than a handful of requests. Reports p50/p95/p99
+latency, throughput, the mean of each chat stage and the process's RSS.
+Results are compared with the baseline (by default
+benchmarks/baselines/bench_e2e.json), and the script exits with status 1
+when a metric is worse by more than its allowance: the tolerance for chat
+and memory, three times that for uploads and ingestion and four times for
+any p99, ignoring differences under the metric's noise floor.
+--save-baseline stores this run as the new baseline. The numbers are
+absolute times on the machine that ran them, so the baseline has to be
+re-recorded (on an otherwise idle machine) wherever the gate is run.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+from _common import API_DIR, percentile, setup_sandbox, write_docx
+
+REPO_DIR = os.path.dirname(os.path.dirname(API_DIR))
+SAMPLE_DOCS = os.path.join(REPO_DIR, "Sample docs")
+DEFAULT_BASELINE = os.path.join(API_DIR, "benchmarks", "baselines", "bench_e2e.json")
+
+# Follow-ups refer back to earlier turns, so some of them are condensed
+QUESTIONS = [
+    "Where is GreenGrow headquartered?",
+    "Who founded it?",
+    "What does the EcoHarvest System do?",
+    "How much water does it save?",
+    "Which company works on quantum computing?",
+    "Where is that company based?",
+    "What does TechWave Innovations make?",
+    "What does GreenFields BioTech research?",
+]
+WORDS = ("soil sensor harvest irrigation yield drone robotic greenhouse nutrient climate "
+         "quantum processor network latency cloud analytics battery solar turbine grid").split()
+# Differences below these are noise whatever the tolerance, by metric unit suffix
+NOISE_FLOORS = {"_ms": 10.0, "_mb": 5.0, "_per_s": 0.0}
+# Uploads and ingestion share the SQLite writer with the jobs running beside them, and
+# between runs of the same tree vary by up to half again; a 202 that lands behind a job's
+# write or a WAL checkpoint waits up to ~150ms for it. (tolerance multiplier, noise floor in ms)
+SLACK = {"upload.": (3, 200.0), "ingest.": (3, 10.0)}
+# p99 rests on the few slowest requests of each level
+P99_SLACK = 4
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=96, help="/chat requests per concurrency level")
+    parser.add_argument("--uploads", type=int, default=16, help="uploads per concurrency level")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each level, pooled")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake LLM time to first token in seconds")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="fake embedding request latency in seconds")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline results to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative change flagged as a regression")
+    args = parser.parse_args()
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+    args.baseline = os.path.abspath(args.baseline)
+    return args
+
+ARGS = parse_args()
+setup_sandbox()
+# Measure the application, not the quotas
+os.environ["CHAT_RATE_LIMIT_RPS"] = "1000000"
+os.environ["CHAT_RATE_LIMIT_BURST"] = "1000000"
+os.environ["GEMINI_LLM_RPM"] = "0"
+os.environ["GEMINI_LLM_TPM"] = "0"
+os.environ["GEMINI_EMBEDDING_RPM"] = "0"
+os.environ["GEMINI_EMBEDDING_TPM"] = "0"
+# bench_answer_cache.py covers cache hits; here every request does the full work
+os.environ["ANSWER_CACHE_MAX_ENTRIES"] = "0"
+os.environ["TRACE_LOGGING"] = "false"
+
+import httpx
+
+import chroma_utils
+from embedding_cache import CachedEmbeddings
+from fakes import BagOfWordsEmbeddings, FakeChatModel
+from langchain_utils import chain_registry
+from main import app
+from upstream import RateLimitedChatModel, RateLimitedEmbeddings
+
+def rss_mb() -> dict:
+    """Current and peak resident set size of this process"""
+    sizes = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    sizes[line[:5]] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return {"rss_mb": sizes.get("VmRSS", peak), "peak_rss_mb": sizes.get("VmHWM", peak)}
+
+def summarize(prefix: str, samples: list, count: int, seconds: float, metrics: dict):
+    """Add latency percentiles and throughput of `count` operations to `metrics`, and print them"""
+    metrics[f"{prefix}.p50_ms"] = percentile(samples, 50) * 1e3
+    metrics[f"{prefix}.p95_ms"] = percentile(samples, 95) * 1e3
+    metrics[f"{prefix}.p99_ms"] = percentile(samples, 99) * 1e3
+    metrics[f"{prefix}.throughput_per_s"] = count / seconds
+    print(f"{prefix:<24} n={len(samples):<5} p50={metrics[f'{prefix}.p50_ms']:9.2f}ms "
+          f"p95={metrics[f'{prefix}.p95_ms']:9.2f}ms p99={metrics[f'{prefix}.p99_ms']:9.2f}ms "
+          f"throughput={metrics[f'{prefix}.throughput_per_s']:7.1f}/s")
+
+async def upload(client, path: str) -> str:
+    with open(path, "rb") as f:
+        response = await client.post("/upload-doc", files={"file": (os.path.basename(path), f.read())})
+    response.raise_for_status()
+    return response.json()["job_id"]
+
+async def wait_for_job(client, job_id: str) -> dict:
+    while True:
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] == "failed":
+            raise RuntimeError(f"ingestion of {job['filename']} failed: {job['error']}")
+        if job["status"] == "completed":
+            return job
+        # Polling faster would compete with the jobs for the database
+        await asyncio.sleep(0.01)
+
+async def ingest_sample_docs(client, metrics: dict):
+    paths = sorted(glob.glob(os.path.join(SAMPLE_DOCS, "*")))
+    start = time.perf_counter()
+    job_ids = await asyncio.gather(*(upload(client, path) for path in paths))
+    await asyncio.gather(*(wait_for_job(client, job_id) for job_id in job_ids))
+    seconds = time.perf_counter() - start
+    metrics["ingest.sample_docs_ms"] = seconds * 1e3
+    print(f"{'ingest sample docs':<24} files={len(paths):<3} total={seconds * 1e3:9.2f}ms")
+
+async def run_uploads(client, concurrency: int, count: int, run: int, accepted: list, completed: list) -> float:
+    """Upload `count` new documents, at most `concurrency` at a time, each until its job completes.
+
+    Appends each upload's time to the 202 response and to job completion, and
+    returns the run's duration.
+    """
+    paths = []
+    for number in range(count):
+        path = f"upload-c{concurrency}-{run}-{number:03d}.docx"
+        write_docx(path, [
+            f"Upload {concurrency}/{run}/{number} section {index}: "
+            + " ".join(WORDS[(number * 7 + index * 3 + offset) % len(WORDS)] for offset in range(60))
+            for index in range(20)
+        ])
+        paths.append(path)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_upload(path):
+        async with semaphore:
+            begin = time.perf_counter()
+            job_id = await upload(client, path)
+            accepted.append(time.perf_counter() - begin)
+            await wait_for_job(client, job_id)
+            completed.append(time.perf_counter() - begin)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_upload(path) for path in paths))
+    return time.perf_counter() - start
+
+async def run_chat(client, concurrency: int, total: int, run: int, latencies: list, stages: dict) -> float:
+    """Send `total` /chat requests from `concurrency` simulated users, each working through QUESTIONS.
+
+    Appends each request's latency and stage timings, and returns the run's duration.
+    """
+    remaining = [total]
+
+    async def user(number: int):
+        turn = 0
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            if turn % len(QUESTIONS) == 0:
+                session_id = f"c{concurrency}-{run}-user{number}-{turn}"
+            begin = time.perf_counter()
+            response = await client.post("/chat", json={
+                "question": QUESTIONS[turn % len(QUESTIONS)],
+                "session_id": session_id,
+                "include_timings": True
+            })
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - begin)
+            for stage, seconds in response.json()["timings"].items():
+                stages.setdefault(stage, []).append(seconds)
+            turn += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(number) for number in range(concurrency)))
+    return time.perf_counter() - start
+
+def allowance(name: str, tolerance: float) -> tuple:
+    """Relative change and absolute noise floor a metric may move by before it counts as a regression"""
+    unit = next(suffix for suffix in NOISE_FLOORS if name.endswith(suffix))
+    multiplier, floor = 1, NOISE_FLOORS[unit]
+    for prefix, (family_multiplier, family_floor) in SLACK.items():
+        if name.startswith(prefix):
+            multiplier = family_multiplier
+            if unit == "_ms":
+                floor = family_floor
+    if ".p99_" in name:
+        multiplier = max(multiplier, P99_SLACK)
+    return tolerance * multiplier, floor
+
+def compare(metrics: dict, baseline: dict, tolerance: float) -> list:
+    """Print each metric next to its baseline; return the names of those worse by more than their allowance"""
+    regressions = []
+    print(f"\nCompared with the baseline recorded {baseline['recorded']} (tolerance {tolerance:.0%})")
+    for name, value in metrics.items():
+        previous = baseline["metrics"].get(name)
+        if previous is None:
+            continue
+        allowed, floor = allowance(name, tolerance)
+        # Throughput regresses downwards, latency and memory upwards
+        worse = previous - value if name.endswith("_per_s") else value - previous
+        change = (value - previous) / previous if previous else 0.0
+        flagged = worse > floor and previous and worse / previous > allowed
+        if flagged:
+            regressions.append(name)
+        print(f"{'REGRESSION ' if flagged else '':>11}{name:<36} {previous:10.2f} -> {value:10.2f} "
+              f"({change:+.0%}, allowed {allowed:.0%})")
+    return regressions
+
+async def main():
+    chroma_utils.set_embedding_function(CachedEmbeddings(
+        RateLimitedEmbeddings(BagOfWordsEmbeddings(latency=ARGS.embedding_latency, per_text_latency=0.0005)),
+        chroma_utils.get_embedding_cache(), model_name="bench"
+    ))
+    chain_registry.llm_factory = lambda model_name: RateLimitedChatModel(model=FakeChatModel(latency=ARGS.llm_latency))
+
+    config = {
+        "requests": ARGS.requests, "uploads": ARGS.uploads, "concurrency": ARGS.concurrency, "repeat": ARGS.repeat,
+        "llm_latency": ARGS.llm_latency, "embedding_latency": ARGS.embedding_latency
+    }
+    print(f"End-to-end benchmark, {config}")
+    metrics = {}
+    stages = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        await ingest_sample_docs(client, metrics)
+        for concurrency in ARGS.concurrency:
+            accepted, completed = [], []
+            seconds = sum([await run_uploads(client, concurrency, ARGS.uploads, run, accepted, completed)
+                           for run in range(ARGS.repeat)])
+            summarize(f"upload.c{concurrency}", accepted, len(accepted), seconds, metrics)
+            summarize(f"ingest.c{concurrency}", completed, len(completed), seconds, metrics)
+        # Chat runs last, so every level searches the same corpus
+        for concurrency in ARGS.concurrency:
+            latencies = []
+            seconds = sum([await run_chat(client, concurrency, ARGS.requests, run, latencies, stages)
+                           for run in range(ARGS.repeat)])
+            summarize(f"chat.c{concurrency}", latencies, len(latencies), seconds, metrics)
+
+    print("chat stages (mean over all levels)")
+    for stage in sorted(stages, key=lambda name: -sum(stages[name])):
+        metrics[f"chat.stage.{stage}.mean_ms"] = sum(stages[stage]) / len(stages[stage]) * 1e3
+        print(f"  {stage:<36} n={len(stages[stage]):<5} mean={metrics[f'chat.stage.{stage}.mean_ms']:9.2f}ms")
+    memory = rss_mb()
+    metrics["memory.rss_mb"] = memory["rss_mb"]
+    metrics["memory.peak_rss_mb"] = memory["peak_rss_mb"]
+    print(f"memory: RSS {memory['rss_mb']:.1f}MB, peak {memory['peak_rss_mb']:.1f}MB")
+
+    results = {
+        "recorded": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "config": config,
+        "metrics": {name: round(value, 3) for name, value in metrics.items()}
+    }
+    regressions = []
+    if os.path.exists(ARGS.baseline):
+        with open(ARGS.baseline) as f:
+            baseline = json.load(f)
+        if baseline["config"] != config:
+            print(f"\nWarning: the baseline was recorded with {baseline['config']}")
+        if baseline["machine"] != results["machine"]:
+            print(f"Warning: the baseline was recorded on {baseline['machine']}; "
+                  f"re-record it here with --save-baseline")
+        regressions = compare(metrics, baseline, ARGS.tolerance)
+    else:
+        print(f"\nNo baseline at {ARGS.baseline}")
+    if ARGS.save_baseline:
+        os.makedirs(os.path.dirname(ARGS.baseline), exist_ok=True)
+        with open(ARGS.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved this run as the baseline at {ARGS.baseline}")
+    if regressions:
+        print(f"{len(regressions)} metrics regressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+"""Measure what the embedding cache saves on re-uploads and overlapping documents.
+
+Usage: python benchmarks/bench_embedding_cache.py [chunks]
+
+Uploads the same synthetic document twice, then a document that shares half
+of its chunks, counting embedding API requests against FakeEmbeddings.
+"""
+import sys
+
+from _common import setup_sandbox
+
+setup_sandbox()
+
+from langchain_chroma import Chroma
+
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from fakes import FakeEmbeddings
+from ingestion_utils import EmbeddingPipeline
+
+def ingest(label, pipeline, backend, file_id, texts):
+    before = backend.requests
+    ids = [f"{file_id}-{i}" for i in range(len(texts))]
+    stats = pipeline.run(ids, texts, [{"file_id": file_id}] * len(texts))
+    print(f"{label:<28} {stats.seconds:6.2f}s  embedding requests={backend.requests - before}")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    texts = [f"Section {i} of the QuantumNext Systems profile. " + "detail " * 80 for i in range(count)]
+    overlapping = texts[count // 2:] + [f"New section {i}. " + "detail " * 80 for i in range(count // 2)]
+
+    backend = FakeEmbeddings(latency=0.1)
+    cache = EmbeddingCache("embedding_cache.db", max_entries=10 * count)
+    embeddings = CachedEmbeddings(backend, cache, model_name="models/embedding-001")
+    store = Chroma(persist_directory="./chroma_db", embedding_function=embeddings)
+    pipeline = EmbeddingPipeline(embeddings, store._collection, batch_size=100, concurrency=4)
+
+    ingest("first upload", pipeline, backend, 1, texts)
+    ingest("re-upload (new file id)", pipeline, backend, 2, texts)
+    ingest("50% overlapping document", pipeline, backend, 3, overlapping)
+
+    before = backend.requests
+    for _ in range(3):
+        store.similarity_search("What does QuantumNext build?", k=2)
+    print(f"{'3 identical queries':<28} embedding requests={backend.requests - before}")
+    print(cache.stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Measure chat history reads on a large application_logs table, with and without the indexes.
+
+Usage: python benchmarks/bench_history_pagination.py [rows] [sessions] [page_size]
+
+Fills application_logs with `rows` interactions (default 10,000,000) spread
+over `sessions` sessions, then times get_chat_history for one session on the
+unindexed table, again after the migrations add the indexes, and walks the
+session page by page with get_chat_history_page.
+"""
+import random
+import sys
+import time
+
+from _common import setup_sandbox, report
+
+setup_sandbox()
+
+import db_utils
+from migrations import MIGRATIONS
+
+FILL_BATCH = 50000
+READS = 20
+
+def fill(rows: int, sessions: int):
+    start = time.perf_counter()
+    with db_utils.db_connection() as conn:
+        for offset in range(0, rows, FILL_BATCH):
+            count = min(FILL_BATCH, rows - offset)
+            conn.executemany(
+                "INSERT INTO application_logs (session_id, user_query, gpt_response, model, created_at) "
+                "VALUES (?, 'What is EcoHarvest?', 'An answer', 'models/gemini-1.5-pro', datetime(?, 'unixepoch'))",
+                ((f"session-{random.randrange(sessions)}", 1700000000 + offset + i) for i in range(count))
+            )
+            conn.commit()
+    print(f"Inserted {rows} rows in {time.perf_counter() - start:.1f}s")
+
+def time_reads(name: str, session_ids: list):
+    samples = []
+    for session_id in session_ids:
+        start = time.perf_counter()
+        db_utils.get_chat_history(session_id)
+        samples.append(time.perf_counter() - start)
+    report(name, samples)
+
+def walk_pages(session_id: str, page_size: int):
+    samples = []
+    cursor = None
+    while True:
+        start = time.perf_counter()
+        page = db_utils.get_chat_history_page(session_id, limit=page_size, cursor=cursor)
+        samples.append(time.perf_counter() - start)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    report(f"keyset page of {page_size}", samples)
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    page_size = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    # Start from the tables without the history indexes
+    with db_utils.db_connection() as conn:
+        conn.execute("DROP INDEX IF EXISTS idx_application_logs_session_created")
+        conn.execute(f"PRAGMA user_version = {MIGRATIONS[-1][0] - 1}")
+    fill(rows, sessions)
+    session_ids = [f"session-{random.randrange(sessions)}" for _ in range(READS)]
+
+    time_reads("full history, no index", session_ids)
+    start = time.perf_counter()
+    db_utils.initialize_database()
+    print(f"Migrations built the indexes in {time.perf_counter() - start:.1f}s")
+    time_reads("full history, indexed", session_ids)
+    walk_pages(session_ids[0], page_size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark the batched embedding pipeline against single-shot add_documents.
+
+Usage: python benchmarks/bench_ingestion.py [chunks] [request_latency_seconds]
+
+Runs offline against FakeEmbeddings, which simulates per-request latency,
+Gemini's 100-texts-per-request limit and optional 429 errors.
+"""
+import sys
+import time
+
+from _common import setup_sandbox
+
+setup_sandbox()
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+from fakes import FakeEmbeddings
+from ingestion_utils import EmbeddingPipeline
+
+def make_chunks(count: int) -> list:
+    return [
+        Document(
+            page_content=f"Chunk {i}: GreenGrow's EcoHarvest system section {i} " + "lorem ipsum " * 60,
+            metadata={"file_id": 1, "page": i // 4}
+        )
+        for i in range(count)
+    ]
+
+def new_store(name: str, embeddings) -> Chroma:
+    return Chroma(collection_name=name, persist_directory="./chroma_db", embedding_function=embeddings)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    chunks = make_chunks(count)
+    ids = [f"1-{i}" for i in range(count)]
+    texts = [chunk.page_content for chunk in chunks]
+    metadatas = [chunk.metadata for chunk in chunks]
+
+    # Baseline: what index_document_to_chroma used to do
+    embeddings = FakeEmbeddings(latency=latency)
+    store = new_store("baseline", embeddings)
+    start = time.perf_counter()
+    store.add_documents(chunks)
+    elapsed = time.perf_counter() - start
+    print(f"{'add_documents (single shot)':<34} {count / elapsed:8.1f} chunks/s  {elapsed:6.2f}s")
+
+    for batch_size, concurrency in [(100, 1), (32, 4), (100, 4), (100, 8)]:
+        embeddings = FakeEmbeddings(latency=latency)
+        store = new_store(f"pipeline_{batch_size}_{concurrency}", embeddings)
+        stats = EmbeddingPipeline(embeddings, store._collection, batch_size=batch_size, concurrency=concurrency).run(ids, texts, metadatas)
+        label = f"pipeline batch={batch_size} conc={concurrency}"
+        print(f"{label:<34} {stats.chunks_per_second:8.1f} chunks/s  {stats.seconds:6.2f}s")
+
+    # Every 4th request is rate limited: single shot fails, the pipeline backs off
+    embeddings = FakeEmbeddings(latency=latency, rate_limit_every=4)
+    try:
+        new_store("baseline_429", embeddings).add_documents(chunks)
+        print("add_documents with 429s: succeeded")
+    except Exception as e:
+        print(f"add_documents with 429s: failed ({e})")
+    store = new_store("pipeline_429", embeddings)
+    stats = EmbeddingPipeline(embeddings, store._collection, batch_size=100, concurrency=4, max_retries=8, backoff_max=1).run(ids, texts, metadatas)
+    print(f"pipeline with 429s: {stats.summary()}")
+
+    # Resume: a second run only embeds what the first one did not write
+    embeddings = FakeEmbeddings(latency=latency)
+    store = new_store("pipeline_resume", embeddings)
+    half = count // 2
+    EmbeddingPipeline(embeddings, store._collection, batch_size=100).run(ids[:half], texts[:half], metadatas[:half])
+    stats = EmbeddingPipeline(embeddings, store._collection, batch_size=100, concurrency=4).run(ids, texts, metadatas)
+    print(f"pipeline resume: {stats.summary()}")
+
+if __name__ == "__main__":
+    main()
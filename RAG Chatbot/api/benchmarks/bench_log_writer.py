@@ -0,0 +1,54 @@
+"""Compare per-request commits with the group-commit log writer.
+
+Usage: python benchmarks/bench_log_writer.py [interactions] [threads]
+
+Reports the latency each request pays to log its interaction and the
+overall rows/sec, then checks that stopping the writer flushes every row.
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import setup_sandbox, report
+
+setup_sandbox()
+
+import db_utils
+from log_writer import BatchedLogWriter
+from pydantic_models import ModelName
+
+def drive(label, log, interactions, threads, finish=None):
+    latencies = [0.0] * interactions
+
+    def one(i):
+        start = time.perf_counter()
+        log(f"session-{i % 100}", "What is GreenFields BioTech?", "An answer " * 30, ModelName.GEMINI_PRO)
+        latencies[i] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(interactions)))
+    if finish:
+        finish()
+    elapsed = time.perf_counter() - start
+    report(f"{label} (request path)", latencies)
+    print(f"{'':<32} {interactions / elapsed:9.0f} rows/s including final flush")
+
+def count_rows() -> int:
+    with db_utils.db_connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM application_logs').fetchone()[0]
+
+def main():
+    interactions = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+    drive("commit per row", db_utils.log_interaction, interactions, threads)
+
+    writer = BatchedLogWriter()
+    before = count_rows()
+    drive("group commit", writer.log_interaction, interactions, threads, finish=writer.stop)
+    print(f"rows flushed on stop: {count_rows() - before}/{interactions}")
+    print(writer.metrics())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Peak memory of indexing large PDFs: whole-document loading vs. streamed, windowed indexing.
+
+Usage: python benchmarks/bench_pdf_memory.py [pages,pages,...]
+
+Writes synthetic text PDFs (50 lines, about 3.5k characters per page) and
+indexes each in a fresh process with fake embeddings (768 dimensions, no
+latency), so nothing carries over between runs:
+  - whole document: every page loaded, then split, planned and embedded at
+    once, as indexing worked before documents were streamed,
+  - streamed: index_document_to_chroma, which splits pages as they are loaded
+    and embeds and writes 64 or 256 chunks at a time.
+Reports the peak of Python allocations during indexing (tracemalloc) and how
+far the process's peak RSS rose above what it was after warm-up.
+"""
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from _common import setup_sandbox
+
+WORDS = ("soil sensor harvest irrigation yield drone robotic greenhouse nutrient climate "
+         "quantum processor network latency cloud analytics battery solar turbine grid").split()
+LINES_PER_PAGE = 50
+
+def write_pdf(path: str, pages: int):
+    """Write a text-only PDF one page at a time, so generating it never holds the whole document"""
+    rng = random.Random(pages)
+    offsets = []
+    with open(path, "wb") as f:
+        def add_object(body: bytes):
+            offsets.append(f.tell())
+            f.write(f"{len(offsets)} 0 obj\n".encode() + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        kids = " ".join(f"{4 + 2 * page} 0 R" for page in range(pages))
+        add_object(b"<< /Type /Catalog /Pages 2 0 R >>")
+        add_object(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+        add_object(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        for page in range(pages):
+            lines = [
+                f"Page {page} line {line}: " + " ".join(rng.choice(WORDS) for _ in range(9))
+                for line in range(LINES_PER_PAGE)
+            ]
+            stream = ("BT /F1 9 Tf 14 TL 40 800 Td " + " ".join(f"({line}) Tj T*" for line in lines) + " ET").encode()
+            add_object(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents {5 + 2 * page} 0 R "
+                       f"/Resources << /Font << /F1 3 0 R >> >> >>".encode())
+            add_object(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+        xref = f.tell()
+        f.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+        f.write(b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets))
+        f.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(mode: str, path: str):
+    """Index `path` in this process and print its measurements as JSON"""
+    setup_sandbox()
+    import chroma_utils
+    from db_utils import insert_document_record
+    from fakes import FakeEmbeddings
+
+    chroma_utils.set_embedding_function(FakeEmbeddings(latency=0.0, per_text_latency=0.0))
+    # Warm up clients, the vector store and the loader so only indexing is measured
+    chroma_utils.get_vectorstore()
+    chroma_utils.get_lexical_index()
+    chroma_utils.get_loader_class(".pdf")
+    chroma_utils.get_text_splitter()
+    file_id = insert_document_record(os.path.basename(path))
+    baseline = peak_rss_mb()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    if mode == "whole":
+        splits = chroma_utils.load_and_split_document(path)
+        texts = [split.page_content for split in splits]
+        metadatas = chroma_utils.chunk_metadatas(file_id, [split.metadata for split in splits])
+        chroma_utils.apply_chunk_plan(file_id, chroma_utils.plan_chunks(file_id, texts), texts, metadatas)
+        chunks = len(texts)
+    else:
+        result = chroma_utils.index_document_to_chroma(path, file_id, window_chunks=int(mode))
+        if result is None:
+            raise RuntimeError(f"indexing {path} failed")
+        chunks = result.chunks
+    seconds = time.perf_counter() - start
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(json.dumps({
+        "chunks": chunks,
+        "seconds": seconds,
+        "traced_peak_mb": traced_peak / 1024 / 1024,
+        "rss_growth_mb": peak_rss_mb() - baseline
+    }))
+
+def run(mode: str, path: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--measure", mode, path],
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def main():
+    sizes = [int(size) for size in sys.argv[1].split(",")] if len(sys.argv) > 1 else [100, 500]
+    setup_sandbox()
+    print("Peak memory while indexing synthetic PDFs (fake embeddings)")
+    for pages in sizes:
+        path = os.path.abspath(f"{pages}-pages.pdf")
+        write_pdf(path, pages)
+        print(f"{pages} pages, {os.path.getsize(path) / 1024 / 1024:.1f}MB")
+        for name, mode in (("whole document", "whole"), ("streamed, 256-chunk windows", "256"),
+                           ("streamed, 64-chunk windows", "64")):
+            result = run(mode, path)
+            print(f"  {name:<30} chunks={result['chunks']:<6} time={result['seconds']:6.2f}s "
+                  f"traced peak={result['traced_peak_mb']:7.1f}MB RSS growth={result['rss_growth_mb']:7.1f}MB")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3 and sys.argv[1] == "--measure":
+        measure(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,91 @@
+"""Count condense-question LLM calls saved by the question rewriter's fast paths.
+
+Usage: python benchmarks/bench_question_rewrite.py [sessions] [llm_latency_seconds]
+
+Replays scripted multi-turn conversations (a mix of standalone questions and
+follow-ups) through ainvoke_rag_chain, first with every follow-up turn
+rewritten by the LLM, then with the standalone heuristic and rewrite cache.
+Also checks the heuristic against labelled questions, since a follow-up it
+wrongly accepts is retrieved without its context.
+"""
+import asyncio
+import sys
+import time
+import uuid
+
+from _common import setup_sandbox, report
+
+setup_sandbox()
+
+import langchain_utils
+from answer_cache import answer_cache
+from fakes import FakeChatModel, StaticRetriever
+from langchain_utils import ainvoke_rag_chain, chain_registry
+from question_rewriter import QuestionRewriter, is_standalone
+
+CONVERSATIONS = [
+    ["What is the EcoHarvest System?", "How much water does it save?", "Who founded GreenGrow Innovations?",
+     "When did they start the company?"],
+    ["Where is GreenFields BioTech headquartered?", "What about QuantumNext Systems?",
+     "Which company works on quantum computing in Bangalore?", "Tell me more"],
+    ["What sensors does the EcoHarvest System use?", "How does the smart irrigation module reduce water usage?",
+     "And the harvesting?", "What yield improvements did farmers report with EcoHarvest?"],
+    ["What does TechWave Innovations make?", "How many employees does the company have?",
+     "What is the price of the system?", "Where is QuantumNext Systems based?"],
+]
+# (question, whether it can be answered without the history)
+LABELLED = [
+    ("Where is GreenFields BioTech headquartered?", True),
+    ("What yield improvements did farmers report with EcoHarvest?", True),
+    ("Which companies were founded after 2015?", True),
+    ("How many employees does the company have?", False),
+    ("What is the price of the system?", False),
+    ("How does the smart irrigation module reduce water usage?", False),
+    ("When did they start the company?", False),
+    ("What about QuantumNext Systems?", False),
+    ("Tell me more", False),
+]
+
+async def run(sessions: int, concurrency: int = 6) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def converse(turns: list):
+        session_id = str(uuid.uuid4())
+        async with semaphore:
+            for question in turns:
+                start = time.perf_counter()
+                await ainvoke_rag_chain(session_id, question)
+                latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(converse(CONVERSATIONS[i % len(CONVERSATIONS)]) for i in range(sessions)))
+    return latencies
+
+async def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+
+    llm = FakeChatModel(latency=latency)
+    chain_registry.llm_factory = lambda model_name: llm
+    chain_registry.retriever_factory = lambda model_name: StaticRetriever()
+    answer_cache.max_entries = 0  # measure rewriting alone
+
+    wrong = [(question, expected) for question, expected in LABELLED if is_standalone(question) != expected]
+    print(f"heuristic: {len(LABELLED) - len(wrong)}/{len(LABELLED)} labelled questions classified correctly")
+    for question, expected in wrong:
+        print(f"  {'follow-up taken as standalone' if not expected else 'standalone sent to the LLM'}: {question}")
+
+    for name, rewriter in (
+        ("LLM rewrite on every follow-up", QuestionRewriter(use_heuristic=False, cache_size=0)),
+        ("heuristic + rewrite cache", QuestionRewriter()),
+    ):
+        langchain_utils.question_rewriter = rewriter
+        llm.calls = 0
+        report(name, await run(sessions))
+        stats = rewriter.stats()
+        print(f"{'':<32} LLM calls={llm.calls} rewrite calls={stats['llm_calls']} "
+              f"saved: standalone={stats['skipped_standalone']} cached={stats['cache_hits']} "
+              f"(first turns never rewritten: {stats['skipped_no_history']})")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+"""Upstream rate limiting, chat priority and request coalescing against the fake Gemini server.
+
+Usage: python benchmarks/bench_rate_limit.py [server_rpm] [ingestion_calls]
+
+Starts fake_gemini.py with a per-model requests-per-minute quota and runs an
+ingestion-style flood of batch embedding calls from several threads while
+chat-style query embeddings arrive at a steady pace, all through the real
+Gemini embeddings client:
+
+- without a limiter, calls over the quota fail with 429;
+- with the limiter set just under the quota, nothing is rejected;
+- with ingestion at background priority, queries overtake queued batches.
+
+Finally 50 concurrent identical chat prompts are sent with and without
+request coalescing.
+"""
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import setup_sandbox, report, serve_in_thread
+
+setup_sandbox()
+
+import httpx
+
+from fake_gemini import FakeGeminiChatModel, create_app, gemini_embeddings
+from rate_limiter import BACKGROUND_PRIORITY, UpstreamRateLimiter, is_rate_limit_error, rate_limit_priority
+from upstream import RateLimitedChatModel, RateLimitedEmbeddings, RequestCoalescer
+
+INGESTION_THREADS = 8
+QUERIES = 30
+QUERY_INTERVAL = 0.1
+
+def run_mix(embeddings, ingestion_calls: int, ingestion_priority: int = None):
+    """Flood batch embeddings from several threads while queries arrive; returns (query latencies, errors)"""
+    errors = []
+    latencies = []
+
+    def call(func):
+        try:
+            func()
+        except Exception as e:
+            if not is_rate_limit_error(e):
+                raise
+            errors.append(e)
+
+    def ingest(worker: int):
+        def batches():
+            for batch in range(worker, ingestion_calls, INGESTION_THREADS):
+                call(lambda: embeddings.embed_documents([f"chunk {batch}-{i}" for i in range(16)]))
+        if ingestion_priority is None:
+            batches()
+        else:
+            with rate_limit_priority(ingestion_priority):
+                batches()
+
+    def query(number: int):
+        start = time.perf_counter()
+        call(lambda: embeddings.embed_query(f"question {number}"))
+        latencies.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=INGESTION_THREADS + QUERIES) as executor:
+        futures = [executor.submit(ingest, worker) for worker in range(INGESTION_THREADS)]
+        time.sleep(0.2)  # let ingestion fill the queue first
+        for number in range(QUERIES):
+            futures.append(executor.submit(query, number))
+            time.sleep(QUERY_INTERVAL)
+        for future in futures:
+            future.result()
+    return latencies, errors
+
+async def run_identical(llm, callers: int = 50):
+    await asyncio.gather(*(llm.ainvoke("What is the EcoHarvest System?") for _ in range(callers)))
+
+def main():
+    rpm = float(sys.argv[1]) if len(sys.argv) > 1 else 600
+    ingestion_calls = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+
+    # One second of burst keeps the run short while behaving like a per-minute quota
+    url = serve_in_thread(create_app(rpm=rpm, latency=0.02, dimensions=64, burst_seconds=1))
+    client = gemini_embeddings(url)
+
+    def limited(name: str):
+        limiter = UpstreamRateLimiter(name, rpm=rpm * 0.9, burst_seconds=1, max_wait=60, state_path="")
+        return limiter, RateLimitedEmbeddings(client, limiter, RequestCoalescer(enabled=False))
+
+    for name, make, priority in (
+        ("no limiter", lambda: (None, client), None),
+        ("limiter, FIFO", lambda: limited("fifo"), None),
+        ("limiter, chat priority", lambda: limited("priority"), BACKGROUND_PRIORITY),
+    ):
+        httpx.post(f"{url}/reset")
+        time.sleep(1)  # the fake server's buckets refill
+        limiter, embeddings = make()
+        start = time.perf_counter()
+        latencies, errors = run_mix(embeddings, ingestion_calls, priority)
+        elapsed = time.perf_counter() - start
+        served = httpx.get(f"{url}/stats").json().get("embedding-001", {})
+        report(f"{name} (query latency)", latencies)
+        print(f"{'':<32} upstream 429s={served.get('rejected', 0)} failed calls={len(errors)} "
+              f"served={served.get('served', 0)} in {elapsed:.1f}s"
+              + (f" max queued={limiter.stats()['max_queued']}" if limiter else ""))
+
+    for enabled in (False, True):
+        httpx.post(f"{url}/reset")
+        time.sleep(1)
+        upstream = FakeGeminiChatModel(url=url)
+        llm = RateLimitedChatModel(
+            model=upstream,
+            limiter=UpstreamRateLimiter("llm", rpm=rpm * 0.9, burst_seconds=1, max_wait=60, state_path=""),
+            coalescer=RequestCoalescer(enabled=enabled)
+        )
+        start = time.perf_counter()
+        asyncio.run(run_identical(llm))
+        print(f"{'coalescing ' + ('on' if enabled else 'off'):<32} 50 identical prompts -> "
+              f"{upstream.calls} upstream calls in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
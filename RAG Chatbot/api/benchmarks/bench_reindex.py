@@ -0,0 +1,90 @@
+"""Cost of re-indexing a new version of a document: delete-and-reinsert vs. incremental.
+
+Usage: python benchmarks/bench_reindex.py [paragraphs]
+
+Indexes a synthetic DOCX whose paragraphs are one chunk each, then a second
+version with some paragraphs edited, inserted or removed. The old way deletes
+the document and indexes the new version from scratch; the incremental way
+re-indexes it under the same id, embedding only chunks whose text changed.
+Embeddings are fake (50ms per request plus 2ms per text) and uncached, so
+time tracks the number of chunks embedded. After each incremental update the
+chunks in Chroma and the lexical index are checked against the new version.
+"""
+import random
+import sys
+import time
+
+from _common import setup_sandbox, write_docx
+
+setup_sandbox()
+
+import chroma_utils
+from db_utils import get_document_chunks, insert_document_record
+from fakes import FakeEmbeddings
+
+WORDS = ("soil sensor harvest irrigation yield drone robotic greenhouse nutrient climate "
+         "quantum processor network latency cloud analytics battery solar turbine grid").split()
+
+def paragraph(seed: str) -> str:
+    rng = random.Random(seed)
+    # About 900 characters, so every paragraph becomes exactly one chunk
+    return f"{seed}: " + " ".join(rng.choice(WORDS) for _ in range(105))
+
+def edit(paragraphs: list, changed: float = 0.0, inserted: int = 0, removed: float = 0.0) -> list:
+    rng = random.Random(42)
+    result = list(paragraphs)
+    for index in rng.sample(range(len(result)), int(len(result) * changed)):
+        result[index] = paragraph(f"edited {index}")
+    for index in sorted(rng.sample(range(len(result)), int(len(result) * removed)), reverse=True):
+        del result[index]
+    return [paragraph(f"inserted {index}") for index in range(inserted)] + result
+
+def index_version(path: str, paragraphs: list, file_id: int):
+    write_docx(path, paragraphs)
+    return chroma_utils.index_document_to_chroma(path, file_id)
+
+def check(file_id: int, paragraphs: list):
+    stored = chroma_utils.get_vectorstore()._collection.get(where={"file_id": file_id}, include=["documents"])
+    if sorted(stored["documents"]) != sorted(paragraphs):
+        raise RuntimeError(f"Chroma holds {len(stored['ids'])} chunks that do not match the new version")
+    if sorted(chunk_id for chunk_id, _ in get_document_chunks(file_id)) != sorted(stored["ids"]):
+        raise RuntimeError("recorded chunk hashes do not match Chroma")
+    lexical = chroma_utils.get_lexical_index()._conn.execute(
+        "SELECT count(*) FROM chunks WHERE file_id = ?", (file_id,)
+    ).fetchone()[0]
+    if lexical != len(paragraphs):
+        raise RuntimeError(f"lexical index holds {lexical} chunks, expected {len(paragraphs)}")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    embeddings = FakeEmbeddings(latency=0.05, per_text_latency=0.002)
+    chroma_utils.set_embedding_function(embeddings)
+    original = [paragraph(f"paragraph {index}") for index in range(count)]
+    scenarios = [
+        ("1% edited", edit(original, changed=0.01)),
+        ("10% edited", edit(original, changed=0.10)),
+        ("50% edited", edit(original, changed=0.50)),
+        ("5 inserted at the top", edit(original, inserted=5)),
+        ("10% removed", edit(original, removed=0.10)),
+    ]
+    print(f"{count}-chunk document")
+    for name, updated in scenarios:
+        for method in ("delete and reinsert", "incremental"):
+            file_id = insert_document_record(f"{name}.docx")
+            index_version("v1.docx", original, file_id)
+            requests = embeddings.requests
+            start = time.perf_counter()
+            if method == "incremental":
+                result = index_version("v2.docx", updated, file_id)
+            else:
+                chroma_utils.delete_doc_from_chroma(file_id)
+                file_id = insert_document_record(f"{name}.docx")
+                result = index_version("v2.docx", updated, file_id)
+            seconds = time.perf_counter() - start
+            check(file_id, updated)
+            print(f"{name:<24} {method:<20} {seconds * 1e3:8.1f}ms "
+                  f"embedded={result.chunks - result.reused_chunks:<4} reused={result.reused_chunks:<4} "
+                  f"removed={result.removed_chunks:<4} embedding requests={embeddings.requests - requests}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Compare fixed top-k retrieval with the over-fetch, rerank and pack pipeline on the Sample docs.
+
+Usage: python benchmarks/bench_rerank.py [token_budget] [--gemini]
+
+Uses the questions from bench_retrieval.py and reports recall, the context
+tokens each approach stuffs into the prompt, and the per-stage timings of the
+reranking pipeline.
+"""
+import sys
+import time
+
+from bench_retrieval import QUERIES, chroma_utils, index_sample_docs, normalize, USE_GEMINI
+from _common import report
+from fakes import BagOfWordsEmbeddings
+from rerank_utils import LexicalReranker, Reranker
+from retrieval_utils import HybridRetriever, RerankingRetriever, RetrievalStats
+from token_utils import estimate_tokens
+
+def evaluate(name: str, retrieve):
+    found = 0
+    tokens = []
+    samples = []
+    for question, phrase in QUERIES:
+        start = time.perf_counter()
+        documents = retrieve(question)
+        samples.append(time.perf_counter() - start)
+        tokens.append(sum(estimate_tokens(document.page_content) for document in documents))
+        if any(normalize(phrase) in normalize(document.page_content) for document in documents):
+            found += 1
+    report(name, samples)
+    print(f"{'':<32} recall={found / len(QUERIES):.2f} context tokens/query={sum(tokens) / len(tokens):.0f}")
+
+def main():
+    budget = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 2000
+    if not USE_GEMINI:
+        embeddings = BagOfWordsEmbeddings(latency=0.05)
+        chroma_utils.set_embedding_function(embeddings)
+    index_sample_docs()
+    vectorstore = chroma_utils.get_vectorstore()
+    lexical_index = chroma_utils.get_lexical_index()
+
+    evaluate("vector k=2 (previous)", lambda question: vectorstore.similarity_search(question, k=2))
+    evaluate("vector k=8", lambda question: vectorstore.similarity_search(question, k=8))
+    for reranker in (Reranker(), LexicalReranker()):
+        stats = RetrievalStats()
+        pipeline = RerankingRetriever(
+            base_retriever=HybridRetriever(vectorstore=vectorstore, lexical_index=lexical_index, k=20, stats=stats),
+            reranker=reranker,
+            token_budget=budget,
+            stats=stats
+        )
+        evaluate(f"over-fetch 20, {reranker.name} rerank", pipeline.invoke)
+        timings = stats.as_dict()["avg_stage_ms"]
+        print(f"{'':<32} " + " ".join(f"{stage}={ms:.2f}ms" for stage, ms in timings.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Recall and latency of vector, lexical and hybrid retrieval on the Sample docs.
+
+Usage: python benchmarks/bench_retrieval.py [k] [--gemini]
+
+Indexes every file in "Sample docs" and runs a fixed set of questions, each
+paired with a phrase the retrieved chunks must contain. By default queries are
+embedded with a local bag-of-words stand-in that sleeps like a remote call;
+pass --gemini to use the real Gemini embeddings (needs GOOGLE_API_KEY).
+"""
+import glob
+import os
+import sys
+import time
+
+from _common import API_DIR, setup_sandbox, report
+
+REPO_DIR = os.path.dirname(os.path.dirname(API_DIR))
+SAMPLE_DOCS = os.path.join(REPO_DIR, "Sample docs")
+USE_GEMINI = "--gemini" in sys.argv
+if not USE_GEMINI:
+    os.environ.pop("GOOGLE_API_KEY", None)
+
+setup_sandbox()
+
+import chroma_utils
+from fakes import BagOfWordsEmbeddings
+from retrieval_utils import HybridRetriever, RetrievalStats
+
+QUERIES = [
+    ("Where is GreenFields BioTech headquartered?", "Zurich"),
+    ("Which city is QuantumNext based in?", "Bangalore"),
+    ("TechWave Innovations location", "San Francisco"),
+    ("Who founded GreenGrow?", "Sarah Chen"),
+    ("When was the WaterWise Sensor launched?", "WaterWise Sensor, was launched"),
+    ("What did the SoilHealth Monitor do?", "SoilHealth Monitor"),
+    ("How much water does EcoHarvest save?", "up to 40%"),
+    ("How does the system pick ripe crops?", "robotic arms"),
+    ("What yield improvements do farmers see?", "20-30%"),
+    ("How many employees does GreenGrow have?", "200 people"),
+    ("Which company works on quantum computing?", "quantum computing"),
+    ("Which firm does AI and machine learning in Silicon Valley?", "machine learning"),
+    ("What controls the EcoHarvest System?", "AI-powered control unit"),
+    ("Where does GreenGrow have offices?", "California and Iowa"),
+    ("Who does the company partner with for research?", "universities"),
+]
+
+def normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+def index_sample_docs():
+    for file_id, path in enumerate(sorted(glob.glob(os.path.join(SAMPLE_DOCS, "*"))), start=1):
+        if chroma_utils.index_document_to_chroma(path, file_id) is None:
+            raise RuntimeError(f"Failed to index {path}")
+
+def evaluate(name: str, retrieve, k: int):
+    found = 0
+    samples = []
+    for question, phrase in QUERIES:
+        start = time.perf_counter()
+        documents = retrieve(question)[:k]
+        samples.append(time.perf_counter() - start)
+        if any(normalize(phrase) in normalize(document.page_content) for document in documents):
+            found += 1
+    report(name, samples)
+    print(f"{'':<32} recall@{k}={found / len(QUERIES):.2f}")
+
+def main():
+    k = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 2
+    if not USE_GEMINI:
+        embeddings = BagOfWordsEmbeddings(latency=0.05)
+        chroma_utils.set_embedding_function(embeddings)
+    else:
+        # Query embeddings bypass the cache so every query pays for its call
+        chroma_utils.get_vectorstore()._embedding_function = chroma_utils.get_embedding_function().embeddings
+    index_sample_docs()
+    vectorstore = chroma_utils.get_vectorstore()
+    lexical_index = chroma_utils.get_lexical_index()
+    print(f"Indexed {lexical_index.count()} chunks from {SAMPLE_DOCS}")
+
+    evaluate("vector only", lambda question: vectorstore.similarity_search(question, k=k), k)
+    evaluate("lexical only (BM25)", lambda question: [document for document, _ in lexical_index.search(question, k)], k)
+    hybrid = HybridRetriever(vectorstore=vectorstore, lexical_index=lexical_index, k=k, fast_path=False)
+    evaluate("hybrid RRF", hybrid.invoke, k)
+    stats = RetrievalStats()
+    fast = HybridRetriever(vectorstore=vectorstore, lexical_index=lexical_index, k=k, stats=stats)
+    evaluate("hybrid RRF + lexical fast path", fast.invoke, k)
+    print(f"{'':<32} lexical-only answers={stats.lexical_only}/{stats.queries}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Compare the old unbounded per-session ConversationBufferMemory dict with the session memory store.
+
+Usage: python benchmarks/bench_session_memory.py [sessions] [turns]
+
+Replays `turns` question/answer turns for each of `sessions` sessions and
+reports retained memory, the history tokens sent with the last question, and
+the latency of cached lookups vs. rehydration from application_logs.
+"""
+import sys
+import time
+import tracemalloc
+
+from _common import setup_sandbox, report
+
+setup_sandbox()
+
+from langchain.memory import ConversationBufferMemory
+
+from db_utils import insert_application_logs_batch
+from session_memory import SessionMemoryStore
+from token_utils import estimate_tokens
+
+QUESTION = "What does the EcoHarvest onboarding guide say about soil sensors? " * 2
+ANSWER = "The guide recommends calibrating each soil sensor before the first harvest season. " * 8
+
+def history_tokens(messages) -> int:
+    return sum(estimate_tokens(message.content) for message in messages)
+
+def run_unbounded(sessions: int, turns: int):
+    session_memories = {}
+    tracemalloc.start()
+    for turn in range(turns):
+        for session in range(sessions):
+            memory = session_memories.setdefault(session, ConversationBufferMemory(
+                memory_key="chat_history", return_messages=True, output_key="answer"))
+            memory.load_memory_variables({})
+            memory.save_context({"question": f"{QUESTION}{turn}"}, {"answer": ANSWER})
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    last = session_memories[0].load_memory_variables({})["chat_history"]
+    return retained, history_tokens(last)
+
+def run_store(sessions: int, turns: int):
+    store = SessionMemoryStore(max_sessions=sessions)
+    tracemalloc.start()
+    for turn in range(turns):
+        rows = []
+        for session in range(sessions):
+            store.get_history(f"session-{session}")
+            store.save_turn(f"session-{session}", f"{QUESTION}{turn}", ANSWER)
+            rows.append((f"session-{session}", f"{QUESTION}{turn}", ANSWER, "models/gemini-1.5-pro"))
+        insert_application_logs_batch(rows)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    last = store.get_history(f"session-{sessions - 1}")
+    return store, retained, history_tokens(last)
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+
+    retained, tokens = run_unbounded(sessions, turns)
+    print(f"unbounded dict      retained={retained / 2**20:7.1f}MB  history tokens on last turn={tokens}")
+    store, retained, tokens = run_store(sessions, turns)
+    stats = store.stats(top=1)
+    print(f"session store       retained={retained / 2**20:7.1f}MB  history tokens on last turn={tokens}  "
+          f"sessions={stats['sessions']} lru_evictions={stats['lru_evictions']} rehydrations={stats['rehydrations']}")
+
+    cached = f"session-{sessions - 1}"
+    samples = []
+    for _ in range(200):
+        start = time.perf_counter()
+        store.get_history(cached)
+        samples.append(time.perf_counter() - start)
+    report("cached lookup", samples)
+    samples = []
+    for session in range(200):
+        store.clear(f"session-{session}")
+        start = time.perf_counter()
+        store.get_history(f"session-{session}")
+        samples.append(time.perf_counter() - start)
+    report("rehydrate from logs", samples)
+
+if __name__ == "__main__":
+    main()
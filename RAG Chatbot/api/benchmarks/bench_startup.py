@@ -0,0 +1,129 @@
+"""API process startup: import time of main.py and time to the first served request.
+
+Usage: python benchmarks/bench_startup.py [rounds] [api_dir]
+
+Every round runs in a fresh process and working directory, so nothing is
+cached between rounds except the OS page cache. Measures:
+  - how long `import main` takes,
+  - how long after spawning `uvicorn main:app` the first request
+    (GET /list-docs) is answered, and when /ready first returns 200.
+Also lists the slowest third-party imports made by the api modules. Pass the api
+directory of another checkout as `api_dir` to compare against it; /ready is
+reported as n/a if that checkout does not have it.
+"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from _common import API_DIR, report
+
+IMPORT_SCRIPT = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+def environment(api_dir: str) -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = api_dir
+    env.setdefault("GOOGLE_API_KEY", "benchmark-key")
+    return env
+
+def measure_import(api_dir: str) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        cwd=tempfile.mkdtemp(prefix="rag-bench-"), env=environment(api_dir),
+        capture_output=True, text=True, check=True
+    )
+    return float(output.stdout.strip().splitlines()[-1])
+
+def slowest_imports(api_dir: str, top: int = 8) -> list:
+    """(module, cumulative seconds) of the slowest modules imported directly by the api modules"""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=tempfile.mkdtemp(prefix="rag-bench-"), env=environment(api_dir),
+        capture_output=True, text=True, check=True
+    )
+    api_modules = {name[:-3] for name in os.listdir(api_dir) if name.endswith(".py")}
+    imports = []
+    # Lines are printed children first, indented two spaces per import level
+    pending = {}
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        module = name.strip()
+        children = pending.pop(depth + 1, [])
+        if module in api_modules:
+            imports.extend(child for child in children if child[0].split(".")[0] not in api_modules)
+        pending.setdefault(depth, []).append((module, int(cumulative) / 1e6))
+    return sorted(imports, key=lambda item: item[1], reverse=True)[:top]
+
+def get_status(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return 0
+
+def measure_first_request(api_dir: str, timeout: float = 120.0):
+    """Seconds from spawning uvicorn until /list-docs answers and until /ready returns 200 (None if never)"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=tempfile.mkdtemp(prefix="rag-bench-"), env=environment(api_dir),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    first_request = ready = None
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+            if first_request is None and get_status(f"{base_url}/list-docs") == 200:
+                first_request = time.perf_counter() - start
+            if first_request is not None:
+                status = get_status(f"{base_url}/ready")
+                if status == 200:
+                    ready = time.perf_counter() - start
+                if status != 503:
+                    break
+            time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+    if first_request is None:
+        raise RuntimeError("the server never answered")
+    return first_request, ready
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    api_dir = os.path.abspath(sys.argv[2]) if len(sys.argv) > 2 else API_DIR
+    print(f"Startup of {api_dir}, {rounds} rounds")
+
+    report("import main", [measure_import(api_dir) for _ in range(rounds)])
+    first_requests, ready_times = [], []
+    for _ in range(rounds):
+        first_request, ready = measure_first_request(api_dir)
+        first_requests.append(first_request)
+        if ready is not None:
+            ready_times.append(ready)
+    report("spawn -> first request", first_requests)
+    if ready_times:
+        report("spawn -> /ready", ready_times)
+    else:
+        print(f"{'spawn -> /ready':<32} n/a")
+
+    print("Slowest third-party imports:")
+    for module, seconds in slowest_imports(api_dir):
+        print(f"  {module:<40} {seconds * 1e3:8.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Per-stage latency breakdown of /chat from the tracing spans, and what tracing costs.
+
+Usage: python benchmarks/bench_tracing.py [requests] [llm_latency_seconds]
+
+Indexes the Sample docs with fake embeddings (20ms per request) and asks
+/chat a series of follow-up questions through the ASGI app, with the stubbed
+LLM (50ms by default) and embeddings behind the real rate-limited wrappers,
+and the answer cache disabled.
+Each request asks for its timings, and the per-stage latencies are reported
+from them; /metrics is then checked to hold one observation per request.
+Finally the cost of a span and of rendering /metrics is measured on its own.
+"""
+import asyncio
+import glob
+import os
+import sys
+import time
+
+from _common import API_DIR, setup_sandbox, report
+
+REPO_DIR = os.path.dirname(os.path.dirname(API_DIR))
+SAMPLE_DOCS = os.path.join(REPO_DIR, "Sample docs")
+
+setup_sandbox()
+os.environ["CHAT_RATE_LIMIT_RPS"] = "1000000"
+os.environ["CHAT_RATE_LIMIT_BURST"] = "1000000"
+os.environ["TRACE_LOGGING"] = "false"
+# Every request should go through retrieval and generation
+os.environ["ANSWER_CACHE_MAX_ENTRIES"] = "0"
+
+import httpx
+
+import chroma_utils
+from db_utils import insert_document_record
+from embedding_cache import CachedEmbeddings
+from fakes import FakeChatModel, FakeEmbeddings
+from langchain_utils import chain_registry
+from main import app
+from telemetry import registry, request_duration, span, trace
+from upstream import RateLimitedChatModel, RateLimitedEmbeddings
+
+QUESTIONS = [
+    "Where is GreenGrow headquartered?",
+    "Who founded it?",
+    "What does the EcoHarvest System do?",
+    "How much water does it save?",
+    "Which company works on quantum computing?",
+    "Where is that company based?",
+]
+
+def span_cost(iterations: int = 100000) -> float:
+    """Seconds per nested span inside a trace, net of the loop itself"""
+    with trace("bench"):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            with span("outer"):
+                with span("inner"):
+                    pass
+        traced = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(iterations):
+        pass
+    return (traced - (time.perf_counter() - start)) / (2 * iterations)
+
+async def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    llm_latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    chroma_utils.set_embedding_function(CachedEmbeddings(
+        RateLimitedEmbeddings(FakeEmbeddings(latency=0.02, per_text_latency=0.0)),
+        chroma_utils.get_embedding_cache(), model_name="bench"
+    ))
+    chain_registry.llm_factory = lambda model_name: RateLimitedChatModel(model=FakeChatModel(latency=llm_latency))
+    for path in sorted(glob.glob(os.path.join(SAMPLE_DOCS, "*"))):
+        if chroma_utils.index_document_to_chroma(path, insert_document_record(os.path.basename(path))) is None:
+            raise RuntimeError(f"Failed to index {path}")
+
+    stages = {}
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for number in range(requests):
+            start = time.perf_counter()
+            response = await client.post("/chat", json={
+                "question": QUESTIONS[number % len(QUESTIONS)],
+                # A new session every few questions, so some turns need no condensing
+                "session_id": f"session-{number // len(QUESTIONS)}",
+                "include_timings": True
+            })
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+            for stage, seconds in response.json()["timings"].items():
+                stages.setdefault(stage, []).append(seconds)
+        metrics = (await client.get("/metrics")).text
+
+    print(f"/chat, {requests} requests, LLM {llm_latency * 1e3:.0f}ms, embeddings 20ms per request")
+    report("request", latencies)
+    for stage in sorted(stages, key=lambda name: -sum(stages[name])):
+        report(f"  {stage}", stages[stage])
+        if len(stages[stage]) < requests:
+            print(f"{'':<32} (in {len(stages[stage])} of {requests} requests)")
+    observed = request_duration.count(operation="chat", status="ok")
+    if observed != requests:
+        raise RuntimeError(f"/metrics counted {observed} chat requests, expected {requests}")
+    print(f"/metrics: {len(metrics.splitlines())} lines, {observed} chat requests observed")
+
+    per_span = span_cost()
+    spans_per_request = sum(len(samples) for samples in stages.values()) / requests
+    print(f"span overhead: {per_span * 1e6:.2f}us per span, {spans_per_request:.1f} spans per request "
+          f"= {per_span * spans_per_request * 1e6:.1f}us per request")
+    start = time.perf_counter()
+    for _ in range(100):
+        registry.render()
+    print(f"rendering /metrics: {(time.perf_counter() - start) * 10:.2f}ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""Compare peak memory of buffered and streamed document uploads.
+
+Usage: python benchmarks/bench_upload_memory.py [file_mb] [concurrent_uploads]
+
+Runs the API on a local uvicorn server and uploads a synthetic file with
+several concurrent clients, tracking peak Python heap usage (tracemalloc)
+across client and server. Ingestion is stubbed out so only the upload path
+is measured.
+"""
+import os
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import setup_sandbox, serve_in_thread
+
+setup_sandbox()
+FILE_MB = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+CONCURRENT = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+os.environ["MAX_UPLOAD_MB"] = str(FILE_MB * 2)
+
+import tracemalloc
+
+import requests
+from fastapi import File, UploadFile
+
+import main
+from main import app, UPLOAD_DIR
+
+main.ingestion_queue.submit = lambda filename, file_path: os.remove(file_path) or "benchmark"
+
+@app.post("/legacy-upload-doc")
+async def legacy_upload(file: UploadFile = File(...)):
+    """The original handler: read the whole upload, then write it in one go"""
+    # Unlike the original, use a unique name so concurrent uploads don't collide
+    file_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}_{file.filename}")
+    with open(file_path, "wb") as buffer:
+        content = await file.read()
+        buffer.write(content)
+    os.remove(file_path)
+    return {"job_id": "benchmark"}
+
+def upload_buffered(base_url, path, route):
+    # The original client: the whole file as one multipart body
+    with open(path, "rb") as f:
+        files = {"file": (os.path.basename(path), f.read(), "application/octet-stream")}
+    return requests.post(f"{base_url}{route}", files=files).status_code
+
+def upload_streamed(base_url, path):
+    def chunks():
+        with open(path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                yield chunk
+    return requests.post(
+        f"{base_url}/upload-doc-stream",
+        params={"filename": os.path.basename(path)},
+        data=chunks(),
+        headers={"Content-Type": "application/octet-stream"}
+    ).status_code
+
+def measure(label, func):
+    tracemalloc.start()
+    with ThreadPoolExecutor(max_workers=CONCURRENT) as pool:
+        statuses = list(pool.map(lambda _: func(), range(CONCURRENT)))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<40} statuses={sorted(set(statuses))} peak heap={peak / 1024 / 1024:8.1f}MB")
+
+def main_():
+    path = "synthetic.pdf"
+    with open(path, "wb") as f:
+        for _ in range(FILE_MB):
+            f.write(os.urandom(1024 * 1024))
+    base_url = serve_in_thread(app)
+    print(f"{CONCURRENT} concurrent uploads of a {FILE_MB}MB file")
+    measure("legacy client + legacy endpoint", lambda: upload_buffered(base_url, path, "/legacy-upload-doc"))
+    measure("legacy client + chunked /upload-doc", lambda: upload_buffered(base_url, path, "/upload-doc"))
+    measure("streaming client + /upload-doc-stream", lambda: upload_streamed(base_url, path))
+
+    os.environ["MAX_UPLOAD_MB"] = "1"
+    main.MAX_FILE_SIZE = 1024 * 1024
+    print(f"over-limit streamed upload -> HTTP {upload_streamed(base_url, path)}")
+
+if __name__ == "__main__":
+    main_()
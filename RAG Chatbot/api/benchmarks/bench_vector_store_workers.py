@@ -0,0 +1,133 @@
+"""Vector store query throughput by worker process count, embedded vs. Chroma server mode.
+
+Usage: python benchmarks/bench_vector_store_workers.py [chunks] [seconds_per_run]
+
+Indexes `chunks` fake-embedded chunks into an embedded store and into a
+local Chroma server (started with the `chroma run` CLI), then runs 1, 2, 4
+and 8 worker processes that each open the store the way the API does and
+query it for a fixed time. Reports aggregate queries/s and per-worker open
+time. Finally four processes write concurrently under the vector store write
+lock and the chunk count is checked.
+"""
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from _common import setup_sandbox
+
+WORKDIR = setup_sandbox()
+
+import numpy as np
+
+from vector_store import CHROMA_COLLECTION, create_chroma_client, create_write_lock
+
+DIMENSIONS = 768
+WORKER_COUNTS = (1, 2, 4, 8)
+WRITERS = 4
+WRITES_PER_WRITER = 200
+
+def vectors(count: int, seed: int) -> list:
+    matrix = np.random.default_rng(seed).standard_normal((count, DIMENSIONS)).astype(np.float32)
+    return (matrix / np.linalg.norm(matrix, axis=1, keepdims=True)).tolist()
+
+def open_collection(mode: str, persist_directory: str, port: int):
+    client = create_chroma_client(mode, persist_directory=persist_directory, host="localhost", port=port)
+    return client.get_or_create_collection(CHROMA_COLLECTION)
+
+def index(collection, chunks: int, offset: int = 0, batch_size: int = 1000):
+    for start in range(0, chunks, batch_size):
+        count = min(batch_size, chunks - start)
+        collection.upsert(
+            ids=[f"{offset + start + i}" for i in range(count)],
+            embeddings=vectors(count, offset + start),
+            documents=[f"chunk {offset + start + i}" for i in range(count)],
+            metadatas=[{"file_id": (offset + start + i) // 50} for i in range(count)]
+        )
+
+def query_worker(mode: str, persist_directory: str, port: int, seconds: float, seed: int, barrier, results):
+    start = time.perf_counter()
+    collection = open_collection(mode, persist_directory, port)
+    queries = vectors(64, 10_000 + seed)
+    collection.query(query_embeddings=[queries[0]], n_results=4)
+    opened = time.perf_counter() - start
+    # Every worker queries during the same window
+    barrier.wait()
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        collection.query(query_embeddings=[queries[done % len(queries)]], n_results=4)
+        done += 1
+    results.put((done, opened))
+
+def write_worker(mode: str, persist_directory: str, port: int, writer: int):
+    collection = open_collection(mode, persist_directory, port)
+    write_lock = create_write_lock(mode, persist_directory)
+    offset = 1_000_000 + writer * WRITES_PER_WRITER
+    for start in range(0, WRITES_PER_WRITER, 25):
+        with write_lock:
+            index(collection, 25, offset + start)
+
+def start_server(path: str) -> tuple:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen(["chroma", "run", "--path", path, "--port", str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while True:
+        try:
+            create_chroma_client("server", port=port).heartbeat()
+            return server, port
+        except Exception:
+            if time.time() > deadline:
+                server.kill()
+                raise
+            time.sleep(0.2)
+
+def main():
+    chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    context = multiprocessing.get_context("spawn")
+    persist_directory = os.path.join(WORKDIR, "chroma_db")
+    server, port = start_server(os.path.join(WORKDIR, "chroma_server"))
+    print(f"{os.cpu_count()} CPU(s); {chunks} chunks; {seconds:.0f}s per run")
+    try:
+        for mode in ("embedded", "server"):
+            index(open_collection(mode, persist_directory, port), chunks)
+        for mode in ("embedded", "server"):
+            for workers in WORKER_COUNTS:
+                results = context.Queue()
+                barrier = context.Barrier(workers)
+                processes = [
+                    context.Process(target=query_worker,
+                                    args=(mode, persist_directory, port, seconds, i, barrier, results))
+                    for i in range(workers)
+                ]
+                for process in processes:
+                    process.start()
+                counts = [results.get() for _ in processes]
+                for process in processes:
+                    process.join()
+                total = sum(done for done, _ in counts)
+                print(f"{mode:<9} workers={workers:<2} {total / seconds:8.1f} queries/s  "
+                      f"open+first query={max(opened for _, opened in counts) * 1000:7.1f}ms (slowest worker)")
+        for mode in ("embedded", "server"):
+            processes = [context.Process(target=write_worker, args=(mode, persist_directory, port, i))
+                         for i in range(WRITERS)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            count = open_collection(mode, persist_directory, port).count()
+            expected = chunks + WRITERS * WRITES_PER_WRITER
+            print(f"{mode:<9} {WRITERS} concurrent writers: {count} chunks (expected {expected}) "
+                  f"{'ok' if count == expected and all(p.exitcode == 0 for p in processes) else 'MISMATCH'}")
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Local stand-in for the Gemini REST API that enforces per-minute quotas.
+
+Serves generateContent, streamGenerateContent, embedContent and
+batchEmbedContents with canned output, and answers HTTP 429
+RESOURCE_EXHAUSTED like the real API once a model's requests-per-minute or
+tokens-per-minute quota is used up. The real GoogleGenerativeAIEmbeddings
+client can be pointed at it with `gemini_embeddings(url)`; chat calls go
+through `FakeGeminiChatModel`, since the Gemini chat client only supports
+gRPC for async calls.
+
+Run on its own with: python benchmarks/fake_gemini.py [--port 8765] [--rpm 60] [--tpm 0]
+GET /stats returns per-model counts of served and rejected requests.
+"""
+import argparse
+import asyncio
+import hashlib
+import threading
+import time
+
+import httpx
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from google.api_core import exceptions as google_exceptions
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+ANSWER = "This is a canned answer from the fake Gemini server."
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+class Quota:
+    """Requests and tokens per minute for one model, refilled continuously"""
+
+    def __init__(self, rpm: float, tpm: float = 0, burst_seconds: float = 60):
+        self.limits = {name: (limit / 60 * burst_seconds, limit / 60)
+                       for name, limit in (("requests", rpm), ("tokens", tpm)) if limit > 0}
+        self.levels = {name: capacity for name, (capacity, _) in self.limits.items()}
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, tokens: int) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            for name, (capacity, rate) in self.limits.items():
+                self.levels[name] = min(capacity, self.levels[name] + (now - self.updated) * rate)
+            self.updated = now
+            costs = {"requests": 1, "tokens": tokens}
+            if any(self.levels[name] < min(costs[name], capacity) for name, (capacity, _) in self.limits.items()):
+                return False
+            for name in self.limits:
+                self.levels[name] -= costs[name]
+            return True
+
+def _texts(body: dict) -> list:
+    """Text parts of a generate request's contents or an embed request"""
+    if "requests" in body:
+        return [part.get("text", "") for request in body["requests"] for part in request["content"]["parts"]]
+    if "content" in body:
+        return [part.get("text", "") for part in body["content"]["parts"]]
+    return [part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", [])]
+
+def _vector(text: str, dimensions: int) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+def create_app(rpm: float = 60, tpm: float = 0, latency: float = 0.05, answer: str = ANSWER,
+               dimensions: int = 768, burst_seconds: float = 60) -> FastAPI:
+    app = FastAPI()
+    quotas = {}
+    counts = {}
+
+    def candidate(text: str) -> dict:
+        return {"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}
+
+    @app.post("/{version}/models/{model}:{method}")
+    async def call(version: str, model: str, method: str, request: Request):
+        body = await request.json()
+        texts = _texts(body)
+        tokens = sum(_tokens(text) for text in texts)
+        model_counts = counts.setdefault(model, {"served": 0, "rejected": 0})
+        quota = quotas.setdefault(model, Quota(rpm, tpm, burst_seconds))
+        if not quota.take(tokens):
+            model_counts["rejected"] += 1
+            return JSONResponse(status_code=429, content={"error": {
+                "code": 429, "message": "Resource has been exhausted (e.g. check quota).", "status": "RESOURCE_EXHAUSTED"
+            }})
+        model_counts["served"] += 1
+        await asyncio.sleep(latency)
+        usage = {"promptTokenCount": tokens, "candidatesTokenCount": _tokens(answer),
+                 "totalTokenCount": tokens + _tokens(answer)}
+        if method == "generateContent":
+            return {"candidates": [candidate(answer)], "usageMetadata": usage}
+        if method == "streamGenerateContent":
+            words = answer.split(" ")
+            return [{"candidates": [candidate(word if index == 0 else " " + word)]} for index, word in enumerate(words)]
+        if method == "embedContent":
+            return {"embedding": {"values": _vector(texts[0], dimensions)}}
+        if method == "batchEmbedContents":
+            return {"embeddings": [{"values": _vector(text, dimensions)} for text in texts]}
+        return JSONResponse(status_code=404, content={"error": {"code": 404, "message": method, "status": "NOT_FOUND"}})
+
+    @app.get("/stats")
+    def stats():
+        return counts
+
+    @app.post("/reset")
+    def reset():
+        quotas.clear()
+        counts.clear()
+        return counts
+
+    return app
+
+def gemini_embeddings(url: str, model: str = "models/embedding-001"):
+    """The real Gemini embeddings client, talking REST to the fake server at `url`"""
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    return GoogleGenerativeAIEmbeddings(
+        model=model, google_api_key="fake-key", transport="rest", client_options={"api_endpoint": url}
+    )
+
+class FakeGeminiChatModel(BaseChatModel):
+    """Minimal chat client for the fake server's generateContent endpoint.
+
+    A 429 response raises google.api_core's ResourceExhausted, like the real client.
+    """
+
+    url: str
+    model: str = "models/gemini-1.5-pro"
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini-http"
+
+    def _request(self, messages) -> tuple:
+        body = {"contents": [{"role": "user", "parts": [{"text": str(message.content)}]} for message in messages]}
+        return f"{self.url}/v1beta/{self.model}:generateContent", body
+
+    def _result(self, response: httpx.Response) -> ChatResult:
+        if response.status_code != 200:
+            raise google_exceptions.from_http_status(response.status_code, response.json()["error"]["message"])
+        text = response.json()["candidates"][0]["content"]["parts"][0]["text"]
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls += 1
+        url, body = self._request(messages)
+        # Plain HTTP to localhost; skipping certificate loading keeps client setup off the event loop's back
+        return self._result(httpx.post(url, json=body, timeout=30, verify=False))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls += 1
+        url, body = self._request(messages)
+        async with httpx.AsyncClient(timeout=30, verify=False) as client:
+            return self._result(await client.post(url, json=body))
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rpm", type=float, default=60)
+    parser.add_argument("--tpm", type=float, default=0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.rpm, args.tpm, args.latency), host="127.0.0.1", port=args.port)
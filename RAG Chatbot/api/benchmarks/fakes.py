@@ -0,0 +1,143 @@
+"""Deterministic local stand-ins for the Gemini chat model, embeddings and the retriever.
+
+They let benchmarks exercise the real chain, endpoints and database code
+without network access or API quota. Latency is simulated with sleeps so
+concurrency behaviour stays realistic.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from typing import List
+
+import numpy as np
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.retrievers import BaseRetriever
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers after a fixed delay with a canned, deterministic reply.
+
+    `latency` is the time to the first token; streamed tokens then arrive
+    every `token_latency` seconds.
+    """
+
+    latency: float = 0.05
+    token_latency: float = 0.005
+    answer: str = "This is a canned answer from the fake Gemini model."
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    def _total_latency(self) -> float:
+        # A blocking call costs as much as streaming every token
+        return self.latency + self.token_latency * (len(self.answer.split(" ")) - 1)
+
+    def _result(self) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls += 1
+        time.sleep(self._total_latency())
+        return self._result()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls += 1
+        await asyncio.sleep(self._total_latency())
+        return self._result()
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        for index, word in enumerate(self.answer.split(" ")):
+            if index:
+                await asyncio.sleep(self.token_latency)
+            token = word if index == 0 else " " + word
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+class StaticRetriever(BaseRetriever):
+    """Retriever that returns the same documents for every query"""
+
+    documents: List[Document] = [
+        Document(page_content="GreenGrow Innovations builds the EcoHarvest farming system.", metadata={"file_id": 0}),
+    ]
+
+    def _get_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        return list(self.documents)
+
+class RateLimitError(Exception):
+    """Mimics the 429 error the Gemini API returns when the quota is exhausted"""
+
+    code = 429
+
+class FakeEmbeddings(Embeddings):
+    """Embedding backend with deterministic vectors and simulated API latency.
+
+    Like GoogleGenerativeAIEmbeddings, documents are sent in requests of at
+    most `max_batch` texts. Each request costs `latency` plus `per_text_latency`
+    per text. Every `rate_limit_every`-th request fails with a 429 error.
+    """
+
+    def __init__(
+        self,
+        dimensions: int = 768,
+        latency: float = 0.05,
+        per_text_latency: float = 0.001,
+        max_batch: int = 100,
+        rate_limit_every: int = 0
+    ):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.max_batch = max_batch
+        self.rate_limit_every = rate_limit_every
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimensions)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.requests += 1
+            request_number = self.requests
+        time.sleep(self.latency + self.per_text_latency * len(texts))
+        if self.rate_limit_every and request_number % self.rate_limit_every == 0:
+            raise RateLimitError("429 Resource has been exhausted (e.g. check quota).")
+        return [self._vector(text) for text in texts]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for i in range(0, len(texts), self.max_batch):
+            vectors.extend(self._request(texts[i:i + self.max_batch]))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._request([text])[0]
+
+class BagOfWordsEmbeddings(FakeEmbeddings):
+    """FakeEmbeddings whose vectors depend only on the set of lowercase words.
+
+    Rephrasings that differ in case, punctuation or word order embed
+    identically, and texts sharing most of their words are close, which is
+    enough to exercise similarity-based lookups.
+    """
+
+    def _vector(self, text: str) -> List[float]:
+        words = set("".join(c if c.isalnum() else " " for c in text.lower()).split())
+        vector = np.zeros(self.dimensions)
+        for word in words:
+            vector += np.asarray(super()._vector(word))
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
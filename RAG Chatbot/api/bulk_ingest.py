@@ -0,0 +1,358 @@
+"""Bulk ingestion of many files or whole directories; run `python bulk_ingest.py PATH [PATH ...]` from the api directory"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from chroma_utils import (
+    SUPPORTED_FORMATS, apply_chunk_plan, chunk_metadatas, delete_doc_from_chroma, file_content_hash,
+    get_embedding_function, get_lexical_index, get_text_splitter, get_vectorstore, get_write_lock,
+    index_document_to_chroma, load_document, plan_chunks, validate_file
+)
+from db_utils import (
+    bump_corpus_version, delete_document_record, get_latest_document_by_filename,
+    insert_document_record, replace_document_chunks, update_document_ingestion
+)
+from ingestion_utils import EmbeddingPipeline
+from pydantic_models import IngestionResult
+from rate_limiter import BACKGROUND_PRIORITY, rate_limit_priority
+
+# Worker processes that load and split files; 0 parses in the calling process.
+# The default leaves one CPU for the embedding and write loop
+BULK_PARSE_WORKERS = int(os.getenv("BULK_PARSE_WORKERS", str((os.cpu_count() or 1) - 1)))
+# Chunks collected from parsed files before they are embedded and written together
+BULK_WRITE_CHUNKS = int(os.getenv("BULK_WRITE_CHUNKS", "256"))
+# Files larger than this are streamed through index_document_to_chroma one at
+# a time instead of being parsed whole in a worker and sent back
+BULK_STREAMING_MB = int(os.getenv("BULK_STREAMING_MB", "5"))
+
+@dataclass
+class ParsedFile:
+    """The chunks of one file and what loading and splitting it cost"""
+    texts: List[str]
+    metadatas: List[dict]
+    pages: int
+    characters: int
+    load_seconds: float
+    split_seconds: float
+
+def parse_file(file_path: str) -> ParsedFile:
+    """Load and split one file; runs in a worker process"""
+    start = time.perf_counter()
+    documents = load_document(file_path)
+    loaded = time.perf_counter()
+    splits = get_text_splitter().split_documents(documents)
+    return ParsedFile(
+        texts=[split.page_content for split in splits],
+        metadatas=[split.metadata for split in splits],
+        pages=len(documents),
+        characters=sum(len(document.page_content) for document in documents),
+        load_seconds=loaded - start,
+        split_seconds=time.perf_counter() - loaded
+    )
+
+@dataclass
+class FileOutcome:
+    """Progress of one file: `indexing` once it has a document id, then indexed, skipped or failed"""
+    filename: str
+    file_path: str
+    status: str
+    document_id: Optional[int] = None
+    result: Optional[IngestionResult] = None
+    error: Optional[str] = None
+
+@dataclass
+class BulkIngestionReport:
+    """Counts and timings for one bulk ingestion run"""
+    files: int = 0
+    indexed: int = 0
+    skipped: int = 0
+    failed: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+    # Summed over files; parsing runs in parallel, so stages can add up to more than `seconds`
+    stage_seconds: Dict[str, float] = field(
+        default_factory=lambda: {"hash": 0.0, "load": 0.0, "split": 0.0, "embed": 0.0, "write": 0.0}
+    )
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.seconds if self.seconds else 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        stages = ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in self.stage_seconds.items())
+        return (
+            f"{self.files} files ({self.indexed} indexed, {self.skipped} already indexed, {self.failed} failed), "
+            f"{self.chunks} chunks in {self.seconds:.2f}s - "
+            f"{self.files_per_second:.1f} files/s, {self.chunks_per_second:.1f} chunks/s - Stages: {stages}"
+        )
+
+def collect_files(paths: List[str]) -> List[Tuple[str, str]]:
+    """Expand directories (recursively) into the supported files they contain, as (document name, path).
+
+    Files found in a directory are named by their path relative to it, e.g.
+    `a/report.docx`, so files sharing a name in different subdirectories
+    stay separate documents; files given directly are named by their basename.
+    """
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append((os.path.basename(path), path))
+            continue
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            files.extend(
+                (os.path.relpath(os.path.join(root, name), path).replace(os.sep, "/"), os.path.join(root, name))
+                for name in sorted(names)
+                if os.path.splitext(name)[1].lower() in SUPPORTED_FORMATS
+            )
+    return files
+
+@dataclass
+class _PendingFile:
+    filename: str
+    file_path: str
+    document_id: int
+    parsed: ParsedFile
+
+def _write_batch(batch: List[_PendingFile], report: BulkIngestionReport, finish: Callable[[FileOutcome], None]):
+    """Embed and write the chunks of several parsed files in one pipeline run"""
+    ids, texts, metadatas = [], [], []
+    plans = []
+    for pending in batch:
+        plan = plan_chunks(pending.document_id, pending.parsed.texts)
+        plans.append(plan)
+        ids.extend(plan.ids)
+        texts.extend(pending.parsed.texts)
+        metadatas.extend(chunk_metadatas(pending.document_id, pending.parsed.metadatas))
+
+    pipeline = EmbeddingPipeline(get_embedding_function(), get_vectorstore()._collection, write_lock=get_write_lock())
+    try:
+        # Bulk loads wait behind chat requests for embedding quota
+        with rate_limit_priority(BACKGROUND_PRIORITY):
+            stats = pipeline.run(ids, texts, metadatas)
+        get_lexical_index().add(ids, texts, metadatas)
+    except Exception as e:
+        for pending in batch:
+            # Remove any partially written chunks and the database record
+            delete_doc_from_chroma(pending.document_id)
+            delete_document_record(pending.document_id)
+            finish(FileOutcome(pending.filename, pending.file_path, "failed", error=str(e)))
+        return
+
+    report.stage_seconds["embed"] += stats.embed_seconds
+    report.stage_seconds["write"] += stats.write_seconds
+    for pending, plan in zip(batch, plans):
+        replace_document_chunks(pending.document_id, list(zip(plan.ids, plan.hashes)))
+        parsed = pending.parsed
+        # Each file is charged its share of the batch's embedding and write time
+        share = len(parsed.texts) / len(ids)
+        result = IngestionResult(
+            chunks=len(parsed.texts),
+            characters=parsed.characters,
+            pages=parsed.pages,
+            timings={
+                "load": parsed.load_seconds,
+                "split": parsed.split_seconds,
+                "embed": stats.embed_seconds * share,
+                "write": stats.write_seconds * share
+            }
+        )
+        update_document_ingestion(pending.document_id, result)
+        report.chunks += result.chunks
+        finish(FileOutcome(pending.filename, pending.file_path, "indexed", pending.document_id, result))
+
+def _update_document(document_id: int, filename: str, file_path: str, content_hash: str, parsed: ParsedFile,
+                     report: BulkIngestionReport, finish: Callable[[FileOutcome], None]):
+    """Re-index a new version of an indexed document, embedding only its changed chunks"""
+    metadatas = chunk_metadatas(document_id, parsed.metadatas)
+    try:
+        plan = plan_chunks(document_id, parsed.texts)
+        stats = apply_chunk_plan(document_id, plan, parsed.texts, metadatas)
+    except Exception as e:
+        # The previous version stays indexed
+        finish(FileOutcome(filename, file_path, "failed", document_id, error=str(e)))
+        return
+    report.stage_seconds["embed"] += stats.embed_seconds
+    report.stage_seconds["write"] += stats.write_seconds
+    result = IngestionResult(
+        chunks=len(parsed.texts),
+        characters=parsed.characters,
+        pages=parsed.pages,
+        timings={
+            "load": parsed.load_seconds,
+            "split": parsed.split_seconds,
+            "embed": stats.embed_seconds,
+            "write": stats.write_seconds
+        },
+        reused_chunks=len(plan.kept),
+        removed_chunks=len(plan.removed)
+    )
+    update_document_ingestion(document_id, result, content_hash)
+    report.chunks += result.chunks
+    finish(FileOutcome(filename, file_path, "indexed", document_id, result))
+
+def _index_streaming(filename: str, file_path: str, content_hash: str,
+                     report: BulkIngestionReport, finish: Callable[[FileOutcome], None]):
+    """Index one large file on its own, loading and embedding it page by page"""
+    existing = get_latest_document_by_filename(filename)
+    updating = existing is not None and existing["chunk_count"] is not None
+    document_id = existing["id"] if updating else insert_document_record(filename, content_hash)
+    finish(FileOutcome(filename, file_path, "indexing", document_id))
+    result = index_document_to_chroma(file_path, document_id)
+    if result is None:
+        if not updating:
+            # Remove any partially written chunks and the database record
+            delete_doc_from_chroma(document_id)
+            delete_document_record(document_id)
+        finish(FileOutcome(filename, file_path, "failed", document_id, error=f"Failed to index {filename}"))
+        return
+    for stage, seconds in result.timings.items():
+        report.stage_seconds[stage] += seconds
+    update_document_ingestion(document_id, result, content_hash)
+    report.chunks += result.chunks
+    finish(FileOutcome(filename, file_path, "indexed", document_id, result))
+
+def bulk_ingest(
+    files: List[Tuple[str, str]],
+    workers: int = BULK_PARSE_WORKERS,
+    write_chunks: int = BULK_WRITE_CHUNKS,
+    on_file: Optional[Callable[[FileOutcome], None]] = None
+) -> BulkIngestionReport:
+    """Index (filename, file path) pairs, parsing them in a pool of `workers` processes.
+
+    Files already indexed under the same name with the same content are
+    skipped, and files named like an indexed document update it in place.
+    Files over BULK_STREAMING_MB are indexed one at a time after the others.
+    `on_file(outcome)` is told when a file gets its document id and when it
+    is indexed, skipped or has failed. A failing file never stops the run.
+    A file with new content named like an earlier file of the same run
+    fails, since both would update the same document.
+    """
+    report = BulkIngestionReport(files=len(files))
+    start = time.perf_counter()
+
+    def finish(outcome: FileOutcome):
+        if outcome.status in ("indexed", "skipped", "failed"):
+            setattr(report, outcome.status, getattr(report, outcome.status) + 1)
+        if on_file:
+            on_file(outcome)
+
+    # Hash everything first, so duplicates are never parsed. As for single uploads,
+    # a file is a duplicate when its name and content both match
+    to_parse = []
+    to_stream = []
+    seen = set()
+    names = set()
+    for filename, file_path in files:
+        is_valid, error_message = validate_file(file_path)
+        if not is_valid:
+            finish(FileOutcome(filename, file_path, "failed", error=error_message))
+            continue
+        hash_start = time.perf_counter()
+        content_hash = file_content_hash(file_path)
+        report.stage_seconds["hash"] += time.perf_counter() - hash_start
+        if (filename, content_hash) in seen:
+            finish(FileOutcome(filename, file_path, "skipped"))
+            continue
+        seen.add((filename, content_hash))
+        existing = get_latest_document_by_filename(filename)
+        if existing is not None and existing["chunk_count"] is not None and existing["content_hash"] == content_hash:
+            finish(FileOutcome(filename, file_path, "skipped", document_id=existing["id"]))
+            continue
+        if filename in names:
+            finish(FileOutcome(filename, file_path, "failed", error=f"Duplicate document name in this batch: {filename}"))
+            continue
+        names.add(filename)
+        if os.path.getsize(file_path) > BULK_STREAMING_MB * 1024 * 1024:
+            to_stream.append((filename, file_path, content_hash))
+        else:
+            to_parse.append((filename, file_path, content_hash))
+
+    batch = []
+    batch_chunks = 0
+
+    def add_parsed(filename: str, file_path: str, content_hash: str, parsed: ParsedFile):
+        nonlocal batch, batch_chunks
+        report.stage_seconds["load"] += parsed.load_seconds
+        report.stage_seconds["split"] += parsed.split_seconds
+        if not parsed.texts:
+            finish(FileOutcome(filename, file_path, "failed", error=f"No content extracted from {filename}"))
+            return
+        existing = get_latest_document_by_filename(filename)
+        if existing is not None and existing["chunk_count"] is not None:
+            finish(FileOutcome(filename, file_path, "indexing", existing["id"]))
+            _update_document(existing["id"], filename, file_path, content_hash, parsed, report, finish)
+            return
+        document_id = insert_document_record(filename, content_hash)
+        finish(FileOutcome(filename, file_path, "indexing", document_id))
+        batch.append(_PendingFile(filename, file_path, document_id, parsed))
+        batch_chunks += len(parsed.texts)
+        if batch_chunks >= write_chunks:
+            _write_batch(batch, report, finish)
+            batch, batch_chunks = [], 0
+
+    if workers <= 0:
+        for filename, file_path, content_hash in to_parse:
+            try:
+                parsed = parse_file(file_path)
+            except Exception as e:
+                finish(FileOutcome(filename, file_path, "failed", error=str(e)))
+                continue
+            add_parsed(filename, file_path, content_hash, parsed)
+    elif to_parse:
+        # Spawned workers do not inherit the caller's threads and open clients
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(to_parse)), mp_context=context) as executor:
+            futures = {
+                executor.submit(parse_file, os.path.abspath(file_path)): (filename, file_path, content_hash)
+                for filename, file_path, content_hash in to_parse
+            }
+            # Batches are embedded and written while the remaining files are still being parsed
+            for future in as_completed(futures):
+                filename, file_path, content_hash = futures[future]
+                try:
+                    parsed = future.result()
+                except Exception as e:
+                    finish(FileOutcome(filename, file_path, "failed", error=str(e)))
+                    continue
+                add_parsed(filename, file_path, content_hash, parsed)
+    if batch:
+        _write_batch(batch, report, finish)
+    for filename, file_path, content_hash in to_stream:
+        _index_streaming(filename, file_path, content_hash, report, finish)
+
+    if to_parse:
+        bump_corpus_version()
+    report.seconds = time.perf_counter() - start
+    return report
+
+def _print_outcome(outcome: FileOutcome):
+    if outcome.status == "indexed":
+        print(f"Indexed {outcome.filename}: {outcome.result.chunks} chunks (document {outcome.document_id})")
+    elif outcome.status == "skipped":
+        print(f"Skipped {outcome.filename}: already indexed")
+    elif outcome.status == "failed":
+        print(f"Failed {outcome.filename}: {outcome.error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Index files and directories into the RAG Chatbot vector store")
+    parser.add_argument("paths", nargs="+", help="files or directories to index")
+    parser.add_argument("--workers", type=int, default=BULK_PARSE_WORKERS,
+                        help="processes that load and split files (0 parses in this process)")
+    args = parser.parse_args()
+
+    files = collect_files(args.paths)
+    print(f"Found {len(files)} files")
+    report = bulk_ingest(files, workers=args.workers, on_file=_print_outcome)
+    print(report.summary())
+
+if __name__ == "__main__":
+    main()
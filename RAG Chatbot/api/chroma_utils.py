@@ -4,40 +4,122 @@ import os
 # Load environment variables from .env file
 load_dotenv()
 
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, UnstructuredHTMLLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_chroma import Chroma
-from typing import List, Tuple
+import hashlib
+import importlib
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional, Tuple
 from langchain_core.documents import Document
+from pydantic_models import IngestionResult
+import time
+from ingestion_utils import EmbeddingPipeline, IngestionStats
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+from rate_limiter import BACKGROUND_PRIORITY, rate_limit_priority
+from db_utils import bump_corpus_version, get_document_chunks, replace_document_chunks
+from lexical_index import LexicalIndex
+from vector_store import create_vectorstore, create_write_lock
 
-# Define supported file types and their loaders
+# Define supported file types and their loaders as (module, class); loaders
+# are imported on first use so the API starts without their dependencies
 SUPPORTED_FORMATS = {
-    '.pdf': PyPDFLoader,
-    '.docx': Docx2txtLoader,
-    '.html': UnstructuredHTMLLoader,
+    '.pdf': ("langchain_community.document_loaders", "PyPDFLoader"),
+    '.docx': ("langchain_community.document_loaders", "Docx2txtLoader"),
+    '.html': ("langchain_community.document_loaders", "UnstructuredHTMLLoader"),
 }
 
-# Create vectorstore instance
-embedding_function = GoogleGenerativeAIEmbeddings(
-    model="models/embedding-001",
-    google_api_key=os.getenv("GOOGLE_API_KEY")
-)
+EMBEDDING_MODEL = "models/embedding-001"
 
-vectorstore = Chroma(
-    persist_directory="./chroma_db",
-    embedding_function=embedding_function
-)
+# Largest accepted document; uploads are cut off as soon as they exceed it
+MAX_FILE_SIZE = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
 
-# Text splitter configuration
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=200
-)
+# Clients, indexes and the vectorstore are created on first use by the
+# accessors below, so importing this module stays cheap
+_instances = {}
+_instances_lock = threading.RLock()
+
+def _get_or_create(name: str, factory):
+    value = _instances.get(name)
+    if value is None:
+        with _instances_lock:
+            value = _instances.get(name)
+            if value is None:
+                value = _instances[name] = factory()
+    return value
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Get the persistent embedding cache"""
+    return _get_or_create("embedding_cache", EmbeddingCache)
+
+def _create_embedding_function():
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    from upstream import RateLimitedEmbeddings
+    # Embeddings go through the persistent cache so unchanged chunks and
+    # repeated queries are never embedded twice, and cache misses through
+    # the shared Gemini rate limiter
+    return CachedEmbeddings(
+        RateLimitedEmbeddings(GoogleGenerativeAIEmbeddings(
+            model=EMBEDDING_MODEL,
+            google_api_key=os.getenv("GOOGLE_API_KEY")
+        )),
+        get_embedding_cache(),
+        model_name=EMBEDDING_MODEL
+    )
+
+def get_embedding_function():
+    """Get the embeddings used for indexing and queries"""
+    return _get_or_create("embedding_function", _create_embedding_function)
+
+def set_embedding_function(embedding_function):
+    """Replace the embeddings used for indexing and, if it exists, by the vectorstore"""
+    with _instances_lock:
+        _instances["embedding_function"] = embedding_function
+        if "vectorstore" in _instances:
+            _instances["vectorstore"]._embedding_function = embedding_function
 
 def get_vectorstore():
-    """Get the Chroma vectorstore instance"""
-    return vectorstore
+    """Get the Chroma vectorstore instance, embedded on local disk or a shared server (VECTOR_STORE_MODE)"""
+    return _get_or_create("vectorstore", lambda: create_vectorstore(get_embedding_function()))
+
+def get_write_lock():
+    """Get the lock taken around every write, so threads and worker processes never write concurrently"""
+    return _get_or_create("write_lock", create_write_lock)
+
+def get_lexical_index() -> LexicalIndex:
+    """Get the local BM25 index kept in sync with the vectorstore"""
+    return _get_or_create("lexical_index", LexicalIndex)
+
+def _create_text_splitter():
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200
+    )
+
+def get_text_splitter():
+    """Get the text splitter used to chunk documents"""
+    return _get_or_create("text_splitter", _create_text_splitter)
+
+def get_loader_class(file_ext: str):
+    """Import and return the document loader class for a supported extension"""
+    module_name, class_name = SUPPORTED_FORMATS[file_ext]
+    return getattr(importlib.import_module(module_name), class_name)
+
+def sync_lexical_index() -> int:
+    """Rebuild the lexical index from Chroma if they hold different numbers of chunks.
+
+    Covers documents indexed before the lexical index existed. Returns the
+    number of chunks indexed, or 0 if the index was already in sync.
+    """
+    collection = get_vectorstore()._collection
+    lexical_index = get_lexical_index()
+    if lexical_index.count() == collection.count():
+        return 0
+    chunks = collection.get(include=["documents", "metadatas"])
+    lexical_index.clear()
+    lexical_index.add(chunks["ids"], chunks["documents"], chunks["metadatas"])
+    print(f"Rebuilt lexical index with {len(chunks['ids'])} chunks")
+    return len(chunks["ids"])
 
 def validate_file(file_path: str) -> Tuple[bool, str]:
     """Validate if the file exists and is of supported format"""
@@ -48,13 +130,21 @@ def validate_file(file_path: str) -> Tuple[bool, str]:
     if file_ext not in SUPPORTED_FORMATS:
         return False, f"Unsupported file format: {file_ext}. Supported formats: {', '.join(SUPPORTED_FORMATS.keys())}"
     
-    if os.path.getsize(file_path) > 10 * 1024 * 1024:  # 10MB limit
-        return False, f"File too large: {os.path.basename(file_path)}. Maximum size: 10MB"
+    if os.path.getsize(file_path) > MAX_FILE_SIZE:
+        return False, f"File too large: {os.path.basename(file_path)}. Maximum size: {MAX_FILE_SIZE // (1024 * 1024)}MB"
     
     return True, ""
 
-def load_and_split_document(file_path: str) -> List[Document]:
-    """Load and split a document into chunks"""
+def file_content_hash(file_path: str) -> str:
+    """SHA-256 of a file's bytes, read in 1MB blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()
+
+def iter_document_pages(file_path: str) -> Iterator[Document]:
+    """Load a document lazily, one Document per page (or per file for non-paged formats)"""
     # Validate file
     is_valid, error_message = validate_file(file_path)
     if not is_valid:
@@ -63,38 +153,317 @@ def load_and_split_document(file_path: str) -> List[Document]:
     try:
         # Get appropriate loader based on file extension
         file_ext = os.path.splitext(file_path)[1].lower()
-        loader_class = SUPPORTED_FORMATS[file_ext]
-        loader = loader_class(file_path)
-        
-        # Load and split the document
-        documents = loader.load()
-        return text_splitter.split_documents(documents)
+        loader = get_loader_class(file_ext)(file_path)
+        yield from loader.lazy_load()
     except Exception as e:
         raise ValueError(f"Error loading document {file_path}: {str(e)}")
 
-def index_document_to_chroma(file_path: str, file_id: int) -> bool:
-    """Index a document to Chroma with proper error handling"""
+def load_document(file_path: str) -> List[Document]:
+    """Load a document into one Document per page (or per file for non-paged formats)"""
+    return list(iter_document_pages(file_path))
+
+def load_and_split_document(file_path: str) -> List[Document]:
+    """Load and split a document into chunks"""
+    return get_text_splitter().split_documents(load_document(file_path))
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+@dataclass
+class ChunkPlan:
+    """How a document's chunks map onto what is already indexed for it"""
+    ids: List[str]  # id of each chunk of the new version, in order
+    hashes: List[str]
+    new: List[int]  # positions of chunks that have to be embedded
+    kept: List[int]  # positions of chunks whose embedding is reused
+    removed: List[str]  # ids of indexed chunks missing from the new version
+
+def _indexed_chunks(file_id: int) -> List[Tuple[str, str]]:
+    chunks = get_document_chunks(file_id)
+    if chunks:
+        return chunks
+    # Documents indexed before chunk hashes were recorded, or a first run
+    # that was interrupted: hash whatever Chroma holds for the file
+    stored = get_vectorstore()._collection.get(where={"file_id": file_id}, include=["documents"])
+    return [(chunk_id, chunk_hash(text)) for chunk_id, text in zip(stored["ids"], stored["documents"])]
+
+class ChunkPlanner:
+    """Matches a document's chunks against its indexed chunks by hash, one window of chunks at a time.
+
+    A chunk whose text is already indexed keeps that chunk's id; other chunks
+    get an id derived from their hash, so repeating an interrupted run
+    produces the same ids and the embedding pipeline skips what was written.
+    """
+
+    def __init__(self, file_id: int):
+        self.file_id = file_id
+        indexed = _indexed_chunks(file_id)
+        self._by_hash = {}
+        for chunk_id, indexed_hash in indexed:
+            self._by_hash.setdefault(indexed_hash, deque()).append(chunk_id)
+        self._taken = {chunk_id for chunk_id, _ in indexed}
+
+    def plan(self, texts: List[str]) -> ChunkPlan:
+        """Plan the next chunks of the document; positions in the plan are relative to `texts`"""
+        plan = ChunkPlan(ids=[], hashes=[], new=[], kept=[], removed=[])
+        for position, text in enumerate(texts):
+            text_hash = chunk_hash(text)
+            if self._by_hash.get(text_hash):
+                plan.ids.append(self._by_hash[text_hash].popleft())
+                plan.kept.append(position)
+            else:
+                chunk_id = base_id = f"{self.file_id}-{text_hash[:16]}"
+                repeat = 1
+                while chunk_id in self._taken:
+                    chunk_id = f"{base_id}-{repeat}"
+                    repeat += 1
+                self._taken.add(chunk_id)
+                plan.ids.append(chunk_id)
+                plan.new.append(position)
+            plan.hashes.append(text_hash)
+        return plan
+
+    def removed(self) -> List[str]:
+        """Ids of the indexed chunks no planned chunk has matched"""
+        return [chunk_id for chunk_ids in self._by_hash.values() for chunk_id in chunk_ids]
+
+def plan_chunks(file_id: int, texts: List[str]) -> ChunkPlan:
+    """Plan every chunk of a document at once, including the indexed chunks to remove"""
+    planner = ChunkPlanner(file_id)
+    plan = planner.plan(texts)
+    plan.removed = planner.removed()
+    return plan
+
+def chunk_metadatas(file_id: int, metadatas: List[dict], start: int = 0) -> List[dict]:
+    """Loader metadata plus the owning file and the chunk's position in it, counting from `start`"""
+    return [
+        {**metadata, "file_id": file_id, "chunk_index": start + index}
+        for index, metadata in enumerate(metadatas)
+    ]
+
+def _without_source(metadata: Optional[dict]) -> Optional[dict]:
+    # Uploads are indexed from a temporary file, so the source path differs on every upload
+    return {key: value for key, value in metadata.items() if key != "source"} if metadata else metadata
+
+@dataclass
+class ChunkMove:
+    """A kept chunk whose metadata (position or page) differs in the new version"""
+    chunk_id: str
+    previous: dict
+    metadata: dict
+
+def _write_planned_chunks(
+    plan: ChunkPlan,
+    texts: List[str],
+    metadatas: List[dict],
+    progress_callback: Optional[Callable[[int, int], None]] = None
+) -> Tuple[IngestionStats, List[ChunkMove]]:
+    """Embed and write the plan's new chunks; returns their stats and the kept chunks that moved.
+
+    The moved chunks are left as they are, for `_move_chunks` to update once
+    the whole new version has been written.
+    """
+    collection = get_vectorstore()._collection
+    write_lock = get_write_lock()
+    pipeline = EmbeddingPipeline(get_embedding_function(), collection, write_lock=write_lock)
+    # Ingestion waits behind chat requests for embedding quota
+    with rate_limit_priority(BACKGROUND_PRIORITY):
+        stats = pipeline.run(
+            [plan.ids[index] for index in plan.new],
+            [texts[index] for index in plan.new],
+            [metadatas[index] for index in plan.new],
+            progress_callback=progress_callback
+        )
+    get_lexical_index().add([plan.ids[index] for index in plan.new], [texts[index] for index in plan.new],
+                            [metadatas[index] for index in plan.new])
+    moves = []
+    if plan.kept:
+        stored = collection.get(ids=[plan.ids[index] for index in plan.kept], include=["metadatas"])
+        stored_metadatas = dict(zip(stored["ids"], stored["metadatas"]))
+        moves = [
+            ChunkMove(plan.ids[index], stored_metadatas[plan.ids[index]], metadatas[index])
+            for index in plan.kept
+            if _without_source(stored_metadatas.get(plan.ids[index])) != _without_source(metadatas[index])
+        ]
+    return stats, moves
+
+def _move_chunks(moves: List[ChunkMove], restore: bool = False):
+    """Give moved chunks their new metadata in Chroma and the lexical index, or their previous one back"""
+    collection = get_vectorstore()._collection
+    for window in _windows(iter(moves), INGESTION_WINDOW_CHUNKS):
+        ids = [move.chunk_id for move in window]
+        metadatas = [move.previous if restore else move.metadata for move in window]
+        # Only the metadata changes, so the stored embeddings are kept
+        with get_write_lock():
+            collection.update(ids=ids, metadatas=metadatas)
+        stored = collection.get(ids=ids, include=["documents"])
+        texts = dict(zip(stored["ids"], stored["documents"]))
+        get_lexical_index().add(ids, [texts[chunk_id] for chunk_id in ids], metadatas)
+
+def _delete_chunks(ids: List[str]):
+    if ids:
+        with get_write_lock():
+            get_vectorstore()._collection.delete(ids=ids)
+        get_lexical_index().delete(ids)
+
+def apply_chunk_plan(
+    file_id: int,
+    plan: ChunkPlan,
+    texts: List[str],
+    metadatas: List[dict],
+    progress_callback: Optional[Callable[[int, int], None]] = None
+) -> IngestionStats:
+    """Bring Chroma and the lexical index in line with `plan`, embedding only its new chunks.
+
+    Once everything new has been written, kept chunks that moved get their
+    metadata updated and removed chunks are deleted. If writing fails, the
+    new chunks are removed again and moved chunks get their metadata back,
+    so the previous version stays intact.
+    """
+    moves = []
     try:
-        # Load and split the document
-        splits = load_and_split_document(file_path)
-        
-        if not splits:
-            raise ValueError(f"No content extracted from {file_path}")
-        
-        # Add metadata to each split
-        for split in splits:
-            split.metadata['file_id'] = file_id
+        stats, moves = _write_planned_chunks(plan, texts, metadatas, progress_callback)
+        _move_chunks(moves)
+    except Exception:
+        _delete_chunks([plan.ids[index] for index in plan.new])
+        _move_chunks(moves, restore=True)
+        raise
+    _delete_chunks(plan.removed)
+    replace_document_chunks(file_id, list(zip(plan.ids, plan.hashes)))
+    return stats
+
+def _iter_chunks(file_path: str, counters: dict) -> Iterator[Document]:
+    """Split each page as soon as it is loaded, adding pages, characters and time spent to `counters`"""
+    splitter = get_text_splitter()
+    pages = iter_document_pages(file_path)
+    while True:
+        start = time.perf_counter()
+        page = next(pages, None)
+        loaded = time.perf_counter()
+        counters["load"] += loaded - start
+        if page is None:
+            return
+        counters["pages"] += 1
+        counters["characters"] += len(page.page_content)
+        # PDF pages carry the page count, so progress can follow the pages indexed so far
+        counters["total_pages"] = page.metadata.get("total_pages")
+        splits = splitter.split_documents([page])
+        counters["split"] += time.perf_counter() - loaded
+        yield from splits
+
+def _windows(items: Iterator, size: int) -> Iterator[list]:
+    window = []
+    for item in items:
+        window.append(item)
+        if len(window) >= size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+# Chunks embedded and written together while a document is streamed in;
+# bounds the chunk texts and embeddings held in memory at once
+INGESTION_WINDOW_CHUNKS = int(os.getenv("INGESTION_WINDOW_CHUNKS", "256"))
+
+# Share of overall progress reached when each indexing stage starts
+PROGRESS_STAGES = {"loading": 0.0, "embedding": 15.0, "completed": 100.0}
+
+def index_document_to_chroma(
+    file_path: str,
+    file_id: int,
+    progress_callback: Optional[Callable[[str, float], None]] = None,
+    window_chunks: int = INGESTION_WINDOW_CHUNKS
+) -> Optional[IngestionResult]:
+    """Index a document to Chroma with proper error handling.
+
+    Pages are loaded lazily and split as they arrive, and their chunks are
+    embedded and written `window_chunks` at a time, so memory use does not
+    grow with the size of the document. Re-indexing a document under the
+    same `file_id` only embeds chunks whose text is not indexed yet and
+    removes the ones that disappeared. `progress_callback(stage, percent)` is
+    told about each stage and about embedding progress. Returns what was
+    ingested and how long each stage took, or None if indexing failed.
+    """
+    def report(stage: str, percent: Optional[float] = None):
+        if progress_callback:
+            progress_callback(stage, PROGRESS_STAGES[stage] if percent is None else percent)
+
+    def report_embedding(fraction: float):
+        start, end = PROGRESS_STAGES["embedding"], PROGRESS_STAGES["completed"]
+        report("embedding", start + (end - start) * min(fraction, 1.0))
+
+    try:
+        report("loading")
+        counters = {"pages": 0, "total_pages": None, "characters": 0, "load": 0.0, "split": 0.0}
+        planner = ChunkPlanner(file_id)
+        stats = IngestionStats()
+        # (id, hash) of every chunk of the new version, in order
+        recorded = []
+        # Chunks written by this run, deleted again if it fails
+        written = []
+        # Kept chunks that moved, updated once every window has been written
+        moves = []
+        kept = 0
+
+        def report_window(done: int, total: int):
+            # Formats without a page count come as one page, so follow the embedding of each window instead
+            if not counters["total_pages"]:
+                report_embedding(done / total if total else 0.0)
+
+        try:
+            for window in _windows(_iter_chunks(file_path, counters), window_chunks):
+                texts = [chunk.page_content for chunk in window]
+                metadatas = chunk_metadatas(file_id, [chunk.metadata for chunk in window], start=len(recorded))
+                plan = planner.plan(texts)
+                written.extend(plan.ids[index] for index in plan.new)
+                window_stats, window_moves = _write_planned_chunks(plan, texts, metadatas,
+                                                                   progress_callback=report_window)
+                stats.add(window_stats)
+                moves.extend(window_moves)
+                recorded.extend(zip(plan.ids, plan.hashes))
+                kept += len(plan.kept)
+                if counters["total_pages"]:
+                    report_embedding(counters["pages"] / counters["total_pages"])
+            if not recorded:
+                raise ValueError(f"No content extracted from {file_path}")
+            _move_chunks(moves)
+        except Exception:
+            _delete_chunks(written)
+            _move_chunks(moves, restore=True)
+            raise
+        else:
+            removed = planner.removed()
+            _delete_chunks(removed)
+            replace_document_chunks(file_id, recorded)
+        finally:
+            # Even a partial write changes what retrieval can return
+            bump_corpus_version()
+        print(f"Indexed {os.path.basename(file_path)}: {stats.summary()}, "
+              f"{kept} unchanged, {len(removed)} removed")
         
-        # Add to vectorstore
-        vectorstore.add_documents(splits)
-        return True
+        return IngestionResult(
+            chunks=len(recorded),
+            characters=counters["characters"],
+            pages=counters["pages"],
+            timings={
+                "load": counters["load"],
+                "split": counters["split"],
+                "embed": stats.embed_seconds,
+                "write": stats.write_seconds
+            },
+            reused_chunks=kept,
+            removed_chunks=len(removed)
+        )
     except Exception as e:
         print(f"Error indexing document: {e}")
-        return False
+        return None
 
 def delete_doc_from_chroma(file_id: int) -> bool:
     """Delete a document from Chroma with proper error handling"""
     try:
+        get_lexical_index().delete_file(file_id)
+        vectorstore = get_vectorstore()
+        
         # Check if document exists
         docs = vectorstore.get(where={"file_id": file_id})
         if not docs['ids']:
@@ -104,7 +473,9 @@ def delete_doc_from_chroma(file_id: int) -> bool:
         print(f"Found {len(docs['ids'])} document chunks for file_id {file_id}")
         
         # Delete all chunks with matching file_id
-        vectorstore._collection.delete(where={"file_id": file_id})
+        with get_write_lock():
+            vectorstore._collection.delete(where={"file_id": file_id})
+        bump_corpus_version()
         print(f"Deleted all documents with file_id {file_id}")
         return True
     except Exception as e:
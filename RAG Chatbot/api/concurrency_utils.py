@@ -0,0 +1,25 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Bounded pool for the blocking work (SQLite, document parsing) that async
+# endpoints cannot avoid. Keeping it bounded stops a burst of requests from
+# spawning an unbounded number of threads.
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "8"))
+
+blocking_executor = ThreadPoolExecutor(
+    max_workers=BLOCKING_POOL_SIZE,
+    thread_name_prefix="rag-blocking"
+)
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking callable on the bounded executor without blocking the event loop.
+
+    It runs in a copy of the caller's context, so it keeps the caller's trace and rate limit priority.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        blocking_executor, functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    )
@@ -0,0 +1,73 @@
+import os
+from typing import Callable, List
+
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import BasePromptTemplate
+
+from rate_limiter import BACKGROUND_PRIORITY, rate_limit_priority
+from token_utils import estimate_tokens
+
+# Per-request token budget shared by the prompt template, history, question and retrieved context
+CONTEXT_TOKEN_LIMIT = int(os.getenv("CONTEXT_TOKEN_LIMIT", "6000"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# Fold turns that leave the history window into a rolling per-session summary
+SESSION_SUMMARIES = os.getenv("SESSION_SUMMARIES", "true").lower() == "true"
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "300"))
+
+def estimate_prompt_tokens(prompt: BasePromptTemplate) -> int:
+    """Tokens used by a prompt template's fixed text, without its input variables"""
+    template = getattr(prompt, "template", None)
+    if template is None:
+        # Chat prompts: add up the templates of every message
+        template = "\n".join(
+            getattr(getattr(message, "prompt", None), "template", "") for message in getattr(prompt, "messages", [])
+        )
+    return estimate_tokens(template)
+
+def message_tokens(message: BaseMessage) -> int:
+    return estimate_tokens(message.content) if isinstance(message.content, str) else estimate_tokens(str(message.content))
+
+def fit_history(messages: List[BaseMessage], budget: int) -> List[BaseMessage]:
+    """Drop the oldest turns until `messages` fit in `budget` tokens.
+
+    A leading summary (system message) is kept as long as it fits on its own,
+    and the latest turn is always kept.
+    """
+    summary = messages[:1] if messages and isinstance(messages[0], SystemMessage) else []
+    turns = messages[len(summary):]
+    used = sum(message_tokens(message) for message in messages)
+    while used > budget and len(turns) > 2:
+        used -= message_tokens(turns[0]) + message_tokens(turns[1])
+        turns = turns[2:]
+    if summary and used > budget:
+        used -= message_tokens(summary[0])
+        summary = []
+    return summary + turns
+
+def _truncate(text: str, max_tokens: int) -> str:
+    # estimate_tokens counts about 4 characters per token
+    max_chars = max_tokens * 4
+    return text if len(text) <= max_chars else text[:max_chars].rsplit(" ", 1)[0]
+
+class HistorySummarizer:
+    """Folds turns that left a session's history window into its rolling summary.
+
+    Uses LangChain's progressive summary prompt, so each turn is summarised
+    once: the LLM sees the previous summary and only the new turns. Summaries
+    are capped at `max_tokens`.
+    """
+
+    def __init__(self, llm_getter: Callable, max_tokens: int = SUMMARY_MAX_TOKENS):
+        # A getter rather than the client itself, so the model is only created when first needed
+        self.llm_getter = llm_getter
+        self.max_tokens = max_tokens
+
+    def __call__(self, summary: str, turns: list) -> str:
+        new_lines = "\n".join(f"Human: {question}\nAI: {answer}" for question, answer in turns)
+        chain = SUMMARY_PROMPT | self.llm_getter() | StrOutputParser()
+        # Summaries are background work; chat requests go first when the LLM quota is short
+        with rate_limit_priority(BACKGROUND_PRIORITY):
+            summary = chain.invoke({"summary": summary, "new_lines": new_lines})
+        return _truncate(summary.strip(), self.max_tokens)
@@ -1,89 +1,355 @@
 import sqlite3
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-from pydantic_models import ModelName
+from pydantic_models import ModelName, IngestionResult
+from migrations import apply_migrations
 
 DB_NAME = "rag_app.db"
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
+# Pool and SQLite tuning
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_STATEMENT_CACHE_SIZE = 256
+
+# Applied to every connection. WAL lets readers proceed while a writer
+# commits, and synchronous=NORMAL only fsyncs at checkpoints instead of on
+# every commit.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+def _connect(db_name: str) -> sqlite3.Connection:
+    # Each connection keeps a cache of compiled statements, so reusing pooled
+    # connections also reuses the prepared statements for our fixed SQL
+    conn = sqlite3.connect(
+        db_name,
+        check_same_thread=False,
+        cached_statements=DB_STATEMENT_CACHE_SIZE
+    )
     conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
-def create_application_logs():
-    conn = get_db_connection()
-    conn.execute('''CREATE TABLE IF NOT EXISTS application_logs
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                     session_id TEXT,
-                     user_query TEXT,
-                     gpt_response TEXT,
-                     model TEXT,
-                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    conn.close()
+class ConnectionPool:
+    """Thread-safe pool of long-lived, tuned SQLite connections.
+
+    Connections are created lazily up to `size`; once all of them are in use,
+    callers wait for one to be returned.
+    """
+
+    def __init__(self, db_name: str, size: int = DB_POOL_SIZE):
+        self.db_name = db_name
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return _connect(self.db_name)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; the transaction is committed on success and rolled back on error"""
+        conn = self._acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def close_all(self):
+        """Close idle connections; connections currently borrowed are closed when returned"""
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._created -= 1
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Get the pool for the current DB_NAME, migrating the schema before its first use"""
+    pool = _pools.get(DB_NAME)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(DB_NAME)
+            if pool is None:
+                initialize_database()
+                pool = _pools[DB_NAME] = ConnectionPool(DB_NAME)
+    return pool
+
+def db_connection():
+    """Context manager yielding a pooled connection"""
+    return get_pool().connection()
+
+def get_db_connection():
+    """Open a new, unpooled connection with the standard pragmas; the caller must close it"""
+    return _connect(DB_NAME)
+
+# Database work runs on its own executor, sized to the pool, so async callers
+# never wait on a thread that is itself waiting for a connection
+db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="rag-db")
+
+async def run_db(func, *args, **kwargs):
+    """Run a db_utils function from async code without blocking the event loop, in a copy of the caller's context"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        db_executor, functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    )
 
 def insert_application_logs(session_id, user_query, gpt_response, model):
-    conn = get_db_connection()
-    conn.execute('INSERT INTO application_logs (session_id, user_query, gpt_response, model) VALUES (?, ?, ?, ?)',
-                 (session_id, user_query, gpt_response, model))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        conn.execute('INSERT INTO application_logs (session_id, user_query, gpt_response, model) VALUES (?, ?, ?, ?)',
+                     (session_id, user_query, gpt_response, model))
 
 def get_chat_history(session_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? ORDER BY created_at', (session_id,))
+    with db_connection() as conn:
+        rows = conn.execute('SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? ORDER BY created_at, id',
+                            (session_id,)).fetchall()
+    return _history_rows_to_messages(rows)
+
+def _history_rows_to_messages(rows) -> list:
     messages = []
-    for row in cursor.fetchall():
+    for row in rows:
         messages.extend([
             {"role": "human", "content": row['user_query']},
             {"role": "ai", "content": row['gpt_response']}
         ])
-    conn.close()
     return messages
 
-def create_document_store():
-    conn = get_db_connection()
-    conn.execute('''CREATE TABLE IF NOT EXISTS document_store
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                     filename TEXT,
-                     upload_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    conn.close()
+def get_chat_history_page(session_id: str, limit: int = 50, cursor: int = None, newest_first: bool = False) -> dict:
+    """Keyset-paginated chat history.
 
-def insert_document_record(filename):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO document_store (filename) VALUES (?)', (filename,))
-    file_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return file_id
+    Returns up to `limit` interactions after `cursor` (the id of the last row
+    of the previous page) and the cursor for the next page, or None when there
+    are no more rows. Messages within a page are always in chronological order.
+    """
+    comparison, order = ('<', 'DESC') if newest_first else ('>', 'ASC')
+    params = [session_id]
+    after_cursor = ''
+    if cursor is not None:
+        after_cursor = f'AND (created_at, id) {comparison} (SELECT created_at, id FROM application_logs WHERE id = ?)'
+        params.append(cursor)
+    params.append(limit + 1)
+    with db_connection() as conn:
+        rows = conn.execute(f'''SELECT id, user_query, gpt_response FROM application_logs
+                                WHERE session_id = ? {after_cursor}
+                                ORDER BY created_at {order}, id {order} LIMIT ?''', params).fetchall()
+    next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+    rows = rows[:limit]
+    if newest_first:
+        rows.reverse()
+    return {"messages": _history_rows_to_messages(rows), "next_cursor": next_cursor}
+
+def get_recent_chat_turns(session_id: str, limit: int, after_id: int = 0) -> list:
+    """The newest `limit` interactions of a session logged after row `after_id`, oldest first.
+
+    Returns (id, user_query, gpt_response) tuples; used to rehydrate and sync session memory.
+    """
+    with db_connection() as conn:
+        rows = conn.execute('''SELECT id, user_query, gpt_response FROM application_logs
+                               WHERE session_id = ? AND id > ?
+                               ORDER BY created_at DESC, id DESC LIMIT ?''',
+                            (session_id, after_id, limit)).fetchall()
+    return [(row['id'], row['user_query'], row['gpt_response']) for row in reversed(rows)]
+
+def get_session_summary(session_id: str):
+    """(summary, through_id) for a session, or None if its history was never summarised"""
+    with db_connection() as conn:
+        row = conn.execute('SELECT summary, through_id FROM session_summaries WHERE session_id = ?',
+                           (session_id,)).fetchone()
+    return (row['summary'], row['through_id']) if row else None
+
+def save_session_summary(session_id: str, summary: str, through_id: int):
+    """Store a session's rolling summary unless a summary covering later turns is already stored"""
+    with db_connection() as conn:
+        conn.execute('''INSERT INTO session_summaries (session_id, summary, through_id) VALUES (?, ?, ?)
+                        ON CONFLICT(session_id) DO UPDATE SET
+                            summary = excluded.summary,
+                            through_id = excluded.through_id,
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE excluded.through_id >= session_summaries.through_id''',
+                     (session_id, summary, through_id))
+
+def insert_document_record(filename, content_hash: str = None):
+    with db_connection() as conn:
+        cursor = conn.execute('INSERT INTO document_store (filename, content_hash) VALUES (?, ?)',
+                              (filename, content_hash))
+        return cursor.lastrowid
+
+def get_document(file_id: int):
+    """id, filename, content_hash and chunk_count of a document, or None"""
+    with db_connection() as conn:
+        row = conn.execute('SELECT id, filename, content_hash, chunk_count FROM document_store WHERE id = ?',
+                           (file_id,)).fetchone()
+    return dict(row) if row else None
+
+def get_latest_document_by_filename(filename: str):
+    """Newest document uploaded under `filename`, in the shape of get_document, or None"""
+    with db_connection() as conn:
+        row = conn.execute('''SELECT id, filename, content_hash, chunk_count FROM document_store
+                              WHERE filename = ? ORDER BY id DESC LIMIT 1''', (filename,)).fetchone()
+    return dict(row) if row else None
+
+def update_document_ingestion(file_id: int, result: IngestionResult, content_hash: str = None):
+    """Record a completed ingestion; passing `content_hash` marks a new version of the document"""
+    with db_connection() as conn:
+        conn.execute('''UPDATE document_store
+                        SET chunk_count = ?, char_count = ?, page_count = ?, ingestion_timings = ?
+                        WHERE id = ?''',
+                     (result.chunks, result.characters, result.pages, json.dumps(result.timings), file_id))
+        if content_hash is not None:
+            conn.execute('''UPDATE document_store SET content_hash = ?, upload_timestamp = CURRENT_TIMESTAMP
+                            WHERE id = ?''', (content_hash, file_id))
+
+def get_document_chunks(file_id: int) -> list:
+    """(chunk_id, chunk_hash) of every chunk in the document's current version"""
+    with db_connection() as conn:
+        rows = conn.execute('SELECT chunk_id, chunk_hash FROM document_chunks WHERE document_id = ?',
+                            (file_id,)).fetchall()
+    return [(row['chunk_id'], row['chunk_hash']) for row in rows]
+
+def replace_document_chunks(file_id: int, chunks: list):
+    """Replace the recorded (chunk_id, chunk_hash) pairs of a document in one transaction"""
+    with db_connection() as conn:
+        conn.execute('DELETE FROM document_chunks WHERE document_id = ?', (file_id,))
+        conn.executemany('INSERT INTO document_chunks (document_id, chunk_id, chunk_hash) VALUES (?, ?, ?)',
+                         [(file_id, chunk_id, chunk_hash) for chunk_id, chunk_hash in chunks])
 
 def delete_document_record(file_id):
-    conn = get_db_connection()
-    conn.execute('DELETE FROM document_store WHERE id = ?', (file_id,))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        conn.execute('DELETE FROM document_chunks WHERE document_id = ?', (file_id,))
+        conn.execute('DELETE FROM document_store WHERE id = ?', (file_id,))
     return True
 
 def get_all_documents():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, filename, upload_timestamp FROM document_store ORDER BY upload_timestamp DESC')
-    documents = cursor.fetchall()
-    conn.close()
-    return [dict(doc) for doc in documents]
+    with db_connection() as conn:
+        documents = conn.execute('''SELECT id, filename, upload_timestamp, chunk_count, char_count, page_count, ingestion_timings
+                                    FROM document_store ORDER BY upload_timestamp DESC''').fetchall()
+    return [_document_row_to_dict(doc) for doc in documents]
+
+def get_documents_page(limit: int = 50, cursor: int = None) -> dict:
+    """Keyset-paginated variant of get_all_documents, newest first; `cursor` is the last id of the previous page"""
+    params = []
+    after_cursor = ''
+    if cursor is not None:
+        after_cursor = 'WHERE (upload_timestamp, id) < (SELECT upload_timestamp, id FROM document_store WHERE id = ?)'
+        params.append(cursor)
+    params.append(limit + 1)
+    with db_connection() as conn:
+        rows = conn.execute(f'''SELECT id, filename, upload_timestamp, chunk_count, char_count, page_count, ingestion_timings
+                                FROM document_store {after_cursor}
+                                ORDER BY upload_timestamp DESC, id DESC LIMIT ?''', params).fetchall()
+    next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+    return {"documents": [_document_row_to_dict(row) for row in rows[:limit]], "next_cursor": next_cursor}
+
+def _document_row_to_dict(row) -> dict:
+    document = {"id": row['id'], "filename": row['filename'], "upload_timestamp": row['upload_timestamp']}
+    if row['chunk_count'] is not None:
+        document["ingestion"] = {
+            "chunks": row['chunk_count'],
+            "characters": row['char_count'],
+            "pages": row['page_count'],
+            "timings": json.loads(row['ingestion_timings'] or '{}')
+        }
+    return document
 
 def log_interaction(session_id: str, user_query: str, gpt_response: str, model: ModelName):
+    with db_connection() as conn:
+        conn.execute('''
+            INSERT INTO application_logs (session_id, user_query, gpt_response, model)
+            VALUES (?, ?, ?, ?)
+        ''', (session_id, user_query, gpt_response, model.value))
+
+def insert_application_logs_batch(rows):
+    """Insert (session_id, user_query, gpt_response, model) rows in a single transaction"""
+    with db_connection() as conn:
+        conn.executemany('INSERT INTO application_logs (session_id, user_query, gpt_response, model) VALUES (?, ?, ?, ?)',
+                         rows)
+
+def insert_ingestion_job(job_id: str, filename: str, file_path: str):
+    with db_connection() as conn:
+        conn.execute('INSERT INTO ingestion_jobs (id, filename, file_path) VALUES (?, ?, ?)',
+                     (job_id, filename, file_path))
+
+# Columns of ingestion_jobs that update_ingestion_job may change
+INGESTION_JOB_FIELDS = {"document_id", "status", "stage", "progress", "error", "result"}
+
+def update_ingestion_job(job_id: str, **fields):
+    unknown = set(fields) - INGESTION_JOB_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown ingestion job fields: {', '.join(sorted(unknown))}")
+    if isinstance(fields.get("result"), IngestionResult):
+        fields["result"] = fields["result"].model_dump_json()
+    assignments = ", ".join(f"{field} = ?" for field in fields)
+    with db_connection() as conn:
+        conn.execute(f'UPDATE ingestion_jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                     (*fields.values(), job_id))
+
+def get_ingestion_job(job_id: str):
+    with db_connection() as conn:
+        row = conn.execute('SELECT * FROM ingestion_jobs WHERE id = ?', (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+def get_unfinished_ingestion_jobs():
+    with db_connection() as conn:
+        rows = conn.execute("SELECT id FROM ingestion_jobs WHERE status IN ('queued', 'running') ORDER BY created_at").fetchall()
+    return [row['id'] for row in rows]
+
+def get_corpus_version() -> int:
+    with db_connection() as conn:
+        return conn.execute('SELECT version FROM corpus_version WHERE id = 1').fetchone()['version']
+
+def bump_corpus_version() -> int:
+    """Record that the indexed document set changed; returns the new version"""
+    with db_connection() as conn:
+        conn.execute('UPDATE corpus_version SET version = version + 1 WHERE id = 1')
+        return conn.execute('SELECT version FROM corpus_version WHERE id = 1').fetchone()['version']
+
+def initialize_database() -> int:
+    """Apply pending schema migrations; returns how many were applied"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO application_logs (session_id, user_query, gpt_response, model)
-        VALUES (?, ?, ?, ?)
-    ''', (session_id, user_query, gpt_response, model.value))
-    
-    conn.commit()
-    conn.close()
-
-# Initialize the database tables
-create_application_logs()
-create_document_store()
+    try:
+        return apply_migrations(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+# Persistent cache of embeddings, stored next to rag_app.db
+EMBEDDING_CACHE_DB = os.getenv("EMBEDDING_CACHE_DB", "embedding_cache.db")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+def cache_key(model: str, task: str, text: str) -> str:
+    """Content address of one embedding: model, task type and a hash of the text.
+
+    Gemini embeds documents and queries with different task types, so the same
+    text can have two different vectors.
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{model}:{task}:{digest}"
+
+class EmbeddingCache:
+    """SQLite-backed embedding cache with size-bounded LRU eviction and hit/miss counters"""
+
+    def __init__(self, db_path: str = EMBEDDING_CACHE_DB, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS embedding_cache
+                              (key TEXT PRIMARY KEY,
+                               vector BLOB NOT NULL,
+                               last_used REAL NOT NULL)''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used ON embedding_cache (last_used)')
+        self._conn.commit()
+        self._size = self._conn.execute('SELECT COUNT(*) FROM embedding_cache').fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        """Look up vectors by key, refreshing the recency of every hit"""
+        if not keys:
+            return []
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT key, vector FROM embedding_cache WHERE key IN ({placeholders})', chunk
+                ).fetchall()
+                found.update({key: array("f", vector).tolist() for key, vector in rows})
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    'UPDATE embedding_cache SET last_used = ? WHERE key = ?',
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return [found.get(key) for key in keys]
+
+    def put_many(self, keys: List[str], vectors: List[List[float]]):
+        """Store vectors and evict the least recently used entries beyond `max_entries`"""
+        if not keys:
+            return
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO embedding_cache (key, vector, last_used) VALUES (?, ?, ?)',
+                [(key, array("f", vector).tobytes(), now) for key, vector in zip(keys, vectors)]
+            )
+            self._size += self._conn.total_changes - before
+            overflow = self._size - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    'DELETE FROM embedding_cache WHERE key IN '
+                    '(SELECT key FROM embedding_cache ORDER BY last_used LIMIT ?)',
+                    (overflow,)
+                )
+                self._size -= overflow
+                self.evictions += overflow
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM embedding_cache')
+            self._conn.commit()
+            self._size = 0
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embedding backend so only texts missing from the cache are sent to it"""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [cache_key(self.model_name, "document", text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Embed each distinct missing text once, even if it repeats within the batch
+            pending = {}
+            for i in missing:
+                pending.setdefault(keys[i], texts[i])
+            embedded = self.embeddings.embed_documents(list(pending.values()))
+            self.cache.put_many(list(pending), embedded)
+            by_key = dict(zip(pending, embedded))
+            for i in missing:
+                vectors[i] = by_key[keys[i]]
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model_name, "query", text)
+        vector = self.cache.get_many([key])[0]
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many([key], [vector])
+        return vector
@@ -0,0 +1,152 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from rate_limiter import is_rate_limit_error
+
+# Embedding pipeline configuration
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+EMBEDDING_BACKOFF_MAX = float(os.getenv("EMBEDDING_BACKOFF_MAX", "30"))
+
+@dataclass
+class IngestionStats:
+    """Counters and timing for one run of the embedding pipeline"""
+    total_chunks: int = 0
+    embedded_chunks: int = 0
+    resumed_chunks: int = 0
+    batches: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+    write_seconds: float = 0.0
+
+    def add(self, other: "IngestionStats"):
+        """Add the counters and timings of another run, e.g. the next window of a streamed document"""
+        self.total_chunks += other.total_chunks
+        self.embedded_chunks += other.embedded_chunks
+        self.resumed_chunks += other.resumed_chunks
+        self.batches += other.batches
+        self.retries += other.retries
+        self.seconds += other.seconds
+        self.write_seconds += other.write_seconds
+
+    @property
+    def embed_seconds(self) -> float:
+        """Pipeline time not spent writing to the vector store"""
+        return max(0.0, self.seconds - self.write_seconds)
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.embedded_chunks / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.embedded_chunks}/{self.total_chunks} chunks embedded in {self.batches} batches "
+            f"({self.resumed_chunks} already indexed, {self.retries} retries) "
+            f"in {self.seconds:.2f}s - {self.chunks_per_second:.1f} chunks/s"
+        )
+
+class EmbeddingPipeline:
+    """Embeds chunks in fixed-size batches with bounded concurrency and writes them to Chroma.
+
+    Each batch is written as soon as it is embedded, under stable chunk ids, so
+    a run that fails part-way can be repeated and only the missing chunks are
+    embedded again. Rate-limited batches are retried with jittered exponential
+    backoff instead of failing the whole document.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        collection,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        concurrency: int = EMBEDDING_CONCURRENCY,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        backoff_max: float = EMBEDDING_BACKOFF_MAX,
+        write_lock=None
+    ):
+        self.embeddings = embeddings
+        self.collection = collection
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max(1, max_retries)
+        self.backoff_max = backoff_max
+        # Context manager held around each write to the collection
+        self.write_lock = write_lock or nullcontext()
+        self._stats_lock = threading.Lock()
+
+    def _embed_batch(self, texts: List[str], stats: IngestionStats) -> List[List[float]]:
+        retrying = Retrying(
+            retry=retry_if_exception(is_rate_limit_error),
+            wait=wait_random_exponential(multiplier=1, max=self.backoff_max),
+            stop=stop_after_attempt(self.max_retries),
+            reraise=True
+        )
+        for attempt in retrying:
+            with attempt:
+                if attempt.retry_state.attempt_number > 1:
+                    with self._stats_lock:
+                        stats.retries += 1
+                return self.embeddings.embed_documents(texts)
+
+    def run(
+        self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[dict],
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> IngestionStats:
+        """Embed and write every chunk whose id is not already in the collection.
+
+        `progress_callback(done, total)` is called after each written batch.
+        """
+        start = time.perf_counter()
+        stats = IngestionStats(total_chunks=len(ids))
+
+        # Resume: skip chunks that a previous, interrupted run already wrote
+        existing = set(self.collection.get(ids=ids, include=[])["ids"]) if ids else set()
+        pending = [index for index, chunk_id in enumerate(ids) if chunk_id not in existing]
+        stats.resumed_chunks = len(ids) - len(pending)
+        if progress_callback:
+            progress_callback(stats.resumed_chunks, stats.total_chunks)
+
+        batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="rag-embed")
+        try:
+            # Each batch runs in a copy of the caller's context, so it keeps its rate limit priority
+            futures = {
+                executor.submit(
+                    contextvars.copy_context().run, self._embed_batch, [texts[i] for i in batch], stats
+                ): batch
+                for batch in batches
+            }
+            # Writes happen on this thread, one batch at a time, as embeddings complete
+            for future in as_completed(futures):
+                batch = futures[future]
+                vectors = future.result()
+                write_start = time.perf_counter()
+                with self.write_lock:
+                    self.collection.upsert(
+                        ids=[ids[i] for i in batch],
+                        embeddings=vectors,
+                        documents=[texts[i] for i in batch],
+                        metadatas=[metadatas[i] for i in batch]
+                    )
+                stats.write_seconds += time.perf_counter() - write_start
+                stats.embedded_chunks += len(batch)
+                stats.batches += 1
+                if progress_callback:
+                    progress_callback(stats.resumed_chunks + stats.embedded_chunks, stats.total_chunks)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        stats.seconds = time.perf_counter() - start
+        return stats
@@ -1,33 +1,14 @@
-import sqlite3
+from db_utils import DB_NAME, get_db_connection
+from migrations import apply_migrations, get_schema_version
 
 def init_database():
-    conn = sqlite3.connect('chatbot.db')
-    cursor = conn.cursor()
-
-    # Create application_logs table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS application_logs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        session_id TEXT,
-        user_query TEXT,
-        gpt_response TEXT,
-        model TEXT,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-
-    # Create document_store table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS document_store (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        filename TEXT NOT NULL,
-        upload_timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-
-    conn.commit()
-    conn.close()
-    print("Database initialized successfully!")
+    conn = get_db_connection()
+    try:
+        applied = apply_migrations(conn)
+        version = get_schema_version(conn)
+    finally:
+        conn.close()
+    print(f"Database {DB_NAME} initialized successfully! (schema version {version}, {applied} migrations applied)")
 
 if __name__ == "__main__":
-    init_database() 
\ No newline at end of file
+    init_database()
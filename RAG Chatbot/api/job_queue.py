@@ -0,0 +1,191 @@
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import List, Tuple
+
+from bulk_ingest import FileOutcome, bulk_ingest
+from chroma_utils import PROGRESS_STAGES, index_document_to_chroma, delete_doc_from_chroma, file_content_hash
+from db_utils import (
+    insert_document_record, delete_document_record, update_document_ingestion, get_document,
+    get_latest_document_by_filename, insert_ingestion_job, update_ingestion_job, get_ingestion_job, get_unfinished_ingestion_jobs
+)
+from telemetry import current_trace, observe_stages, span, trace
+
+logger = logging.getLogger(__name__)
+
+# Number of documents ingested in parallel
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+
+class IngestionJobQueue:
+    """Runs document ingestion in a background worker pool.
+
+    Job state lives in the ingestion_jobs table, so status survives restarts
+    and jobs that were queued or running when the process stopped are picked
+    up again by `resume_unfinished`. A resumed job keeps its document id, which
+    lets the embedding pipeline skip chunks that were already written.
+
+    A file uploaded under the name of an indexed document is a new version of
+    it: the document keeps its id and only changed chunks are re-indexed.
+    Jobs for the same filename run one at a time, whether uploaded alone or
+    in a batch.
+    """
+
+    def __init__(self, workers: int = INGESTION_WORKERS):
+        self.workers = max(1, workers)
+        self._executor = None
+        self._filename_locks = {}
+        self._filename_locks_lock = threading.Lock()
+
+    def _filename_lock(self, filename: str) -> threading.Lock:
+        with self._filename_locks_lock:
+            return self._filename_locks.setdefault(filename, threading.Lock())
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rag-ingest")
+        return self._executor
+
+    def submit(self, filename: str, file_path: str) -> str:
+        """Record a new job for a file already saved to disk and queue it; returns the job id"""
+        job_id = str(uuid.uuid4())
+        insert_ingestion_job(job_id, filename, file_path)
+        self._get_executor().submit(self._run, job_id)
+        logger.info(f"Queued ingestion job {job_id} for {filename}")
+        return job_id
+
+    def submit_batch(self, files: List[Tuple[str, str]]) -> List[str]:
+        """Record a job per (filename, file path) and ingest them together with `bulk_ingest`; returns the job ids"""
+        jobs = []
+        for filename, file_path in files:
+            job_id = str(uuid.uuid4())
+            insert_ingestion_job(job_id, filename, file_path)
+            jobs.append((job_id, filename, file_path))
+        self._get_executor().submit(self._run_batch, jobs)
+        logger.info(f"Queued bulk ingestion of {len(jobs)} files")
+        return [job_id for job_id, _, _ in jobs]
+
+    def resume_unfinished(self) -> int:
+        """Requeue jobs left queued or running by a previous process"""
+        job_ids = get_unfinished_ingestion_jobs()
+        for job_id in job_ids:
+            update_ingestion_job(job_id, status="queued", stage="queued")
+            self._get_executor().submit(self._run, job_id)
+        if job_ids:
+            logger.info(f"Resumed {len(job_ids)} unfinished ingestion jobs")
+        return len(job_ids)
+
+    def _run(self, job_id: str):
+        job = get_ingestion_job(job_id)
+        if job is None:
+            return
+        with self._filename_lock(job["filename"]), trace("ingest"):
+            self._index(job_id, job["filename"], job["file_path"], job["document_id"])
+
+    def _index(self, job_id: str, filename: str, file_path: str, doc_id):
+        # Whether doc_id held a fully indexed earlier version before this job
+        updating = False
+        try:
+            if not os.path.exists(file_path):
+                raise ValueError(f"Uploaded file is no longer available: {filename}")
+
+            with span("hash"):
+                content_hash = file_content_hash(file_path)
+            if doc_id is None:
+                existing = get_latest_document_by_filename(filename)
+                if existing is not None and existing["chunk_count"] is not None:
+                    if existing["content_hash"] == content_hash:
+                        update_ingestion_job(job_id, status="completed", stage="skipped", progress=100.0,
+                                             document_id=existing["id"])
+                        logger.info(f"Skipped {filename} (job {job_id}): content unchanged")
+                        return
+                    doc_id = existing["id"]
+                else:
+                    doc_id = insert_document_record(filename, content_hash)
+            document = get_document(doc_id)
+            updating = document is not None and document["chunk_count"] is not None
+            update_ingestion_job(job_id, status="running", document_id=doc_id)
+
+            def on_progress(stage: str, percent: float):
+                update_ingestion_job(job_id, stage=stage, progress=round(percent, 1))
+
+            logger.info(f"Indexing document in Chroma: {filename} (job {job_id})")
+            with span("index"):
+                ingestion = index_document_to_chroma(file_path, doc_id, progress_callback=on_progress)
+                if ingestion is None:
+                    raise ValueError(f"Failed to index document {filename} in vector store")
+                # Loading, splitting and embedding interleave, so they are recorded as measured
+                observe_stages(ingestion.timings)
+
+            update_document_ingestion(doc_id, ingestion, content_hash)
+            update_ingestion_job(job_id, status="completed", stage="completed", progress=100.0, result=ingestion)
+            logger.info(
+                f"Successfully processed document into {ingestion.chunks} chunks "
+                f"({ingestion.reused_chunks} unchanged, {ingestion.removed_chunks} removed): {filename} - "
+                f"Timings: {ingestion.timings}"
+            )
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed for {filename}: {str(e)}")
+            if current_trace() is not None:
+                current_trace().status = "error"
+            if doc_id is not None and not updating:
+                # Remove any partially written chunks and the database record;
+                # a failed update leaves the previous version in place
+                delete_doc_from_chroma(doc_id)
+                delete_document_record(doc_id)
+            update_ingestion_job(job_id, status="failed", stage="failed", error=str(e))
+        finally:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                logger.info(f"Cleaned up temporary file: {file_path}")
+
+    def _run_batch(self, jobs: List[Tuple[str, str, str]]):
+        job_ids = {file_path: job_id for job_id, _, file_path in jobs}
+        finished = set()
+
+        def on_file(outcome: FileOutcome):
+            job_id = job_ids[outcome.file_path]
+            if outcome.status == "indexing":
+                update_ingestion_job(job_id, stage="embedding", progress=PROGRESS_STAGES["embedding"],
+                                     document_id=outcome.document_id)
+                return
+            finished.add(job_id)
+            if outcome.status == "indexed":
+                update_ingestion_job(job_id, status="completed", stage="completed", progress=100.0, result=outcome.result)
+            elif outcome.status == "skipped":
+                # Identical content is already indexed
+                update_ingestion_job(job_id, status="completed", stage="skipped", progress=100.0,
+                                     document_id=outcome.document_id)
+            else:
+                update_ingestion_job(job_id, status="failed", stage="failed", error=outcome.error)
+
+        try:
+            with ExitStack() as locks:
+                # New documents are only written when their batch is, so every name is
+                # held for the whole run; sorted, so concurrent batches cannot deadlock
+                for filename in sorted({filename for _, filename, _ in jobs}):
+                    locks.enter_context(self._filename_lock(filename))
+                for job_id, _, _ in jobs:
+                    update_ingestion_job(job_id, status="running", stage="loading")
+                with trace("bulk_ingest"):
+                    report = bulk_ingest([(filename, file_path) for _, filename, file_path in jobs], on_file=on_file)
+                    observe_stages(report.stage_seconds)
+            logger.info(f"Bulk ingestion finished: {report.summary()}")
+        except Exception as e:
+            logger.error(f"Bulk ingestion failed: {str(e)}")
+            for job_id, _, _ in jobs:
+                if job_id not in finished:
+                    update_ingestion_job(job_id, status="failed", stage="failed", error=str(e))
+        finally:
+            for _, _, file_path in jobs:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+ingestion_queue = IngestionJobQueue()
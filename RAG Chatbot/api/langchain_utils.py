@@ -1,25 +1,24 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from typing import List
-from langchain_core.documents import Document
 import os
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-from chroma_utils import vectorstore
+from chroma_utils import get_vectorstore, get_lexical_index
+from retrieval_utils import HybridRetriever, RerankingRetriever, RETRIEVAL_CANDIDATES
+from rerank_utils import create_reranker
+from db_utils import run_db
+from concurrency_utils import run_blocking
+from session_memory import session_store
+from answer_cache import answer_cache
+from question_rewriter import question_rewriter
+from context_builder import HistorySummarizer, SESSION_SUMMARIES, estimate_prompt_tokens
+from upstream import RateLimitedChatModel
+from telemetry import record_span, span
+import threading
 import time
-from tenacity import retry, stop_after_attempt, wait_exponential
 
 load_dotenv()
 
-# Create a dictionary to store session-specific memories
-session_memories = {}
-
-retriever = vectorstore.as_retriever(search_kwargs={"k": 2})
+DEFAULT_MODEL = "models/gemini-1.5-pro"
 
 output_parser = StrOutputParser()
 
@@ -45,48 +44,231 @@ qa_prompt = ChatPromptTemplate.from_messages([
     ("human", "{input}")
 ])
 
-@retry(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10)
-)
-def get_rag_chain(session_id: str, model_name="models/gemini-1.5-pro"):
-    try:
-        if session_id not in session_memories:
-            session_memories[session_id] = ConversationBufferMemory(
-                memory_key="chat_history",
-                return_messages=True,
-                output_key="answer"
-            )
-        
-        llm = ChatGoogleGenerativeAI(
-            model=model_name,
-            google_api_key=os.getenv("GOOGLE_API_KEY"),
-            temperature=0.7,
-            max_retries=3
-        )
+def _create_llm(model_name: str):
+    """Create the chat model client used for every request against `model_name`"""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    # Every call goes through the shared Gemini rate limiter and request coalescer
+    return RateLimitedChatModel(model=ChatGoogleGenerativeAI(
+        model=model_name,
+        google_api_key=os.getenv("GOOGLE_API_KEY"),
+        temperature=0.7,
+        max_retries=3
+    ))
+
+def _create_retriever(model_name: str):
+    """Create the retriever used by chains for `model_name`"""
+    # Over-fetch, then let the reranker and the token budget decide what is stuffed into the prompt
+    return RerankingRetriever(
+        base_retriever=HybridRetriever(
+            vectorstore=get_vectorstore(),
+            lexical_index=get_lexical_index(),
+            k=RETRIEVAL_CANDIDATES
+        ),
+        reranker=create_reranker()
+    )
+
+class ChainRegistry:
+    """Builds the LLM client, retriever and RAG chain once per model and reuses them.
+
+    Chains are compiled without memory so a single instance can serve every
+    session; conversation history is supplied per call by `invoke_rag_chain`.
+    """
+
+    def __init__(self, llm_factory=_create_llm, retriever_factory=_create_retriever):
+        self.llm_factory = llm_factory
+        self.retriever_factory = retriever_factory
+        self._lock = threading.RLock()
+        self._llms = {}
+        self._retrievers = {}
+        self._chains = {}
+
+    def _get_or_create(self, cache: dict, model_name: str, factory):
+        value = cache.get(model_name)
+        if value is None:
+            with self._lock:
+                value = cache.get(model_name)
+                if value is None:
+                    value = cache[model_name] = factory(model_name)
+        return value
 
+    def get_llm(self, model_name: str):
+        return self._get_or_create(self._llms, model_name, self.llm_factory)
+
+    def get_retriever(self, model_name: str):
+        return self._get_or_create(self._retrievers, model_name, self.retriever_factory)
+
+    def build_chain(self, model_name: str):
+        """Compile a new chain from the cached client and retriever"""
+        from langchain.chains import ConversationalRetrievalChain
+        retriever = self.get_retriever(model_name)
         chain = ConversationalRetrievalChain.from_llm(
-            llm=llm,
-            retriever=vectorstore.as_retriever(
-                search_kwargs={"k": 2}  # Reduced to 2 to minimize API calls
-            ),
-            memory=session_memories[session_id],
+            llm=self.get_llm(model_name),
+            retriever=retriever,
             return_source_documents=True,
             chain_type="stuff"
         )
-
+        if hasattr(retriever, "prompt_tokens"):
+            # Leave room for the answer prompt when packing retrieved context
+            retriever.prompt_tokens = estimate_prompt_tokens(chain.combine_docs_chain.llm_chain.prompt)
         return chain
+
+    def get_chain(self, model_name: str):
+        return self._get_or_create(self._chains, model_name, self.build_chain)
+
+    def clear(self):
+        """Drop every cached client, retriever and chain"""
+        with self._lock:
+            self._llms.clear()
+            self._retrievers.clear()
+            self._chains.clear()
+
+chain_registry = ChainRegistry()
+
+if SESSION_SUMMARIES:
+    # Turns leaving a session's history window are summarised in the background with the default model
+    session_store.summarizer = HistorySummarizer(lambda: chain_registry.get_llm(DEFAULT_MODEL))
+
+def get_rag_chain(model_name: str = DEFAULT_MODEL):
+    """Get the shared RAG chain for a model, building it on first use"""
+    return chain_registry.get_chain(model_name)
+
+def get_session_history(session_id: str) -> list:
+    """Get the session's recent turns from the bounded session memory store"""
+    return session_store.get_history(session_id)
+
+def answers_lexically(model_name: str, standalone_question: str) -> bool:
+    """Whether the model's retriever will answer the question from BM25 alone, without embedding it"""
+    retriever = chain_registry.get_retriever(model_name)
+    retriever = getattr(retriever, "base_retriever", retriever)
+    return isinstance(retriever, HybridRetriever) and retriever.answers_lexically(standalone_question)
+
+def lookup_cached_answer(model_name: str, standalone_question: str):
+    """Look the standalone question up in the answer cache.
+
+    Returns (corpus_version, vector, cached answer or None); the version and
+    vector are needed to store the answer on a miss. Questions the lexical
+    fast path will answer are not embedded just for the cache: they are
+    looked up by their exact text and come back without a vector.
+    """
+    if not answer_cache.enabled:
+        return None, None, None
+    corpus_version = answer_cache.sync_version()
+    if answers_lexically(model_name, standalone_question):
+        return corpus_version, None, answer_cache.lookup_question(model_name, standalone_question)
+    # Same embeddings as retrieval, so the retriever's query embedding is a cache hit
+    vector = get_vectorstore().embeddings.embed_query(standalone_question)
+    return corpus_version, vector, answer_cache.lookup(model_name, vector)
+
+def _cached_result(question: str, cached) -> dict:
+    return {"question": question, "answer": cached.answer, "source_documents": cached.source_documents, "cached": True}
+
+def _store_answer(model_name: str, standalone_question: str, corpus_version, vector, result: dict):
+    if corpus_version is not None:
+        answer_cache.store(model_name, standalone_question, vector, result["answer"],
+                           result.get("source_documents", []), corpus_version)
+
+# The chain is always called with the already-condensed question and no
+# history, so it skips its own condense step; the default "stuff" answer
+# prompt only uses the context and the question, so answers are unchanged.
+# Each step runs in a span: history, condense, answer_cache and answer
+# (retrieval and generation).
+
+def invoke_rag_chain(session_id: str, question: str, model_name: str = DEFAULT_MODEL) -> dict:
+    """Answer a question with the cached chain, passing the session's recent history for this call"""
+    try:
+        chain = get_rag_chain(model_name)
+        with span("history"):
+            chat_history = get_session_history(session_id)
+        with span("condense"):
+            standalone_question = question_rewriter.rewrite(chain, model_name, question, chat_history)
+        with span("answer_cache"):
+            corpus_version, vector, cached = lookup_cached_answer(model_name, standalone_question)
+        if cached is not None:
+            result = _cached_result(question, cached)
+        else:
+            with span("answer"):
+                result = chain.invoke({"question": standalone_question, "chat_history": []})
+            _store_answer(model_name, standalone_question, corpus_version, vector, result)
+        session_store.save_turn(session_id, question, result["answer"])
+        return result
     except Exception as e:
-        print(f"Error in get_rag_chain: {str(e)}")
+        print(f"Error in invoke_rag_chain: {str(e)}")
         raise
 
+async def ainvoke_rag_chain(session_id: str, question: str, model_name: str = DEFAULT_MODEL) -> dict:
+    """Async variant of `invoke_rag_chain` using the chain's native async path"""
+    try:
+        chain = get_rag_chain(model_name)
+        with span("history"):
+            chat_history = await run_db(get_session_history, session_id)
+        with span("condense"):
+            standalone_question = await question_rewriter.arewrite(chain, model_name, question, chat_history)
+        with span("answer_cache"):
+            corpus_version, vector, cached = await run_blocking(lookup_cached_answer, model_name, standalone_question)
+        if cached is not None:
+            result = _cached_result(question, cached)
+        else:
+            with span("answer"):
+                result = await chain.ainvoke({"question": standalone_question, "chat_history": []})
+            _store_answer(model_name, standalone_question, corpus_version, vector, result)
+        session_store.save_turn(session_id, question, result["answer"])
+        return result
+    except Exception as e:
+        print(f"Error in ainvoke_rag_chain: {str(e)}")
+        raise
+
+async def astream_rag_chain(session_id: str, question: str, model_name: str = DEFAULT_MODEL):
+    """Yield the answer tokens as the LLM generates them.
+
+    Only tokens from the answer step are streamed; the condense-question call
+    runs first and is not streamed. A cached answer is sent as a single chunk.
+    Session memory is updated once the answer completes. The answer step is
+    recorded once it has finished streaming, without children of its own.
+    """
+    chain = get_rag_chain(model_name)
+    with span("history"):
+        chat_history = await run_db(get_session_history, session_id)
+    with span("condense"):
+        standalone_question = await question_rewriter.arewrite(chain, model_name, question, chat_history)
+    with span("answer_cache"):
+        corpus_version, vector, cached = await run_blocking(lookup_cached_answer, model_name, standalone_question)
+    if cached is not None:
+        yield cached.answer
+        session_store.save_turn(session_id, question, cached.answer)
+        return
+
+    answer_step = chain.combine_docs_chain.get_name()
+    answer_run_id = None
+    tokens = []
+    result = None
+    start = time.perf_counter()
+    async for event in chain.astream_events(
+        {"question": standalone_question, "chat_history": []},
+        version="v2"
+    ):
+        kind = event["event"]
+        if kind == "on_chain_start" and answer_run_id is None and event["name"] == answer_step:
+            answer_run_id = event["run_id"]
+        elif kind == "on_chat_model_stream" and answer_run_id in event["parent_ids"]:
+            token = event["data"]["chunk"].content
+            if token:
+                tokens.append(token)
+                yield token
+        elif kind == "on_chain_end" and not event["parent_ids"]:
+            result = event["data"]["output"]
+    record_span("answer", start)
+    answer = result["answer"] if result else "".join(tokens)
+    if not tokens and answer:
+        # The model did not stream (or no documents were stuffed); send the answer whole
+        yield answer
+    if result:
+        _store_answer(model_name, standalone_question, corpus_version, vector, result)
+    session_store.save_turn(session_id, question, answer)
+
 def clear_session_memory(session_id: str) -> bool:
-    """Clear the conversation memory for a specific session"""
+    """Drop a session's cached memory; it is rehydrated from the chat logs on next use"""
     try:
-        if session_id in session_memories:
-            del session_memories[session_id]
-            return True
-        return False
+        return session_store.clear(session_id)
     except Exception as e:
         print(f"Error clearing session memory: {str(e)}")
         return False
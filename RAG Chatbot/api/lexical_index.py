@@ -0,0 +1,94 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import List, Tuple
+
+from langchain_core.documents import Document
+
+# Local BM25 index of every chunk in the vector store, kept next to rag_app.db
+LEXICAL_INDEX_DB = os.getenv("LEXICAL_INDEX_DB", "lexical_index.db")
+
+# Words too common to say anything about which chunk is relevant
+STOPWORDS = frozenset("""
+a an and are as at be been by can could did do does for from had has have how i if in into is it its
+me my of on or our so than that the their them then there these they this to was we were what when
+where which who whom why will with would you your tell about please
+""".split())
+
+def query_terms(text: str) -> List[str]:
+    """Lowercase word tokens of a query, without stopwords or duplicates"""
+    terms = []
+    for term in re.findall(r"\w+", text.lower()):
+        if term not in STOPWORDS and term not in terms:
+            terms.append(term)
+    return terms
+
+class LexicalIndex:
+    """SQLite FTS5 full-text index over chunk text, ranked with BM25.
+
+    Chunks are stored under the same ids as in Chroma, together with their
+    metadata, so search results can be fused with vector results and returned
+    as Documents without touching the vector store.
+    """
+
+    def __init__(self, db_path: str = LEXICAL_INDEX_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Porter stemming so "sensor" matches "sensors"
+        self._conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS chunks
+                              USING fts5(chunk_id UNINDEXED, file_id UNINDEXED, metadata UNINDEXED, content,
+                                         tokenize='porter unicode61')''')
+        self._conn.commit()
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[dict]):
+        """Index chunks, replacing any already indexed under the same ids"""
+        with self._lock:
+            self._conn.executemany('DELETE FROM chunks WHERE chunk_id = ?', [(chunk_id,) for chunk_id in ids])
+            self._conn.executemany(
+                'INSERT INTO chunks (chunk_id, file_id, metadata, content) VALUES (?, ?, ?, ?)',
+                [(chunk_id, metadata.get("file_id"), json.dumps(metadata), text)
+                 for chunk_id, text, metadata in zip(ids, texts, metadatas)]
+            )
+            self._conn.commit()
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            self._conn.executemany('DELETE FROM chunks WHERE chunk_id = ?', [(chunk_id,) for chunk_id in ids])
+            self._conn.commit()
+
+    def delete_file(self, file_id: int):
+        with self._lock:
+            self._conn.execute('DELETE FROM chunks WHERE file_id = ?', (file_id,))
+            self._conn.commit()
+
+    def search(self, query: str, k: int) -> List[Tuple[Document, float]]:
+        """Best `k` chunks matching any query term, with BM25 scores (higher is better)"""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT chunk_id, metadata, content, bm25(chunks) FROM chunks WHERE chunks MATCH ? '
+                'ORDER BY bm25(chunks) LIMIT ?',
+                (match, k)
+            ).fetchall()
+        # FTS5 reports BM25 negated so that ascending order is best first
+        return [
+            (Document(id=chunk_id, page_content=content, metadata=json.loads(metadata)), -score)
+            for chunk_id, metadata, content, score in rows
+        ]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT count(*) FROM chunks').fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM chunks')
+            self._conn.commit()
@@ -0,0 +1,158 @@
+import asyncio
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from db_utils import insert_application_logs_batch, db_executor
+from pydantic_models import ModelName
+
+logger = logging.getLogger(__name__)
+
+# Group commit configuration
+LOG_WRITER_BATCH_SIZE = int(os.getenv("LOG_WRITER_BATCH_SIZE", "200"))
+LOG_WRITER_FLUSH_INTERVAL = float(os.getenv("LOG_WRITER_FLUSH_INTERVAL", "0.25"))
+LOG_WRITER_QUEUE_SIZE = int(os.getenv("LOG_WRITER_QUEUE_SIZE", "10000"))
+LOG_WRITER_ENQUEUE_TIMEOUT = float(os.getenv("LOG_WRITER_ENQUEUE_TIMEOUT", "5"))
+
+class BatchedLogWriter:
+    """Buffers application_logs rows and writes them from a background thread in batched transactions.
+
+    A batch is flushed once it holds `batch_size` rows or its oldest row has
+    waited `flush_interval` seconds. When the buffer is full, writers wait up
+    to `enqueue_timeout` seconds for space (backpressure) and then fall back
+    to writing their row directly, so no interaction is lost.
+
+    Rows become visible to get_chat_history only after their batch is flushed.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = LOG_WRITER_BATCH_SIZE,
+        flush_interval: float = LOG_WRITER_FLUSH_INTERVAL,
+        queue_size: int = LOG_WRITER_QUEUE_SIZE,
+        enqueue_timeout: float = LOG_WRITER_ENQUEUE_TIMEOUT,
+        flush_func=insert_application_logs_batch
+    ):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.flush_func = flush_func
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        # Metrics
+        self.rows_written = 0
+        self.batches_written = 0
+        self.direct_writes = 0
+        self.failed_rows = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="rag-log-writer", daemon=True)
+                self._thread.start()
+
+    def _row(self, session_id: str, user_query: str, gpt_response: str, model: ModelName) -> tuple:
+        return (session_id, user_query, gpt_response, model.value)
+
+    def log_interaction(self, session_id: str, user_query: str, gpt_response: str, model: ModelName):
+        """Queue an interaction for the next batch, blocking while the buffer is full"""
+        self.start()
+        row = self._row(session_id, user_query, gpt_response, model)
+        try:
+            self._queue.put(row, timeout=self.enqueue_timeout)
+        except queue.Full:
+            logger.warning("Log writer buffer full; writing interaction directly")
+            self._flush([row])
+            self.direct_writes += 1
+
+    async def alog_interaction(self, session_id: str, user_query: str, gpt_response: str, model: ModelName):
+        """Async variant; only leaves the event loop when it has to wait for buffer space"""
+        self.start()
+        try:
+            self._queue.put_nowait(self._row(session_id, user_query, gpt_response, model))
+        except queue.Full:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                db_executor,
+                lambda: self.log_interaction(session_id, user_query, gpt_response, model)
+            )
+
+    def _flush(self, rows: list):
+        start = time.perf_counter()
+        try:
+            self.flush_func(rows)
+        except Exception as e:
+            self.failed_rows += len(rows)
+            logger.error(f"Failed to write {len(rows)} chat log rows: {str(e)}")
+            return
+        elapsed = time.perf_counter() - start
+        self.rows_written += len(rows)
+        self.batches_written += 1
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.total_flush_seconds += elapsed
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                rows = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopping.is_set():
+                    # On shutdown, drain without waiting for the interval
+                    try:
+                        rows.append(self._queue.get_nowait())
+                        continue
+                    except queue.Empty:
+                        break
+                try:
+                    rows.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(rows)
+            for _ in rows:
+                self._queue.task_done()
+
+    def flush(self):
+        """Block until every queued row has been written"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def stop(self):
+        """Write everything still buffered and stop the background thread"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping.set()
+        thread.join()
+        self._thread = None
+
+    def metrics(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "rows_written": self.rows_written,
+            "batches_written": self.batches_written,
+            "direct_writes": self.direct_writes,
+            "failed_rows": self.failed_rows,
+            "last_flush_seconds": self.last_flush_seconds,
+            "max_flush_seconds": self.max_flush_seconds,
+            "avg_flush_seconds": self.total_flush_seconds / self.batches_written if self.batches_written else 0.0
+        }
+
+log_writer = BatchedLogWriter()
+
+# Don't lose buffered rows when the interpreter exits without a clean shutdown
+atexit.register(log_writer.stop)
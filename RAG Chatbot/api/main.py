@@ -1,13 +1,30 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from pydantic_models import QueryInput, QueryResponse, DocumentInfo, DeleteFileRequest
-from langchain_utils import get_rag_chain
-from db_utils import insert_application_logs, get_chat_history, get_all_documents, insert_document_record, delete_document_record, get_db_connection, log_interaction
-from chroma_utils import index_document_to_chroma, delete_doc_from_chroma, load_and_split_document
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse
+from pydantic_models import QueryInput, QueryResponse, DocumentInfo, DeleteFileRequest, JobStatus, DocumentPage, ChatHistoryPage
+from fastapi.responses import JSONResponse, PlainTextResponse
+from langchain_utils import ainvoke_rag_chain, astream_rag_chain, get_rag_chain, DEFAULT_MODEL
+from db_utils import get_all_documents, delete_document_record, get_ingestion_job, get_documents_page, get_chat_history_page, initialize_database, run_db
+from chroma_utils import delete_doc_from_chroma, get_embedding_cache, get_vectorstore, sync_lexical_index, SUPPORTED_FORMATS, MAX_FILE_SIZE
+from retrieval_utils import retrieval_stats
+from job_queue import ingestion_queue
+from log_writer import log_writer
+from session_memory import session_store
+from answer_cache import answer_cache
+from question_rewriter import question_rewriter
+import asyncio
 import os
 import uuid
 import logging
-from fastapi.middleware.cors import CORSMiddleware
+import json
 import time
+import tempfile
+from typing import List
+from fastapi.middleware.cors import CORSMiddleware
+from concurrency_utils import run_blocking
+from rate_limiter import chat_rate_limiter, is_rate_limit_error, llm_rate_limiter, embedding_rate_limiter
+from upstream import llm_coalescer, embedding_coalescer
+from telemetry import registry, span, trace
 
 # Set up logging
 logging.basicConfig(
@@ -17,7 +34,46 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Filled in by the startup warm-up and reported by /ready
+readiness = {"ready": False, "error": None, "warm_up_ms": {}}
+
+def warm_up():
+    """Initialise what the first requests would otherwise pay for, recording how long each step took"""
+    steps = [
+        ("database", initialize_database),
+        # Pick up ingestion jobs interrupted by a restart
+        ("ingestion_jobs", ingestion_queue.resume_unfinished),
+        ("vectorstore", get_vectorstore),
+        # Index chunks ingested before the lexical index existed
+        ("lexical_index", sync_lexical_index),
+        ("rag_chain", lambda: get_rag_chain(DEFAULT_MODEL)),
+    ]
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        readiness["warm_up_ms"][name] = round((time.perf_counter() - start) * 1000, 1)
+
+async def run_warm_up():
+    try:
+        await run_blocking(warm_up)
+        readiness["ready"] = True
+        logger.info(f"Warm-up finished: {readiness['warm_up_ms']}")
+    except Exception as e:
+        readiness["error"] = str(e)
+        logger.error(f"Warm-up failed: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so the server accepts connections at once;
+    # requests arriving earlier initialise what they need on first use
+    warm_up_task = asyncio.create_task(run_warm_up())
+    yield
+    warm_up_task.cancel()
+    ingestion_queue.shutdown()
+    # Flush buffered chat logs before the process exits
+    log_writer.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -32,107 +88,288 @@ app.add_middleware(
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+@app.get("/ready")
+def ready():
+    """200 once the warm-up has finished, 503 (with the error if it failed) until then"""
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
 @app.post("/chat")
 async def chat(query_input: QueryInput) -> QueryResponse:
     try:
-        session_id = query_input.session_id or str(uuid.uuid4())
-        logger.info(f"Received chat request - Session: {session_id}, Model: {query_input.model.value}")
-        
-        # Add delay between requests
-        time.sleep(1)  # 1 second delay
-        
-        logger.info(f"Initializing RAG chain for session {session_id}")
-        chain = get_rag_chain(session_id, model_name=query_input.model.value)
-        
-        try:
-            logger.info(f"Processing question for session {session_id}: {query_input.question[:50]}...")
-            result = chain({
-                "question": query_input.question
-            })
-            answer = result.get('answer', '')
-            logger.info(f"Generated response for session {session_id} - Length: {len(answer)}")
-        except Exception as e:
-            if "429" in str(e):
-                logger.warning(f"Rate limit hit for session {session_id}")
-                return QueryResponse(
-                    answer="I'm currently experiencing high traffic. Please try again in a few seconds.",
+        with trace("chat") as current:
+            session_id = query_input.session_id or str(uuid.uuid4())
+            logger.info(f"Received chat request - Session: {session_id}, Model: {query_input.model.value}")
+
+            # Throttle requests without blocking the event loop
+            with span("rate_limit"):
+                waited = await chat_rate_limiter.acquire()
+            if waited:
+                logger.info(f"Rate limiter delayed session {session_id} by {waited:.2f}s")
+
+            try:
+                logger.info(f"Processing question for session {session_id}: {query_input.question[:50]}...")
+                result = await ainvoke_rag_chain(
+                    session_id,
+                    query_input.question,
+                    model_name=query_input.model.value
+                )
+                answer = result.get('answer', '')
+                logger.info(f"Generated response for session {session_id} - Length: {len(answer)}")
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    logger.warning(f"Rate limit hit for session {session_id}")
+                    current.status = "rate_limited"
+                    return QueryResponse(
+                        answer="I'm currently experiencing high traffic. Please try again in a few seconds.",
+                        session_id=session_id,
+                        model=query_input.model,
+                        timings=current.timings() if query_input.include_timings else None
+                    )
+                logger.error(f"Error processing question for session {session_id}: {str(e)}")
+                raise
+
+            # Queue the log row; the background writer commits it with the next batch
+            logger.info(f"Logging interaction to database for session {session_id}")
+            with span("log"):
+                await log_writer.alog_interaction(
                     session_id=session_id,
+                    user_query=query_input.question,
+                    gpt_response=answer,
                     model=query_input.model
                 )
-            logger.error(f"Error processing question for session {session_id}: {str(e)}")
-            raise
 
-        # Log to database
-        logger.info(f"Logging interaction to database for session {session_id}")
-        log_interaction(
-            session_id=session_id,
-            user_query=query_input.question,
-            gpt_response=answer,
-            model=query_input.model
-        )
-        
-        return QueryResponse(
-            answer=answer,
-            session_id=session_id,
-            model=query_input.model
-        )
+            return QueryResponse(
+                answer=answer,
+                session_id=session_id,
+                model=query_input.model,
+                timings=current.timings() if query_input.include_timings else None
+            )
     except Exception as e:
         logger.error(f"Unexpected error in chat endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/upload-doc")
+def format_sse(event: str, data: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(query_input: QueryInput):
+    """Stream the answer as server-sent events.
+
+    Emits `token` events while the answer is generated, then a single `done`
+    event with the full answer and latency breakdown (including per-stage
+    `timings` if the request asked for them), or an `error` event.
+    """
+    session_id = query_input.session_id or str(uuid.uuid4())
+    logger.info(f"Received streaming chat request - Session: {session_id}, Model: {query_input.model.value}")
+
+    async def event_stream():
+        with trace("chat_stream") as current:
+            # Throttle requests without blocking the event loop
+            with span("rate_limit"):
+                waited = await chat_rate_limiter.acquire()
+            if waited:
+                logger.info(f"Rate limiter delayed session {session_id} by {waited:.2f}s")
+
+            start = time.perf_counter()
+            time_to_first_token = None
+            tokens = []
+            try:
+                async for token in astream_rag_chain(
+                    session_id,
+                    query_input.question,
+                    model_name=query_input.model.value
+                ):
+                    if time_to_first_token is None:
+                        time_to_first_token = time.perf_counter() - start
+                    tokens.append(token)
+                    yield format_sse("token", {"token": token})
+            except Exception as e:
+                rate_limited = is_rate_limit_error(e)
+                if rate_limited:
+                    logger.warning(f"Rate limit hit for session {session_id}")
+                else:
+                    logger.error(f"Error streaming answer for session {session_id}: {str(e)}")
+                current.status = "rate_limited" if rate_limited else "error"
+                yield format_sse("error", {"detail": str(e), "rate_limited": rate_limited})
+                return
+
+            answer = "".join(tokens)
+            total_time = time.perf_counter() - start
+            logger.info(
+                f"Streamed response for session {session_id} - Length: {len(answer)}, "
+                f"TTFT: {(time_to_first_token or total_time):.3f}s, Total: {total_time:.3f}s"
+            )
+
+            # The log row is written once, after the stream has completed
+            with span("log"):
+                await log_writer.alog_interaction(
+                    session_id=session_id,
+                    user_query=query_input.question,
+                    gpt_response=answer,
+                    model=query_input.model
+                )
+            done = {
+                "answer": answer,
+                "session_id": session_id,
+                "model": query_input.model.value,
+                "time_to_first_token": time_to_first_token,
+                "total_time": total_time
+            }
+            if query_input.include_timings:
+                done["timings"] = current.timings()
+            yield format_sse("done", done)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Size of the chunks uploads are copied to disk in
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def check_upload_format(filename: str) -> str:
+    file_ext = os.path.splitext(filename)[1].lower()
+    if file_ext not in SUPPORTED_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file format: {file_ext}. Supported formats: {', '.join(SUPPORTED_FORMATS.keys())}"
+        )
+    return file_ext
+
+async def save_upload_stream(chunks, filename: str) -> str:
+    """Write an upload to a uniquely named file in UPLOAD_DIR one chunk at a time.
+
+    The size limit is enforced while streaming, so an oversized upload is
+    rejected as soon as it crosses MAX_FILE_SIZE instead of after it has been
+    fully received.
+    """
+    file_ext = check_upload_format(filename)
+    fd, file_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=file_ext)
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File too large: {filename}. Maximum size: {MAX_FILE_SIZE // (1024 * 1024)}MB"
+                    )
+                buffer.write(chunk)
+    except BaseException:
+        os.remove(file_path)
+        raise
+    logger.info(f"Saved upload {filename} ({size} bytes) to {file_path}")
+    return file_path
+
+async def iter_upload_file(file: UploadFile):
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+async def queue_upload(filename: str, file_path: str) -> dict:
+    job_id = await run_blocking(ingestion_queue.submit, filename, file_path)
+    return {
+        "message": f"Queued {filename} for indexing",
+        "job_id": job_id
+    }
+
+@app.post("/upload-doc", status_code=202)
 async def upload_document(file: UploadFile = File(...)):
+    """Save a multipart upload and queue it for ingestion; poll /jobs/{job_id} for progress"""
     try:
-        logger.info(f"Received upload request for file: {file.filename}")
-        
-        # Save file temporarily
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        try:
-            # First save to database to get file_id
-            logger.info(f"Saving file record to database: {file.filename}")
-            doc_id = insert_document_record(file.filename)
-            
-            # Index document in Chroma with file_id
-            logger.info(f"Indexing document in Chroma: {file.filename}")
-            index_success = index_document_to_chroma(file_path, doc_id)
-            
-            if not index_success:
-                # If indexing fails, remove from database and raise error
-                logger.error(f"Failed to index document in Chroma: {file.filename}")
-                delete_document_record(doc_id)
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Failed to index document {file.filename} in vector store"
-                )
-            
-            # Get number of chunks
-            chunks = load_and_split_document(file_path)
-            num_chunks = len(chunks)
-            logger.info(f"Successfully processed document into {num_chunks} chunks: {file.filename}")
-            
+        with trace("upload"):
+            logger.info(f"Received upload request for file: {file.filename}")
+            # Keep the file until the ingestion job has processed it
+            with span("save"):
+                file_path = await save_upload_stream(iter_upload_file(file), file.filename)
+            with span("queue"):
+                return await queue_upload(file.filename, file_path)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing upload for {file.filename}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/upload-docs", status_code=202)
+async def upload_documents(files: List[UploadFile] = File(...)):
+    """Save several multipart uploads and ingest them as one batch; returns a job id per file.
+
+    Files are parsed in a process pool and their chunks embedded and written
+    together; files already indexed under the same name with the same content are skipped.
+    """
+    saved = []
+    try:
+        with trace("upload_batch"):
+            logger.info(f"Received bulk upload request for {len(files)} files")
+            with span("save"):
+                for file in files:
+                    saved.append((file.filename, await save_upload_stream(iter_upload_file(file), file.filename)))
+            with span("queue"):
+                job_ids = await run_blocking(ingestion_queue.submit_batch, saved)
             return {
-                "message": f"Successfully uploaded and indexed {file.filename}",
-                "chunks": num_chunks,
-                "id": doc_id
+                "message": f"Queued {len(saved)} files for indexing",
+                "job_ids": job_ids
             }
-        finally:
-            # Always clean up the temporary file
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                logger.info(f"Cleaned up temporary file: {file_path}")
-                
     except Exception as e:
-        logger.error(f"Error processing upload for {file.filename}: {str(e)}")
+        # Nothing was queued; drop the files saved so far
+        for _, file_path in saved:
+            os.remove(file_path)
+        if isinstance(e, HTTPException):
+            raise
+        logger.error(f"Error processing bulk upload: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/upload-doc-stream", status_code=202)
+async def upload_document_stream(request: Request, filename: str = Query(...)):
+    """Stream a raw request body straight to disk and queue it for ingestion.
+
+    Unlike the multipart endpoint, the body is never buffered in full, so
+    memory use stays at one chunk per upload regardless of file size.
+    """
+    try:
+        with trace("upload"):
+            logger.info(f"Received streaming upload request for file: {filename}")
+            content_length = request.headers.get("content-length")
+            if content_length and not content_length.isdigit():
+                raise HTTPException(status_code=400, detail=f"Invalid Content-Length header: {content_length}")
+            if content_length and int(content_length) > MAX_FILE_SIZE:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File too large: {filename}. Maximum size: {MAX_FILE_SIZE // (1024 * 1024)}MB"
+                )
+            with span("save"):
+                file_path = await save_upload_stream(request.stream(), filename)
+            with span("queue"):
+                return await queue_upload(filename, file_path)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing upload for {filename}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+def get_job_status(job_id: str):
+    job = get_ingestion_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
 @app.get("/list-docs", response_model=list[DocumentInfo])
 def list_documents():
     return get_all_documents()
 
+@app.get("/documents", response_model=DocumentPage)
+async def list_documents_page(limit: int = Query(50, ge=1, le=500), cursor: int = None):
+    """Paginated document list, newest first; pass `next_cursor` back as `cursor` for the next page"""
+    return await run_db(get_documents_page, limit=limit, cursor=cursor)
+
+@app.get("/chat-history/{session_id}", response_model=ChatHistoryPage)
+async def chat_history_page(session_id: str, limit: int = Query(50, ge=1, le=500), cursor: int = None):
+    """Paginated chat history for a session, oldest first"""
+    return await run_db(get_chat_history_page, session_id, limit=limit, cursor=cursor)
+
 @app.post("/delete-doc")
 def delete_document(request: DeleteFileRequest):
     try:
@@ -156,3 +393,44 @@ def delete_document(request: DeleteFileRequest):
     except Exception as e:
         logger.error(f"Error deleting document {request.file_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics")
+def metrics():
+    """Request and stage latency histograms and per-model token counters, in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/log-writer-stats")
+def log_writer_stats():
+    return log_writer.metrics()
+
+@app.get("/cache-stats")
+def cache_stats():
+    return {
+        "embedding_cache": get_embedding_cache().stats(),
+        "answer_cache": answer_cache.stats(),
+        "question_rewriter": question_rewriter.stats()
+    }
+
+@app.get("/rate-limit-stats")
+def rate_limit_stats():
+    """Upstream Gemini rate limiter queues and request coalescing counters"""
+    return {
+        "llm": {**llm_rate_limiter.stats(), "coalescing": llm_coalescer.stats()},
+        "embedding": {**embedding_rate_limiter.stats(), "coalescing": embedding_coalescer.stats()}
+    }
+
+@app.get("/retrieval-stats")
+def get_retrieval_stats():
+    return retrieval_stats.as_dict()
+
+@app.get("/session-memory-stats")
+def session_memory_stats(top: int = Query(20, ge=0, le=1000)):
+    """Session memory store counters and the sessions using the most memory"""
+    return session_store.stats(top=top)
+
+@app.get("/session-memory/{session_id}")
+def session_memory_usage(session_id: str):
+    usage = session_store.session_usage(session_id)
+    if usage is None:
+        raise HTTPException(status_code=404, detail="Session is not cached")
+    return usage
@@ -0,0 +1,127 @@
+import sqlite3
+
+# Versioned schema migrations for rag_app.db. The version is kept in SQLite's
+# PRAGMA user_version and bumped in the same transaction as each migration.
+# Migrations must stay idempotent: databases created before versioning report
+# version 0 but already have some of the tables.
+
+def _add_missing_columns(conn: sqlite3.Connection, table: str, columns: dict):
+    existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    for column, column_type in columns.items():
+        if column not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+def _initial_schema(conn: sqlite3.Connection):
+    conn.execute('''CREATE TABLE IF NOT EXISTS application_logs
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     session_id TEXT,
+                     user_query TEXT,
+                     gpt_response TEXT,
+                     model TEXT,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS document_store
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     filename TEXT,
+                     upload_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+def _document_ingestion_results(conn: sqlite3.Connection):
+    _add_missing_columns(conn, 'document_store', {
+        "chunk_count": "INTEGER",
+        "char_count": "INTEGER",
+        "page_count": "INTEGER",
+        "ingestion_timings": "TEXT",
+    })
+
+def _ingestion_jobs(conn: sqlite3.Connection):
+    conn.execute('''CREATE TABLE IF NOT EXISTS ingestion_jobs
+                    (id TEXT PRIMARY KEY,
+                     filename TEXT NOT NULL,
+                     file_path TEXT NOT NULL,
+                     document_id INTEGER,
+                     status TEXT NOT NULL DEFAULT 'queued',
+                     stage TEXT NOT NULL DEFAULT 'queued',
+                     progress REAL NOT NULL DEFAULT 0,
+                     error TEXT,
+                     result TEXT,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+def _history_and_listing_indexes(conn: sqlite3.Connection):
+    # Serves get_chat_history and its keyset pages without scanning the whole log
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_application_logs_session_created '
+                 'ON application_logs (session_id, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_document_store_upload '
+                 'ON document_store (upload_timestamp)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_status '
+                 'ON ingestion_jobs (status, created_at)')
+
+def _corpus_version(conn: sqlite3.Connection):
+    # Single-row counter bumped whenever the indexed document set changes
+    conn.execute('''CREATE TABLE IF NOT EXISTS corpus_version
+                    (id INTEGER PRIMARY KEY CHECK (id = 1),
+                     version INTEGER NOT NULL)''')
+    conn.execute('INSERT OR IGNORE INTO corpus_version (id, version) VALUES (1, 0)')
+
+def _session_summaries(conn: sqlite3.Connection):
+    # Rolling summary of the turns that fell out of a session's history window;
+    # through_id is the newest application_logs row it covers
+    conn.execute('''CREATE TABLE IF NOT EXISTS session_summaries
+                    (session_id TEXT PRIMARY KEY,
+                     summary TEXT NOT NULL,
+                     through_id INTEGER NOT NULL DEFAULT 0,
+                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+def _document_content_hashes(conn: sqlite3.Connection):
+    # SHA-256 of the uploaded file, so identical files are not indexed twice
+    _add_missing_columns(conn, 'document_store', {"content_hash": "TEXT"})
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_document_store_content_hash '
+                 'ON document_store (content_hash)')
+
+def _document_chunks(conn: sqlite3.Connection):
+    # Id and text hash of every chunk in a document's current version, so a
+    # new version only embeds the chunks that changed
+    conn.execute('''CREATE TABLE IF NOT EXISTS document_chunks
+                    (document_id INTEGER NOT NULL,
+                     chunk_id TEXT NOT NULL,
+                     chunk_hash TEXT NOT NULL,
+                     PRIMARY KEY (document_id, chunk_id))''')
+    # Re-uploads are matched to the document they update by filename
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_document_store_filename '
+                 'ON document_store (filename)')
+
+# (version, description, migration) in the order they are applied
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "document ingestion results", _document_ingestion_results),
+    (3, "ingestion jobs", _ingestion_jobs),
+    (4, "history and listing indexes", _history_and_listing_indexes),
+    (5, "corpus version", _corpus_version),
+    (6, "session summaries", _session_summaries),
+    (7, "document content hashes", _document_content_hashes),
+    (8, "document chunks", _document_chunks),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """Bring the database up to LATEST_VERSION; returns the number of migrations applied"""
+    applied = 0
+    for version, description, migrate in MIGRATIONS:
+        if get_schema_version(conn) >= version:
+            continue
+        # IMMEDIATE takes the write lock up front, so concurrent workers
+        # starting together apply each migration exactly once
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_schema_version(conn) < version:
+                migrate(conn)
+                conn.execute(f'PRAGMA user_version = {version}')
+                applied += 1
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+    return applied
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from enum import Enum
 from datetime import datetime
+from typing import Dict, List, Optional
 
 class ModelName(str, Enum):
     GEMINI_PRO = "models/gemini-1.5-pro"
@@ -10,16 +11,54 @@ class QueryInput(BaseModel):
     question: str
     session_id: str = Field(default=None)
     model: ModelName = Field(default=ModelName.GEMINI_PRO)
+    # Return the request's per-stage timings with the answer
+    include_timings: bool = False
 
 class QueryResponse(BaseModel):
     answer: str
     session_id: str
     model: ModelName
+    # Seconds per traced stage, keyed by span path; only set when the request asked for it
+    timings: Optional[Dict[str, float]] = None
+
+class IngestionResult(BaseModel):
+    chunks: int
+    characters: int
+    pages: int
+    timings: Dict[str, float] = Field(default_factory=dict)  # seconds per stage: load, split, embed, write
+    # Chunks carried over unchanged from the previous version, and chunks of it that were removed
+    reused_chunks: int = 0
+    removed_chunks: int = 0
 
 class DocumentInfo(BaseModel):
     id: int
     filename: str
     upload_timestamp: datetime
+    ingestion: Optional[IngestionResult] = None
+
+class DocumentPage(BaseModel):
+    documents: List[DocumentInfo]
+    next_cursor: Optional[int] = None
+
+class ChatMessage(BaseModel):
+    role: str
+    content: str
+
+class ChatHistoryPage(BaseModel):
+    messages: List[ChatMessage]
+    next_cursor: Optional[int] = None
+
+class JobStatus(BaseModel):
+    id: str
+    filename: str
+    status: str  # queued, running, completed or failed
+    stage: str
+    progress: float
+    document_id: Optional[int] = None
+    error: Optional[str] = None
+    result: Optional[IngestionResult] = None
+    created_at: datetime
+    updated_at: datetime
 
 class DeleteFileRequest(BaseModel):
     file_id: int
\ No newline at end of file
@@ -0,0 +1,156 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from context_builder import CONTEXT_TOKEN_LIMIT, HISTORY_TOKEN_BUDGET, estimate_prompt_tokens, fit_history
+from token_utils import estimate_tokens
+
+# Question rewriting configuration
+QUESTION_REWRITE_HEURISTIC = os.getenv("QUESTION_REWRITE_HEURISTIC", "true").lower() == "true"
+QUESTION_REWRITE_CACHE_SIZE = int(os.getenv("QUESTION_REWRITE_CACHE_SIZE", "2000"))
+
+# Words that usually point back at something said earlier in the conversation
+FOLLOW_UP_WORDS = frozenset("""
+it its it's they them their theirs this that these those he him his she her hers there then
+former latter above same else other another also too more again one ones
+""".split())
+FOLLOW_UP_OPENERS = ("and", "but", "so", "or", "also", "then", "why", "how come")
+FOLLOW_UP_PATTERN = re.compile(r"^(what|how) about\b|^(tell me|say) more\b|^(and|any) (else|more)\b")
+
+def is_standalone(question: str) -> bool:
+    """Cheap, conservative check that a question can be answered without the chat history.
+
+    A question counts as standalone if it has no follow-up cues (pronouns,
+    "what about ...", a leading "and"/"but"...) and names something specific
+    (a capitalised, CamelCase or numeric token after the first word). Length
+    is no evidence: "How many employees does the company have?" refers back
+    to an earlier turn however long it is. Anything doubtful is rewritten.
+    """
+    text = question.strip().lower()
+    words = re.findall(r"[a-z0-9']+", text)
+    if len(words) < 3:
+        return False
+    if FOLLOW_UP_PATTERN.search(text) or any(text.startswith(opener + " ") for opener in FOLLOW_UP_OPENERS):
+        return False
+    if any(word in FOLLOW_UP_WORDS for word in words):
+        return False
+    tokens = re.findall(r"[\w'-]+", question.strip())
+    return any(
+        token[0].isupper() or any(character.isdigit() for character in token) for token in tokens[1:]
+    )
+
+class QuestionRewriter:
+    """Turns follow-up questions into standalone ones with as few LLM calls as possible.
+
+    The chain's condense-question LLM call is skipped when the session has no
+    history or `is_standalone` accepts the question, and rewrites are cached
+    per (model, history, question) so repeats are free. Counters record how
+    many LLM calls each shortcut saved.
+
+    The history sent to the LLM is cut to `history_budget` tokens, or less if
+    the condense prompt and question would otherwise exceed `token_limit`.
+    """
+
+    def __init__(
+        self,
+        use_heuristic: bool = QUESTION_REWRITE_HEURISTIC,
+        cache_size: int = QUESTION_REWRITE_CACHE_SIZE,
+        token_limit: int = CONTEXT_TOKEN_LIMIT,
+        history_budget: int = HISTORY_TOKEN_BUDGET
+    ):
+        self.use_heuristic = use_heuristic
+        self.cache_size = cache_size
+        self.token_limit = token_limit
+        self.history_budget = history_budget
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.llm_calls = 0
+        self.skipped_no_history = 0
+        self.skipped_standalone = 0
+        self.cache_hits = 0
+        self.history_truncations = 0
+
+    def _format_history(self, chain, question: str, chat_history: list) -> str:
+        if not chat_history:
+            return ""
+        prompt_tokens = estimate_prompt_tokens(chain.question_generator.prompt) + estimate_tokens(question)
+        fitted = fit_history(chat_history, min(self.history_budget, self.token_limit - prompt_tokens))
+        if len(fitted) < len(chat_history):
+            with self._lock:
+                self.history_truncations += 1
+        if chain.get_chat_history:
+            return chain.get_chat_history(fitted)
+        from langchain.chains.conversational_retrieval.base import _get_chat_history
+        return _get_chat_history(fitted)
+
+    def _cache_key(self, model_name: str, history: str, question: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{history}\0{question}".encode("utf-8")).hexdigest()
+
+    def _shortcut(self, model_name: str, question: str, history: str):
+        """Return (rewritten question or None, cache key); None means the LLM has to be called"""
+        if not history:
+            with self._lock:
+                self.skipped_no_history += 1
+            return question, None
+        if self.use_heuristic and is_standalone(question):
+            with self._lock:
+                self.skipped_standalone += 1
+            return question, None
+        key = self._cache_key(model_name, history, question)
+        with self._lock:
+            rewritten = self._cache.get(key)
+            if rewritten is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return rewritten, key
+            self.llm_calls += 1
+        return None, key
+
+    def _remember(self, key: str, rewritten: str):
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[key] = rewritten
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rewrite(self, chain, model_name: str, question: str, chat_history: list) -> str:
+        """The standalone question to retrieve and answer with"""
+        history = self._format_history(chain, question, chat_history)
+        rewritten, key = self._shortcut(model_name, question, history)
+        if rewritten is not None:
+            return rewritten
+        generator = chain.question_generator
+        rewritten = generator.invoke({"question": question, "chat_history": history})[generator.output_key]
+        self._remember(key, rewritten)
+        return rewritten
+
+    async def arewrite(self, chain, model_name: str, question: str, chat_history: list) -> str:
+        """Async variant of `rewrite`"""
+        history = self._format_history(chain, question, chat_history)
+        rewritten, key = self._shortcut(model_name, question, history)
+        if rewritten is not None:
+            return rewritten
+        generator = chain.question_generator
+        rewritten = (await generator.ainvoke({"question": question, "chat_history": history}))[generator.output_key]
+        self._remember(key, rewritten)
+        return rewritten
+
+    def stats(self) -> dict:
+        # The chain never condensed first turns, so only the heuristic and the cache count as savings
+        saved = self.skipped_standalone + self.cache_hits
+        return {
+            "llm_calls": self.llm_calls,
+            "skipped_no_history": self.skipped_no_history,
+            "skipped_standalone": self.skipped_standalone,
+            "cache_hits": self.cache_hits,
+            "cache_entries": len(self._cache),
+            "history_truncations": self.history_truncations,
+            "llm_calls_saved": saved,
+            "saved_rate": saved / (saved + self.llm_calls) if saved + self.llm_calls else 0.0
+        }
+
+question_rewriter = QuestionRewriter()
@@ -0,0 +1,406 @@
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    from google.api_core.exceptions import ResourceExhausted
+except ImportError:
+    ResourceExhausted = None
+
+class AsyncRateLimiter:
+    """Token bucket limiter that waits with asyncio.sleep instead of blocking the event loop.
+
+    `rate` tokens are added per second up to `capacity`, so short bursts are
+    served immediately while the sustained rate stays bounded. A rate of 0
+    disables the limiter.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        if rate < 0:
+            raise ValueError("rate must not be negative")
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1) -> float:
+        """Wait until `tokens` are available and take them; returns the time spent waiting"""
+        if not self.rate:
+            return 0.0
+        waited = 0.0
+        # More than a full bucket would never fit; wait for a full bucket instead
+        tokens = min(tokens, self.capacity)
+        # The lock makes waiters queue up in arrival order
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                delay = (tokens - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self._tokens -= tokens
+        return waited
+
+# Optional per-process cap on /chat requests: sustained requests per second and
+# the burst allowed on top of it. Off by default; the Gemini quotas are enforced
+# by the upstream limiters below, whatever the request rate.
+chat_rate_limiter = AsyncRateLimiter(
+    rate=float(os.getenv("CHAT_RATE_LIMIT_RPS", "0")),
+    capacity=float(os.getenv("CHAT_RATE_LIMIT_BURST", "5"))
+)
+
+# Upstream (Gemini) limits shared by every call this process makes. 0 disables a limit.
+GEMINI_LLM_RPM = float(os.getenv("GEMINI_LLM_RPM", "60"))
+GEMINI_LLM_TPM = float(os.getenv("GEMINI_LLM_TPM", "1000000"))
+GEMINI_EMBEDDING_RPM = float(os.getenv("GEMINI_EMBEDDING_RPM", "1500"))
+GEMINI_EMBEDDING_TPM = float(os.getenv("GEMINI_EMBEDDING_TPM", "0"))
+# Longest a call waits for capacity before failing with RateLimitExceeded
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "30"))
+# SQLite file holding the buckets, to share the limits between worker processes;
+# empty keeps them per process
+RATE_LIMIT_STATE_DB = os.getenv("RATE_LIMIT_STATE_DB", "")
+
+# Lower values are served first when calls queue for capacity
+CHAT_PRIORITY = 0
+BACKGROUND_PRIORITY = 1
+
+_priority = contextvars.ContextVar("rate_limit_priority", default=CHAT_PRIORITY)
+
+@contextmanager
+def rate_limit_priority(priority: int):
+    """Run upstream calls made in this context (and threads it is copied to) at `priority`"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def current_priority() -> int:
+    return _priority.get()
+
+class RateLimitExceeded(Exception):
+    """Raised when an upstream call would have to wait longer than the limiter's max_wait"""
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Whether an error (or one it was raised from) is an upstream 429 or a local RateLimitExceeded"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, RateLimitExceeded):
+            return True
+        if ResourceExhausted is not None and isinstance(error, ResourceExhausted):
+            return True
+        if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+class _SQLiteBuckets:
+    """Bucket levels stored in SQLite so every worker process draws from the same buckets"""
+
+    def __init__(self, path: str, name: str):
+        self.path = path
+        self.name = name
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS rate_limit_buckets
+                              (name TEXT PRIMARY KEY,
+                               level REAL NOT NULL,
+                               updated REAL NOT NULL)''')
+
+    def update(self, func):
+        """Apply `func(levels, updated) -> (levels, result)` atomically; returns result"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self._conn.execute(
+                "SELECT name, level, updated FROM rate_limit_buckets WHERE name LIKE ?", (f"{self.name}:%",)
+            ).fetchall()
+            levels = {name.split(":", 1)[1]: level for name, level, _ in rows}
+            updated = min((row[2] for row in rows), default=None)
+            levels, result = func(levels, updated)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO rate_limit_buckets (name, level, updated) VALUES (?, ?, ?)",
+                [(f"{self.name}:{bucket}", level, time.time()) for bucket, level in levels.items()]
+            )
+            self._conn.execute("COMMIT")
+            return result
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+class UpstreamRateLimiter:
+    """Requests-per-minute and tokens-per-minute token buckets in front of an upstream API.
+
+    Every call takes one request and its estimated tokens before it is sent;
+    `adjust` corrects the token estimate once the real usage is known. Calls
+    that cannot be served yet queue by priority (then arrival), so chat
+    requests overtake queued ingestion work. Both threads (`acquire`) and
+    coroutines (`aacquire`) wait in the same queue, and are woken when it or
+    the buckets change or when the capacity they wait for has refilled. A
+    call that would wait longer than `max_wait` raises RateLimitExceeded
+    instead.
+
+    Buckets start full and hold up to `burst_seconds` of their rate, which
+    for the default of 60 matches per-minute quotas. With `state_path` the
+    levels live in SQLite and are shared by every process using that file.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rpm: float,
+        tpm: float = 0,
+        max_wait: float = RATE_LIMIT_MAX_WAIT,
+        burst_seconds: float = 60,
+        state_path: str = RATE_LIMIT_STATE_DB
+    ):
+        self.name = name
+        self.max_wait = max_wait
+        # bucket -> (capacity, refill per second); a limit of 0 disables its bucket
+        self.buckets = {
+            bucket: (limit / 60 * burst_seconds, limit / 60)
+            for bucket, limit in (("requests", rpm), ("tokens", tpm)) if limit > 0
+        }
+        self._levels = {bucket: capacity for bucket, (capacity, _) in self.buckets.items()}
+        self._updated = time.time()
+        self._shared = _SQLiteBuckets(state_path, name) if state_path else None
+        self._cond = threading.Condition()
+        self._waiters = []
+        # ticket -> callable waking a queued coroutine, from any thread
+        self._wakers = {}
+        # The steps of aacquire that take the condition (and in shared mode a SQLite
+        # transaction) run here, clear of the blocking pool and its waiting threads
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"rate-limit-{name}")
+        self._sequence = itertools.count()
+        self.acquired = 0
+        self.delayed = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self.upstream_limited = 0
+        self.max_queue = 0
+        self.by_priority = {}
+
+    def _refill(self, levels: dict, updated: Optional[float], now: float) -> dict:
+        elapsed = now - updated if updated is not None else float("inf")
+        return {
+            bucket: min(capacity, levels.get(bucket, capacity) + elapsed * rate)
+            for bucket, (capacity, rate) in self.buckets.items()
+        }
+
+    def _update(self, func):
+        """Apply `func(levels) -> (levels, result)` to the current, refilled bucket levels"""
+        if self._shared is not None:
+            return self._shared.update(lambda levels, updated: func(self._refill(levels, updated, time.time())))
+        now = time.time()
+        self._levels, result = func(self._refill(self._levels, self._updated, now))
+        self._updated = now
+        return result
+
+    def _take(self, costs: dict) -> float:
+        """Take `costs` from the buckets if all can cover them; returns 0, or the seconds until they can"""
+        def take(levels):
+            delay = max(
+                ((costs[bucket] - level) / self.buckets[bucket][1] for bucket, level in levels.items()
+                 if level < costs[bucket]),
+                default=0.0
+            )
+            if delay == 0:
+                levels = {bucket: level - costs[bucket] for bucket, level in levels.items()}
+            return levels, delay
+        return self._update(take)
+
+    def _costs(self, tokens: float, requests: float) -> dict:
+        costs = {"requests": requests, "tokens": tokens}
+        # A call bigger than a whole bucket would never fit; let it through once the bucket is full
+        return {bucket: min(costs[bucket], capacity) for bucket, (capacity, _) in self.buckets.items()}
+
+    def _enqueue(self, priority: Optional[int], wake=None) -> tuple:
+        priority = current_priority() if priority is None else priority
+        ticket = (priority, next(self._sequence))
+        heapq.heappush(self._waiters, ticket)
+        if wake is not None:
+            self._wakers[ticket] = wake
+        self.max_queue = max(self.max_queue, len(self._waiters))
+        return ticket
+
+    def _dequeue(self, ticket: tuple):
+        if self._waiters and self._waiters[0] == ticket:
+            heapq.heappop(self._waiters)
+        else:
+            self._waiters.remove(ticket)
+            heapq.heapify(self._waiters)
+        self._wakers.pop(ticket, None)
+        self._notify()
+
+    def _notify(self):
+        """Wake queued calls to check the queue and buckets again; needs the condition.
+
+        Only the head of the queue can take capacity, so of the coroutines only
+        the head is woken; the others wait until they reach it or time out.
+        """
+        self._cond.notify_all()
+        wake = self._wakers.get(self._waiters[0]) if self._waiters else None
+        if wake is not None:
+            wake()
+
+    def _attempt(self, ticket: tuple, costs: dict) -> float:
+        """Take capacity if `ticket` is at the head of the queue; returns 0 once taken.
+
+        Otherwise returns the seconds until it could be taken, which is unbounded
+        behind another call: the head leaving the queue wakes the rest.
+        """
+        if self._waiters[0] != ticket:
+            return float("inf")
+        return self._take(costs)
+
+    def _granted(self, ticket: tuple, waited: float, queued: bool):
+        self.acquired += 1
+        self.by_priority[ticket[0]] = self.by_priority.get(ticket[0], 0) + 1
+        if queued:
+            self.delayed += 1
+            self.wait_seconds += waited
+
+    def _timed_out(self, deadline: float) -> bool:
+        if time.monotonic() < deadline:
+            return False
+        self.timeouts += 1
+        return True
+
+    def acquire(self, tokens: float = 0, requests: float = 1, priority: Optional[int] = None) -> float:
+        """Block until the call can be sent; returns the seconds spent waiting"""
+        if not self.buckets:
+            return 0.0
+        costs = self._costs(tokens, requests)
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        queued = False
+        with self._cond:
+            ticket = self._enqueue(priority)
+            try:
+                while True:
+                    delay = self._attempt(ticket, costs)
+                    if delay == 0:
+                        waited = time.monotonic() - start if queued else 0.0
+                        self._granted(ticket, waited, queued)
+                        return waited
+                    if self._timed_out(deadline):
+                        raise RateLimitExceeded(f"{self.name} rate limit: no capacity within {self.max_wait}s")
+                    queued = True
+                    self._cond.wait(min(delay, max(0.0, deadline - time.monotonic())))
+            finally:
+                self._dequeue(ticket)
+
+    def _enqueue_locked(self, priority: int, wake) -> tuple:
+        with self._cond:
+            return self._enqueue(priority, wake)
+
+    def _dequeue_locked(self, ticket: tuple):
+        with self._cond:
+            self._dequeue(ticket)
+
+    async def _leave_queue(self, enqueued: asyncio.Future):
+        """Dequeue the ticket `enqueued` resolves to, once it has been queued"""
+        ticket = await enqueued
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._dequeue_locked, ticket)
+
+    def _try_acquire(self, ticket: tuple, costs: dict, start: float, deadline: float, queued: bool) -> float:
+        """One attempt of `aacquire`; returns 0 once the capacity is taken, otherwise the seconds to wait"""
+        with self._cond:
+            delay = self._attempt(ticket, costs)
+            if delay == 0:
+                self._granted(ticket, time.monotonic() - start if queued else 0.0, queued)
+                return 0.0
+            if self._timed_out(deadline):
+                raise RateLimitExceeded(f"{self.name} rate limit: no capacity within {self.max_wait}s")
+            return delay
+
+    async def aacquire(self, tokens: float = 0, requests: float = 1, priority: Optional[int] = None) -> float:
+        """Async variant of `acquire` that waits on an asyncio.Event.
+
+        The condition is shared with threads blocked in `acquire`, and in shared
+        mode every attempt is a SQLite transaction that can wait for other
+        processes, so each step that takes it runs on the limiter's own thread
+        rather than on the event loop. Between attempts the coroutine sleeps
+        until it is woken or the capacity it needs has refilled.
+        """
+        if not self.buckets:
+            return 0.0
+        costs = self._costs(tokens, requests)
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        queued = False
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        enqueued = loop.run_in_executor(
+            self._executor, self._enqueue_locked, current_priority() if priority is None else priority,
+            functools.partial(loop.call_soon_threadsafe, changed.set)
+        )
+        try:
+            ticket = await asyncio.shield(enqueued)
+            while True:
+                # Cleared before the attempt, so a change made while it runs still wakes us
+                changed.clear()
+                delay = await loop.run_in_executor(
+                    self._executor, self._try_acquire, ticket, costs, start, deadline, queued
+                )
+                if delay == 0:
+                    return time.monotonic() - start if queued else 0.0
+                queued = True
+                try:
+                    await asyncio.wait_for(changed.wait(), min(delay, max(0.0, deadline - time.monotonic())))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Shielded so a cancelled call still leaves the queue, even if it was
+            # cancelled while being queued, instead of blocking everyone behind it
+            await asyncio.shield(self._leave_queue(enqueued))
+
+    def adjust(self, tokens: float):
+        """Charge (or refund, if negative) tokens once a call's real usage is known"""
+        if "tokens" not in self.buckets or not tokens:
+            return
+        capacity = self.buckets["tokens"][0]
+        with self._cond:
+            self._update(lambda levels: ({**levels, "tokens": min(capacity, levels["tokens"] - tokens)}, None))
+            self._notify()
+
+    def drain(self):
+        """Empty the request bucket after the upstream rejected a call as rate limited"""
+        if "requests" not in self.buckets:
+            return
+        with self._cond:
+            self.upstream_limited += 1
+            self._update(lambda levels: ({**levels, "requests": 0.0}, None))
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "limits_per_minute": {bucket: rate * 60 for bucket, (_, rate) in self.buckets.items()},
+                "shared": self._shared is not None,
+                "acquired": self.acquired,
+                "delayed": self.delayed,
+                "avg_wait_ms": self.wait_seconds * 1000 / self.acquired if self.acquired else 0.0,
+                "timeouts": self.timeouts,
+                "upstream_rate_limited": self.upstream_limited,
+                "queued": len(self._waiters),
+                "max_queued": self.max_queue,
+                "acquired_by_priority": dict(self.by_priority)
+            }
+
+llm_rate_limiter = UpstreamRateLimiter("llm", rpm=GEMINI_LLM_RPM, tpm=GEMINI_LLM_TPM)
+embedding_rate_limiter = UpstreamRateLimiter("embedding", rpm=GEMINI_EMBEDDING_RPM, tpm=GEMINI_EMBEDDING_TPM)
@@ -0,0 +1,94 @@
+import math
+import os
+import re
+from typing import List
+
+from langchain_core.documents import Document
+
+from lexical_index import query_terms
+
+# Which reranker scores retrieval candidates: "lexical", "cross-encoder" or "none"
+RERANKER = os.getenv("RERANKER", "lexical")
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+class Reranker:
+    """Scores candidate chunks against a query; higher scores rank first.
+
+    Subclasses implement `score`. Rerankers run locally, on every retrieval,
+    so they must be cheap enough for the request path.
+    """
+
+    name = "none"
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        # Keep the retriever's order
+        return [-rank for rank in range(len(documents))]
+
+    def rerank(self, query: str, documents: List[Document]) -> List[Document]:
+        if len(documents) < 2:
+            return list(documents)
+        scores = self.score(query, documents)
+        order = sorted(range(len(documents)), key=lambda index: (-scores[index], index))
+        return [documents[index] for index in order]
+
+def _stem(word: str) -> str:
+    # Just enough stemming to match plurals and common verb forms
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+class LexicalReranker(Reranker):
+    """Pure-Python reranker based on query term coverage and phrase matches.
+
+    Each query term found in a chunk adds its IDF over the candidate set, so
+    rare terms such as product names dominate; query bigrams that appear as
+    phrases add a bonus. The retriever's rank breaks ties.
+    """
+
+    name = "lexical"
+
+    def __init__(self, phrase_weight: float = 0.5, rank_weight: float = 0.1):
+        self.phrase_weight = phrase_weight
+        self.rank_weight = rank_weight
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        terms = [_stem(term) for term in query_terms(query)]
+        if not terms:
+            return super().score(query, documents)
+        texts = [" ".join(re.findall(r"\w+", document.page_content.lower())) for document in documents]
+        words = [{_stem(word) for word in text.split()} for text in texts]
+        document_frequency = {term: sum(term in document_words for document_words in words) for term in terms}
+        idf = {term: math.log(1 + len(documents) / (1 + frequency)) for term, frequency in document_frequency.items()}
+        bigrams = [f"{first} {second}" for first, second in zip(query_terms(query), query_terms(query)[1:])]
+        scores = []
+        for rank, (text, document_words) in enumerate(zip(texts, words)):
+            score = sum(idf[term] for term in terms if term in document_words)
+            score += self.phrase_weight * sum(bigram in text for bigram in bigrams)
+            score += self.rank_weight / (rank + 1)
+            scores.append(score)
+        return scores
+
+class CrossEncoderReranker(Reranker):
+    """Reranks with a sentence-transformers cross-encoder running on CPU"""
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str = RERANKER_MODEL):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        return [float(score) for score in self.model.predict([(query, document.page_content) for document in documents])]
+
+def create_reranker(name: str = RERANKER) -> Reranker:
+    """Build the configured reranker, falling back to the lexical one if the cross-encoder is unavailable"""
+    if name == "cross-encoder":
+        try:
+            return CrossEncoderReranker()
+        except ImportError:
+            print("sentence-transformers is not installed; using the lexical reranker")
+            return LexicalReranker()
+    if name == "none":
+        return Reranker()
+    return LexicalReranker()
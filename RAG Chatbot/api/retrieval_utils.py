@@ -0,0 +1,280 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict, Field
+
+from context_builder import CONTEXT_TOKEN_LIMIT
+from lexical_index import LexicalIndex, query_terms
+from rerank_utils import Reranker
+from telemetry import span
+from token_utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Hybrid retrieval configuration
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Candidates passed to the reranker, and how much of them reaches the prompt
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+RETRIEVAL_MAX_CHUNKS = int(os.getenv("RETRIEVAL_MAX_CHUNKS", "8"))
+# Lexical-only fast path: skip the query embedding when the best BM25 hit
+# contains every query term and clearly outscores the runner-up results
+LEXICAL_FAST_PATH = os.getenv("LEXICAL_FAST_PATH", "true").lower() == "true"
+LEXICAL_FAST_PATH_MIN_SCORE = float(os.getenv("LEXICAL_FAST_PATH_MIN_SCORE", "0.5"))
+LEXICAL_FAST_PATH_MARGIN = float(os.getenv("LEXICAL_FAST_PATH_MARGIN", "1.5"))
+
+def _document_key(document: Document) -> str:
+    return document.id or document.page_content
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int = RRF_K) -> List[Tuple[Document, float]]:
+    """Merge ranked lists by summing 1 / (k + rank) for each document, best first"""
+    scores = {}
+    documents = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = _document_key(document)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(key, document)
+    return sorted(((documents[key], score) for key, score in scores.items()), key=lambda item: item[1], reverse=True)
+
+class RetrievalStats:
+    """Counts how queries were answered by the hybrid retriever, and time spent per stage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.lexical_only = 0
+        self.hybrid = 0
+        self.pipeline_runs = 0
+        self.stage_seconds = {}
+
+    def record(self, lexical_only: bool):
+        with self._lock:
+            self.queries += 1
+            if lexical_only:
+                self.lexical_only += 1
+            else:
+                self.hybrid += 1
+
+    def record_timings(self, timings: dict):
+        with self._lock:
+            self.pipeline_runs += 1
+            for stage, seconds in timings.items():
+                self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "queries": self.queries,
+            "lexical_only": self.lexical_only,
+            "hybrid": self.hybrid,
+            "embeddings_skipped_rate": self.lexical_only / self.queries if self.queries else 0.0,
+            "avg_stage_ms": {
+                stage: seconds * 1000 / self.pipeline_runs for stage, seconds in self.stage_seconds.items()
+            }
+        }
+
+retrieval_stats = RetrievalStats()
+
+class HybridRetriever(BaseRetriever):
+    """Combines BM25 results from the local lexical index with Chroma similarity search.
+
+    Both retrievers return `fetch_k` candidates, which are merged with
+    reciprocal rank fusion and cut to `k`. When the lexical match is
+    confident, the vector search (and with it the remote query embedding) is
+    skipped and the BM25 ranking is used on its own.
+
+    Confidence means the top BM25 hit contains every query term and outscores
+    the hit at position `fast_path_rank` by `fast_path_margin`.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: Any
+    lexical_index: LexicalIndex
+    k: int = 2
+    fetch_k: int = RETRIEVAL_FETCH_K
+    rrf_k: int = RRF_K
+    fast_path: bool = LEXICAL_FAST_PATH
+    fast_path_min_score: float = LEXICAL_FAST_PATH_MIN_SCORE
+    fast_path_margin: float = LEXICAL_FAST_PATH_MARGIN
+    fast_path_rank: int = 2
+    stats: RetrievalStats = Field(default=retrieval_stats)
+
+    def is_confident(self, query: str, lexical: List[Tuple[Document, float]]) -> bool:
+        """Whether the lexical results alone are good enough to answer `query`"""
+        if not self.fast_path or not lexical:
+            return False
+        top_document, top_score = lexical[0]
+        if top_score < self.fast_path_min_score:
+            return False
+        content = top_document.page_content.lower()
+        if not all(term in content for term in query_terms(query)):
+            return False
+        if len(lexical) > self.fast_path_rank:
+            return top_score >= self.fast_path_margin * lexical[self.fast_path_rank][1]
+        return True
+
+    def answers_lexically(self, query: str) -> bool:
+        """Whether retrieving `query` will take the fast path and skip the query embedding"""
+        return self.fast_path and self.is_confident(query, self.lexical_index.search(query, self.fetch_k))
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        with span("lexical_search"):
+            lexical = self.lexical_index.search(query, self.fetch_k)
+        if self.is_confident(query, lexical):
+            self.stats.record(lexical_only=True)
+            return [document for document, _ in lexical[:self.k]]
+
+        with span("embed_query"):
+            query_vector = self.vectorstore.embeddings.embed_query(query)
+        with span("vector_search"):
+            vector = self.vectorstore.similarity_search_by_vector(query_vector, k=self.fetch_k)
+        self.stats.record(lexical_only=False)
+        fused = reciprocal_rank_fusion([[document for document, _ in lexical], vector], k=self.rrf_k)
+        return [document for document, _ in fused[:self.k]]
+
+def _chunk_position(document: Document) -> Optional[Tuple[str, int]]:
+    """(file id, chunk index) from the chunk's metadata, or from a legacy "<file_id>-<index>" chunk id"""
+    metadata = document.metadata or {}
+    if "file_id" in metadata and "chunk_index" in metadata:
+        return str(metadata["file_id"]), int(metadata["chunk_index"])
+    try:
+        file_id, index = (document.id or "").rsplit("-", 1)
+        return file_id, int(index)
+    except ValueError:
+        return None
+
+def _overlap(left: str, right: str, max_overlap: int = 400) -> int:
+    """Length of the longest suffix of `left` that is also a prefix of `right`"""
+    for size in range(min(len(left), len(right), max_overlap), 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+@dataclass
+class _PackedChunk:
+    document: Document
+    file_id: Optional[str]
+    start: int
+    end: int
+    text: str
+    tokens: int
+
+def pack_chunks(documents: List[Document], token_budget: int, max_chunks: int = 0) -> Tuple[List[Document], dict]:
+    """Pick chunks in rank order until `token_budget` tokens are used.
+
+    Neighbouring chunks of the same file are merged with their shared
+    `chunk_overlap` text removed (a chunk between two picked ones joins them
+    into one passage), and chunks already contained in a picked one are
+    dropped, so no text reaches the prompt twice. The best chunk is always
+    kept. `max_chunks` (0 for no limit) caps the number of separate passages.
+    """
+    packed = []
+    used = 0
+    merged = duplicates = skipped = 0
+    for document in documents:
+        text = document.page_content
+        if any(text in chunk.text for chunk in packed):
+            duplicates += 1
+            continue
+        position = _chunk_position(document)
+        neighbours = []
+        if position is not None:
+            file_id, index = position
+            neighbours = [chunk for chunk in packed if chunk.file_id == file_id
+                          and index in (chunk.start - 1, chunk.end + 1)]
+        if neighbours:
+            combined = text
+            for neighbour in neighbours:
+                if index == neighbour.end + 1:
+                    combined = neighbour.text + combined[_overlap(neighbour.text, combined):]
+                else:
+                    combined = combined + neighbour.text[_overlap(combined, neighbour.text):]
+            tokens = estimate_tokens(combined)
+            cost = tokens - sum(neighbour.tokens for neighbour in neighbours)
+            if used + cost > token_budget:
+                skipped += 1
+                continue
+            # The neighbour picked first keeps its place, and absorbs the other one
+            target = neighbours[0]
+            for neighbour in neighbours[1:]:
+                packed.remove(neighbour)
+            target.text = combined
+            target.tokens = tokens
+            target.start = min([index] + [neighbour.start for neighbour in neighbours])
+            target.end = max([index] + [neighbour.end for neighbour in neighbours])
+            merged += 1
+        else:
+            cost = estimate_tokens(text)
+            full = max_chunks and len(packed) >= max_chunks
+            if packed and (full or used + cost > token_budget):
+                skipped += 1
+                continue
+            file_id, index = position if position is not None else (None, 0)
+            packed.append(_PackedChunk(document, file_id, index, index, text, cost))
+        used += cost
+    result = [
+        Document(id=chunk.document.id, page_content=chunk.text, metadata=chunk.document.metadata)
+        for chunk in packed
+    ]
+    return result, {"tokens": used, "merged": merged, "duplicates": duplicates, "skipped": skipped}
+
+class RerankingRetriever(BaseRetriever):
+    """Over-fetches candidates, reranks them locally and packs the best into a token budget.
+
+    This is the retriever the RAG chain uses: `base_retriever` supplies the
+    candidates, `reranker` orders them and `pack_chunks` decides what is
+    stuffed into the prompt. Stage timings are logged for every query and
+    traced as a `retrieve` span with `rerank` and `pack` children.
+
+    The context gets `token_budget` tokens, or whatever is left of
+    `token_limit` after the answer prompt (`prompt_tokens`) and the query.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    base_retriever: BaseRetriever
+    reranker: Reranker
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+    max_chunks: int = RETRIEVAL_MAX_CHUNKS
+    token_limit: int = CONTEXT_TOKEN_LIMIT
+    # Tokens of the answer prompt template, set when the chain is built
+    prompt_tokens: int = 0
+    stats: RetrievalStats = Field(default=retrieval_stats)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        with span("retrieve"):
+            start = time.perf_counter()
+            candidates = self.base_retriever.invoke(
+                query, config={"callbacks": run_manager.get_child()} if run_manager else None
+            )
+            retrieved = time.perf_counter()
+            with span("rerank"):
+                ranked = self.reranker.rerank(query, candidates)
+            reranked = time.perf_counter()
+            budget = min(self.token_budget, self.token_limit - self.prompt_tokens - estimate_tokens(query))
+            with span("pack"):
+                documents, packing = pack_chunks(ranked, budget, self.max_chunks)
+            packed = time.perf_counter()
+
+        timings = {"retrieve": retrieved - start, "rerank": reranked - retrieved, "pack": packed - reranked}
+        self.stats.record_timings(timings)
+        logger.info(
+            f"Retrieved {len(candidates)} candidates, packed {len(documents)} passages "
+            f"({packing['tokens']} tokens, {packing['merged']} overlapping chunks merged, "
+            f"{packing['duplicates']} duplicates dropped) - Timings: "
+            + ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in timings.items())
+        )
+        return documents
@@ -0,0 +1,333 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from db_utils import get_recent_chat_turns, get_session_summary, save_session_summary
+from token_utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Session memory limits
+SESSION_MEMORY_MAX_SESSIONS = int(os.getenv("SESSION_MEMORY_MAX_SESSIONS", "1000"))
+SESSION_MEMORY_TTL = float(os.getenv("SESSION_MEMORY_TTL", "3600"))
+SESSION_MEMORY_MAX_TURNS = int(os.getenv("SESSION_MEMORY_MAX_TURNS", "10"))
+SESSION_MEMORY_MAX_TOKENS = int(os.getenv("SESSION_MEMORY_MAX_TOKENS", "1500"))
+# How stale a cached session may get before it is checked against application_logs
+SESSION_MEMORY_SYNC_INTERVAL = float(os.getenv("SESSION_MEMORY_SYNC_INTERVAL", "1.0"))
+# Turns that leave the window are folded into the summary once this many have accumulated
+SESSION_SUMMARY_BATCH_TURNS = int(os.getenv("SESSION_SUMMARY_BATCH_TURNS", "2"))
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+def _turn_tokens(question: str, answer: str) -> int:
+    return estimate_tokens(question) + estimate_tokens(answer)
+
+@dataclass
+class SessionMemory:
+    """The recent turns of one session as cached by this process, plus a summary of older ones"""
+    session_id: str
+    # (question, answer, application_logs id or None until the turn is logged)
+    turns: deque = field(default_factory=deque)
+    tokens: int = 0
+    # Newest application_logs row already reflected in `turns`
+    last_log_id: int = 0
+    # Turns answered here that have not shown up in application_logs yet
+    unsynced: deque = field(default_factory=lambda: deque(maxlen=SESSION_MEMORY_MAX_TURNS))
+    # Rolling summary and the newest application_logs row it covers
+    summary: str = ""
+    summary_through: int = 0
+    # Turns that left the window and still have to be folded into the summary
+    to_summarize: list = field(default_factory=list)
+    summarizing: bool = False
+    last_used: float = 0.0
+    last_synced: float = 0.0
+    _messages: Optional[list] = field(default=None, repr=False)
+
+    def append(self, question: str, answer: str, log_id: Optional[int] = None):
+        self.turns.append((question, answer, log_id))
+        self._messages = None
+        self.tokens += _turn_tokens(question, answer)
+
+    def trim(self, max_turns: int, max_tokens: int, keep_evicted: bool = False):
+        """Drop the oldest turns beyond the caps, always keeping the latest turn"""
+        while self.turns and (len(self.turns) > max_turns or (self.tokens > max_tokens and len(self.turns) > 1)):
+            turn = self.turns.popleft()
+            self.tokens -= _turn_tokens(turn[0], turn[1])
+            self._messages = None
+            if keep_evicted:
+                self.to_summarize.append(turn)
+
+    def assign_log_id(self, question: str, answer: str, log_id: int):
+        """Attach the application_logs id to our own turn once it has been logged"""
+        for turns in (self.turns, self.to_summarize):
+            for index in range(len(turns) - 1, -1, -1):
+                if turns[index] == (question, answer, None):
+                    turns[index] = (question, answer, log_id)
+                    return
+
+    def adopt_summary(self, summary: str, through_id: int):
+        """Use a stored summary if it covers more turns than ours, dropping the turns it covers"""
+        if through_id <= self.summary_through:
+            return
+        self.summary, self.summary_through = summary, through_id
+        for turn in [turn for turn in self.turns if turn[2] is not None and turn[2] <= through_id]:
+            self.turns.remove(turn)
+            self.tokens -= _turn_tokens(turn[0], turn[1])
+        self.to_summarize = [turn for turn in self.to_summarize if turn[2] is None or turn[2] > through_id]
+        self._messages = None
+
+    def messages(self) -> List[BaseMessage]:
+        # Built once per change; lookups between turns reuse the same message objects
+        if self._messages is None:
+            self._messages = [SystemMessage(content=SUMMARY_PREFIX + self.summary)] if self.summary else []
+            for question, answer, _ in self.turns:
+                self._messages.extend([HumanMessage(content=question), AIMessage(content=answer)])
+        return list(self._messages)
+
+    def usage(self, now: float) -> dict:
+        return {
+            "session_id": self.session_id,
+            "turns": len(self.turns),
+            "tokens": self.tokens,
+            "summary_tokens": estimate_tokens(self.summary) if self.summary else 0,
+            "bytes": sys.getsizeof(self.summary) + sum(
+                sys.getsizeof(question) + sys.getsizeof(answer) for question, answer, _ in self.turns
+            ),
+            "idle_seconds": round(now - self.last_used, 1)
+        }
+
+class SessionMemoryStore:
+    """Bounded cache of per-session chat history backed by application_logs.
+
+    Sessions expire after `ttl` seconds without use and the least recently used
+    session is evicted beyond `max_sessions`. Each session keeps a window of at
+    most `max_turns` turns and roughly `max_tokens` tokens of history, so
+    prompts stop growing with conversation length.
+
+    With a `summarizer(summary, turns) -> str`, turns that slide out of the
+    window are folded into a rolling summary on a background thread, once
+    each, and the summary is stored in session_summaries. Requests only read
+    the current summary; they never wait for one to be computed.
+
+    application_logs is the source of truth: a session missing from the cache
+    is rehydrated from its stored summary and the newest turns logged after it,
+    and a cached session is synced with rows logged since it was last checked,
+    which picks up turns answered by other worker processes. Turns answered
+    here are matched against their log rows once the log writer flushes them,
+    so they are not counted twice.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = SESSION_MEMORY_MAX_SESSIONS,
+        ttl: float = SESSION_MEMORY_TTL,
+        max_turns: int = SESSION_MEMORY_MAX_TURNS,
+        max_tokens: int = SESSION_MEMORY_MAX_TOKENS,
+        sync_interval: float = SESSION_MEMORY_SYNC_INTERVAL,
+        summary_batch_turns: int = SESSION_SUMMARY_BATCH_TURNS,
+        summarizer: Optional[Callable[[str, list], str]] = None,
+        load_turns=get_recent_chat_turns,
+        load_summary=get_session_summary,
+        save_summary=save_session_summary
+    ):
+        self.max_sessions = max(1, max_sessions)
+        self.ttl = ttl
+        self.max_turns = max(1, max_turns)
+        self.max_tokens = max_tokens
+        self.sync_interval = sync_interval
+        self.summary_batch_turns = max(1, summary_batch_turns)
+        self.summarizer = summarizer
+        self.load_turns = load_turns
+        self.load_summary = load_summary
+        self.save_summary = save_summary
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._summary_executor = None
+        self.hits = 0
+        self.rehydrations = 0
+        self.syncs = 0
+        self.ttl_evictions = 0
+        self.lru_evictions = 0
+        self.summaries = 0
+        self.summarized_turns = 0
+        self.summary_failures = 0
+        self.summary_seconds = 0.0
+
+    def _evict(self, now: float):
+        # Sessions are kept in least-recently-used order, so expired ones are at the front
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_used <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+            self.ttl_evictions += 1
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.lru_evictions += 1
+
+    def _trim(self, memory: SessionMemory):
+        memory.trim(self.max_turns, self.max_tokens, keep_evicted=self.summarizer is not None)
+
+    def _merge(self, memory: SessionMemory, rows: list):
+        for log_id, question, answer in rows:
+            if log_id <= max(memory.last_log_id, memory.summary_through):
+                # Already merged by a concurrent rehydration, or covered by the summary
+                continue
+            turn = (question, answer)
+            if turn in memory.unsynced:
+                # Our own turn reached the log; it (and anything queued before it) is already in `turns`
+                while memory.unsynced and memory.unsynced.popleft() != turn:
+                    pass
+                memory.assign_log_id(question, answer, log_id)
+            else:
+                memory.append(question, answer, log_id)
+            memory.last_log_id = log_id
+        self._trim(memory)
+
+    def get_history(self, session_id: str) -> List[BaseMessage]:
+        """The session's summary and recent turns as chat messages, rehydrating or syncing from application_logs as needed"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            memory = self._sessions.get(session_id)
+            if memory is not None:
+                memory.last_used = now
+                self._sessions.move_to_end(session_id)
+                if now - memory.last_synced < self.sync_interval:
+                    self.hits += 1
+                    return memory.messages()
+            after_id = max(memory.last_log_id, memory.summary_through) if memory is not None else None
+
+        # Read the log outside the lock so other sessions are not held up
+        stored_summary = self.load_summary(session_id)
+        if after_id is None:
+            # Rehydrate the turns the stored summary does not cover yet
+            after_id = stored_summary[1] if stored_summary else 0
+        rows = self.load_turns(session_id, self.max_turns, after_id)
+
+        with self._lock:
+            if memory is None:
+                memory = self._sessions.get(session_id)
+                if memory is None:
+                    memory = self._sessions[session_id] = SessionMemory(session_id, last_used=now)
+                    self.rehydrations += 1
+                    self._evict(now)
+            else:
+                self.syncs += 1
+            if stored_summary:
+                memory.adopt_summary(*stored_summary)
+            self._merge(memory, rows)
+            memory.last_synced = now
+            messages = memory.messages()
+        self._schedule_summary(session_id)
+        return messages
+
+    def save_turn(self, session_id: str, question: str, answer: str):
+        """Record a turn answered by this process"""
+        with self._lock:
+            memory = self._sessions.get(session_id)
+            if memory is None:
+                # Evicted mid-request; the next request rehydrates it from application_logs
+                return
+            memory.append(question, answer)
+            memory.unsynced.append((question, answer))
+            self._trim(memory)
+            memory.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+        self._schedule_summary(session_id)
+
+    def _schedule_summary(self, session_id: str):
+        if self.summarizer is None:
+            return
+        with self._lock:
+            memory = self._sessions.get(session_id)
+            if memory is None or memory.summarizing or len(memory.to_summarize) < self.summary_batch_turns:
+                return
+            memory.summarizing = True
+            if self._summary_executor is None:
+                self._summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rag-summary")
+        self._summary_executor.submit(self._summarize, memory)
+
+    def _summarize(self, memory: SessionMemory):
+        with self._lock:
+            summary, turns = memory.summary, list(memory.to_summarize)
+        start = time.perf_counter()
+        try:
+            new_summary = self.summarizer(summary, [(question, answer) for question, answer, _ in turns])
+        except Exception as e:
+            logger.error(f"Error summarising history for session {memory.session_id}: {str(e)}")
+            with self._lock:
+                memory.summarizing = False
+                self.summary_failures += 1
+            return
+        with self._lock:
+            memory.summary = new_summary
+            memory.summary_through = max([memory.summary_through] + [turn[2] for turn in turns if turn[2] is not None])
+            del memory.to_summarize[:len(turns)]
+            memory._messages = None
+            memory.summarizing = False
+            through_id = memory.summary_through
+            self.summaries += 1
+            self.summarized_turns += len(turns)
+            self.summary_seconds += time.perf_counter() - start
+        try:
+            self.save_summary(memory.session_id, new_summary, through_id)
+        except Exception as e:
+            logger.error(f"Error saving summary for session {memory.session_id}: {str(e)}")
+        # More turns may have left the window while the summary was being written
+        self._schedule_summary(memory.session_id)
+
+    def wait_for_summaries(self, timeout: float = 30.0) -> bool:
+        """Wait until no summary is being computed; returns False on timeout"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not any(memory.summarizing for memory in self._sessions.values()):
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def clear(self, session_id: str) -> bool:
+        """Drop a session from the cache; returns whether it was cached"""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def session_usage(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            memory = self._sessions.get(session_id)
+            return memory.usage(time.monotonic()) if memory is not None else None
+
+    def stats(self, top: int = 20) -> dict:
+        """Store-wide counters plus the `top` sessions using the most memory"""
+        now = time.monotonic()
+        with self._lock:
+            usages = [memory.usage(now) for memory in self._sessions.values()]
+        usages.sort(key=lambda usage: usage["bytes"], reverse=True)
+        return {
+            "sessions": len(usages),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl,
+            "max_turns": self.max_turns,
+            "max_tokens": self.max_tokens,
+            "total_bytes": sum(usage["bytes"] for usage in usages),
+            "hits": self.hits,
+            "rehydrations": self.rehydrations,
+            "syncs": self.syncs,
+            "ttl_evictions": self.ttl_evictions,
+            "lru_evictions": self.lru_evictions,
+            "summaries": self.summaries,
+            "summarized_turns": self.summarized_turns,
+            "summary_failures": self.summary_failures,
+            "avg_summary_ms": self.summary_seconds * 1000 / self.summaries if self.summaries else 0.0,
+            "largest_sessions": usages[:top]
+        }
+
+session_store = SessionMemoryStore()
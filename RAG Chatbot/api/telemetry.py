@@ -0,0 +1,251 @@
+"""Per-stage tracing spans and the Prometheus-style metrics served by /metrics"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Log every finished trace with its spans as one JSON line
+TRACE_LOGGING = os.getenv("TRACE_LOGGING", "true").lower() == "true"
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Counter:
+    """Monotonic counter with one series per combination of label values"""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per combination of label values"""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(str(labels[name]) for name in self.labels))
+        return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    labels = _format_labels(self.labels, key, f'le="{le}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """The metrics exported on /metrics, in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+registry = MetricsRegistry()
+
+request_duration = registry.histogram(
+    "rag_request_duration_seconds", "Duration of traced operations: chat, chat_stream, upload and ingest",
+    ["operation", "status"]
+)
+stage_duration = registry.histogram(
+    "rag_stage_duration_seconds", "Duration of each stage of a traced operation; nested stages are named by path",
+    ["operation", "stage"]
+)
+llm_requests = registry.counter("rag_llm_requests_total", "Chat model calls sent upstream", ["model"])
+llm_tokens = registry.counter(
+    "rag_llm_tokens_total", "Chat model tokens, from reported usage where available, otherwise estimated",
+    ["model", "type"]
+)
+embedding_requests = registry.counter(
+    "rag_embedding_requests_total", "Embedding calls sent upstream (cache misses only)", ["model"]
+)
+embedding_texts = registry.counter("rag_embedding_texts_total", "Texts embedded upstream", ["model"])
+embedding_tokens = registry.counter("rag_embedding_tokens_total", "Estimated tokens of texts embedded upstream", ["model"])
+
+class Trace:
+    """The spans of one traced operation, with their offsets from its start"""
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.start = time.perf_counter()
+        self.seconds = 0.0
+        self.status = "ok"
+        # (path, offset from the start, duration) of each finished span
+        self.spans: List[Tuple[str, float, float]] = []
+        self._lock = threading.Lock()
+
+    def add(self, path: str, start: float, seconds: float):
+        with self._lock:
+            self.spans.append((path, start - self.start, seconds))
+
+    def timings(self) -> Dict[str, float]:
+        """Seconds per span path, summed over repeated spans"""
+        timings = {}
+        with self._lock:
+            for path, _, seconds in self.spans:
+                timings[path] = timings.get(path, 0.0) + seconds
+        return timings
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span[1])
+        return {
+            "operation": self.operation,
+            "status": self.status,
+            "seconds": round(self.seconds, 6),
+            "spans": [
+                {"name": path, "offset": round(offset, 6), "seconds": round(seconds, 6)}
+                for path, offset, seconds in spans
+            ]
+        }
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("rag_trace", default=None)
+_current_span: contextvars.ContextVar[str] = contextvars.ContextVar("rag_span", default="")
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+@contextmanager
+def trace(operation: str):
+    """Trace an operation; spans opened in this context (and threads started from it) join it"""
+    current = Trace(operation)
+    trace_token = _current_trace.set(current)
+    span_token = _current_span.set("")
+    try:
+        yield current
+    except BaseException:
+        current.status = "error"
+        raise
+    finally:
+        try:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+        except ValueError:
+            # Closed from another context, e.g. an abandoned streaming response
+            pass
+        _finish(current)
+
+def _finish(current: Trace):
+    current.seconds = time.perf_counter() - current.start
+    request_duration.observe(current.seconds, operation=current.operation, status=current.status)
+    if TRACE_LOGGING:
+        logger.info(f"Trace {json.dumps(current.as_dict())}")
+
+def _span_path(name: str) -> str:
+    parent = _current_span.get()
+    return f"{parent}.{name}" if parent else name
+
+def _record(path: str, start: float, seconds: float):
+    current = _current_trace.get()
+    stage_duration.observe(seconds, operation=current.operation if current else "background", stage=path)
+    if current is not None:
+        current.add(path, start, seconds)
+
+@contextmanager
+def span(name: str):
+    """Time a stage of the current operation, named by its path under the enclosing spans (e.g. `answer.retrieve`).
+
+    Work outside any trace is recorded as `background`.
+    """
+    path = _span_path(name)
+    token = _current_span.set(path)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _current_span.reset(token)
+        _record(path, start, seconds)
+
+def record_span(name: str, start: float):
+    """Record a stage that started at `start` (perf_counter) and ends now, as a child of the current span.
+
+    For stages that cannot run inside `span`, such as iterating an async
+    generator; nothing started during the stage is nested under it.
+    """
+    _record(_span_path(name), start, time.perf_counter() - start)
+
+def observe_stages(timings: Dict[str, float]):
+    """Record stage timings measured elsewhere as nested stages of the current span.
+
+    For stages that interleave rather than run one after another, e.g. the
+    load/split/embed/write timings of a streamed ingestion. They are
+    observed in the histogram but not added to the trace's spans.
+    """
+    parent = _current_span.get()
+    current = _current_trace.get()
+    for stage, seconds in timings.items():
+        stage_duration.observe(seconds, operation=current.operation if current else "background",
+                               stage=f"{parent}.{stage}" if parent else stage)
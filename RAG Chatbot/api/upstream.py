@@ -0,0 +1,260 @@
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, List
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatResult
+from pydantic import ConfigDict
+
+from rate_limiter import UpstreamRateLimiter, is_rate_limit_error, llm_rate_limiter, embedding_rate_limiter
+from telemetry import (
+    embedding_requests, embedding_texts, embedding_tokens, llm_requests, llm_tokens, record_span, span
+)
+from token_utils import estimate_tokens
+
+# Output tokens reserved for each LLM call until its real usage is known
+LLM_OUTPUT_TOKEN_ESTIMATE = int(os.getenv("LLM_OUTPUT_TOKEN_ESTIMATE", "256"))
+# Share one upstream call between identical requests that are in flight at the same time
+REQUEST_COALESCING = os.getenv("REQUEST_COALESCING", "true").lower() == "true"
+
+class RequestCoalescer:
+    """Runs identical in-flight requests once and hands every caller the result.
+
+    The first caller for a key makes the call; callers arriving while it is
+    in flight wait for it and get a copy of its result (or its exception).
+    Nothing is kept once the call completes - that is the caches' job.
+    """
+
+    def __init__(self, enabled: bool = REQUEST_COALESCING):
+        self.enabled = enabled
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def _join(self, key: str):
+        """(future, leader) for `key`"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._inflight[key] = Future()
+            self.calls += 1
+            return future, True
+
+    def _finish(self, key: str, future: Future, result=None, error: BaseException = None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def run(self, key: str, func):
+        if not self.enabled:
+            return func()
+        future, leader = self._join(key)
+        if not leader:
+            return copy.deepcopy(future.result())
+        try:
+            result = func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def arun(self, key: str, func):
+        """Async variant of `run`; `func` returns an awaitable"""
+        if not self.enabled:
+            return await func()
+        future, leader = self._join(key)
+        if not leader:
+            return copy.deepcopy(await asyncio.wrap_future(future))
+        try:
+            result = await func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def stats(self) -> dict:
+        requests = self.calls + self.coalesced
+        return {
+            "in_flight": len(self._inflight),
+            "upstream_calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / requests if requests else 0.0
+        }
+
+llm_coalescer = RequestCoalescer()
+embedding_coalescer = RequestCoalescer()
+
+def _request_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def _message_tokens(messages) -> int:
+    return sum(estimate_tokens(str(message.content)) for message in messages)
+
+class RateLimitedChatModel(BaseChatModel):
+    """Sends a chat model's calls through the upstream rate limiter and request coalescer.
+
+    Each call reserves one request plus its estimated prompt and output tokens;
+    the output estimate is corrected from the response. A 429 from upstream
+    empties the request bucket so queued calls back off too. Streaming calls
+    are rate limited but not coalesced. Every call is timed as an `llm` span
+    and its tokens are counted per model.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    model: BaseChatModel
+    limiter: UpstreamRateLimiter = llm_rate_limiter
+    coalescer: RequestCoalescer = llm_coalescer
+    output_token_estimate: int = LLM_OUTPUT_TOKEN_ESTIMATE
+
+    @property
+    def _llm_type(self) -> str:
+        return f"rate-limited-{self.model._llm_type}"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return self.model._identifying_params
+
+    def _key(self, messages, stop, kwargs) -> str:
+        return _request_key(
+            self.model._identifying_params, [(message.type, message.content) for message in messages], stop, kwargs
+        )
+
+    def _cost(self, messages) -> int:
+        return _message_tokens(messages) + self.output_token_estimate
+
+    def _settle(self, output_tokens: int):
+        self.limiter.adjust(output_tokens - self.output_token_estimate)
+
+    def _count(self, input_tokens: int, output_tokens: int):
+        model = getattr(self.model, "model", None) or self.model._llm_type
+        llm_requests.inc(model=model)
+        llm_tokens.inc(input_tokens, model=model, type="input")
+        llm_tokens.inc(output_tokens, model=model, type="output")
+
+    def _settle_result(self, messages, result: ChatResult):
+        usage = [getattr(generation.message, "usage_metadata", None) for generation in result.generations]
+        if all(usage):
+            input_tokens = sum(item["input_tokens"] for item in usage)
+            output_tokens = sum(item["output_tokens"] for item in usage)
+        else:
+            input_tokens = _message_tokens(messages)
+            output_tokens = sum(estimate_tokens(generation.text) for generation in result.generations)
+        self._count(input_tokens, output_tokens)
+        self._settle(output_tokens)
+
+    def _rejected(self, error: Exception):
+        if is_rate_limit_error(error):
+            self.limiter.drain()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        def call():
+            self.limiter.acquire(self._cost(messages))
+            try:
+                result = self.model._generate(messages, stop=stop, **kwargs)
+            except Exception as e:
+                self._rejected(e)
+                raise
+            self._settle_result(messages, result)
+            return result
+        with span("llm"):
+            return self.coalescer.run(self._key(messages, stop, kwargs), call)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        async def call():
+            await self.limiter.aacquire(self._cost(messages))
+            try:
+                result = await self.model._agenerate(messages, stop=stop, **kwargs)
+            except Exception as e:
+                self._rejected(e)
+                raise
+            self._settle_result(messages, result)
+            return result
+        with span("llm"):
+            return await self.coalescer.arun(self._key(messages, stop, kwargs), call)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        start = time.perf_counter()
+        self.limiter.acquire(self._cost(messages))
+        output_tokens = 0
+        try:
+            for chunk in self.model._stream(messages, stop=stop, **kwargs):
+                output_tokens += estimate_tokens(chunk.text) if chunk.text else 0
+                yield chunk
+        except Exception as e:
+            self._rejected(e)
+            raise
+        finally:
+            self._count(_message_tokens(messages), output_tokens)
+            self._settle(output_tokens)
+            record_span("llm", start)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        start = time.perf_counter()
+        await self.limiter.aacquire(self._cost(messages))
+        output_tokens = 0
+        try:
+            async for chunk in self.model._astream(messages, stop=stop, **kwargs):
+                output_tokens += estimate_tokens(chunk.text) if chunk.text else 0
+                yield chunk
+        except Exception as e:
+            self._rejected(e)
+            raise
+        finally:
+            self._count(_message_tokens(messages), output_tokens)
+            self._settle(output_tokens)
+            record_span("llm", start)
+
+class RateLimitedEmbeddings(Embeddings):
+    """Sends an embedding backend's calls through the upstream rate limiter and request coalescer.
+
+    Calls are timed as `embedding` spans, and requests, texts and estimated tokens counted per model.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        limiter: UpstreamRateLimiter = embedding_rate_limiter,
+        coalescer: RequestCoalescer = embedding_coalescer
+    ):
+        self.embeddings = embeddings
+        self.limiter = limiter
+        self.coalescer = coalescer
+
+    def _call(self, task: str, texts: List[str], func):
+        def call():
+            tokens = sum(estimate_tokens(text) for text in texts)
+            self.limiter.acquire(tokens)
+            model = getattr(self.embeddings, "model", None) or type(self.embeddings).__name__
+            embedding_requests.inc(model=model)
+            embedding_texts.inc(len(texts), model=model)
+            embedding_tokens.inc(tokens, model=model)
+            try:
+                return func()
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    self.limiter.drain()
+                raise
+        with span("embedding"):
+            return self.coalescer.run(_request_key(task, texts), call)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._call("document", texts, lambda: self.embeddings.embed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call("query", [text], lambda: self.embeddings.embed_query(text))
@@ -0,0 +1,91 @@
+import os
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: writes are still serialised within the process
+    fcntl = None
+
+# "embedded" keeps Chroma in this process on local disk; "server" talks to a
+# shared Chroma server, which every uvicorn worker can use at once
+VECTOR_STORE_MODE = os.getenv("VECTOR_STORE_MODE", "embedded")
+CHROMA_PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
+CHROMA_HOST = os.getenv("CHROMA_HOST", "localhost")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8001"))
+CHROMA_SSL = os.getenv("CHROMA_SSL", "false").lower() == "true"
+# Pooled HTTP connections to the Chroma server per process
+CHROMA_HTTP_MAX_CONNECTIONS = int(os.getenv("CHROMA_HTTP_MAX_CONNECTIONS", "20"))
+CHROMA_HTTP_KEEPALIVE_SECS = float(os.getenv("CHROMA_HTTP_KEEPALIVE_SECS", "40"))
+# Collection used by langchain_chroma when no name is given, so existing stores keep working
+CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "langchain")
+
+class VectorStoreWriteLock:
+    """Serialises writes to the vector store.
+
+    Threads of this process take an in-process lock. In embedded mode they
+    also take an exclusive flock on a file next to the store, so worker
+    processes sharing the persist directory never write at the same time.
+    A Chroma server orders writes itself, so no file lock is used for it.
+    """
+
+    def __init__(self, lock_path: str = None):
+        self.lock_path = lock_path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self.lock_path and fcntl is not None:
+            try:
+                os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+                self._file = open(self.lock_path, "a")
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            except BaseException:
+                self._release_file()
+                self._lock.release()
+                raise
+        return self
+
+    def _release_file(self):
+        if self._file is not None:
+            self._file.close()  # closing drops the flock
+            self._file = None
+
+    def __exit__(self, *exc_info):
+        self._release_file()
+        self._lock.release()
+        return False
+
+def create_chroma_client(mode: str = VECTOR_STORE_MODE, persist_directory: str = CHROMA_PERSIST_DIRECTORY,
+                         host: str = CHROMA_HOST, port: int = CHROMA_PORT):
+    """The Chroma client for `mode`: a persistent local client or a pooled HTTP client"""
+    # Imported here so the API process only pays for chromadb once the store is first used
+    import chromadb
+    from chromadb.config import Settings
+    if mode == "server":
+        settings = Settings(
+            chroma_http_max_connections=CHROMA_HTTP_MAX_CONNECTIONS,
+            chroma_http_max_keepalive_connections=CHROMA_HTTP_MAX_CONNECTIONS,
+            chroma_http_keepalive_secs=CHROMA_HTTP_KEEPALIVE_SECS
+        )
+        return chromadb.HttpClient(host=host, port=port, ssl=CHROMA_SSL, settings=settings)
+    if mode != "embedded":
+        raise ValueError(f"Unknown VECTOR_STORE_MODE: {mode}. Use 'embedded' or 'server'")
+    return chromadb.PersistentClient(path=persist_directory)
+
+def create_write_lock(mode: str = VECTOR_STORE_MODE, persist_directory: str = CHROMA_PERSIST_DIRECTORY) -> VectorStoreWriteLock:
+    return VectorStoreWriteLock(os.path.join(persist_directory, ".write.lock") if mode == "embedded" else None)
+
+def create_vectorstore(embedding_function, mode: str = VECTOR_STORE_MODE) -> "Chroma":
+    """The LangChain Chroma store used for retrieval and ingestion, in embedded or server mode"""
+    from langchain_chroma import Chroma
+    return Chroma(
+        collection_name=CHROMA_COLLECTION,
+        client=create_chroma_client(mode),
+        embedding_function=embedding_function
+    )
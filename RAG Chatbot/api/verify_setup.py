@@ -1,16 +1,27 @@
 import os
 import sqlite3
+from migrations import LATEST_VERSION
+from vector_store import VECTOR_STORE_MODE, CHROMA_PERSIST_DIRECTORY, CHROMA_HOST, CHROMA_PORT, create_chroma_client
+
+DB_NAME = "rag_app.db"
 
 def verify_setup():
+    if VECTOR_STORE_MODE == "server":
+        # Check the shared Chroma server
+        try:
+            create_chroma_client().heartbeat()
+            print(f"✅ Chroma server reachable at {CHROMA_HOST}:{CHROMA_PORT}")
+        except Exception as e:
+            print(f"❌ Chroma server unreachable at {CHROMA_HOST}:{CHROMA_PORT}: {e}")
     # Check ChromaDB directory
-    if os.path.exists("chroma_db"):
+    elif os.path.exists(CHROMA_PERSIST_DIRECTORY):
         print("✅ ChromaDB directory exists")
     else:
         print("❌ ChromaDB directory missing")
         
     # Check SQLite database
     try:
-        conn = sqlite3.connect('chatbot.db')
+        conn = sqlite3.connect(DB_NAME)
         cursor = conn.cursor()
         
         # Check document_store table
@@ -27,6 +38,13 @@ def verify_setup():
         else:
             print("❌ application_logs table missing")
             
+        # Check schema version
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        if version == LATEST_VERSION:
+            print(f"✅ Schema is up to date (version {version})")
+        else:
+            print(f"❌ Schema version {version}, expected {LATEST_VERSION}. Run init_db.py")
+            
         conn.close()
     except sqlite3.Error as e:
         print(f"❌ Database error: {e}")
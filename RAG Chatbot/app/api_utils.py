@@ -25,35 +25,84 @@ def chat_with_bot(question: str, model: str, session_id: str) -> str:
     except Exception as e:
         return f"Error connecting to API: {str(e)}"
 
-def upload_document(file) -> bool:
-    """Upload a document to the API"""
+class ChatStreamError(Exception):
+    """Raised when the streaming chat endpoint reports an error"""
+
+    def __init__(self, detail: str, rate_limited: bool = False):
+        super().__init__(detail)
+        self.rate_limited = rate_limited
+
+def stream_chat_with_bot(question: str, model: str, session_id: str):
+    """Send a chat request to the streaming API and yield answer tokens as they arrive"""
+    with requests.post(
+        f"{API_URL}/chat/stream",
+        json={
+            "question": question,
+            "session_id": session_id,
+            "model": model
+        },
+        stream=True
+    ) as response:
+        if response.status_code != 200:
+            raise ChatStreamError(f"Error: {response.text}")
+
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "token":
+                    yield data["token"]
+                elif event == "error":
+                    raise ChatStreamError(data["detail"], rate_limited=data.get("rate_limited", False))
+                elif event == "done":
+                    return
+
+# Size of the chunks uploads are streamed in
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def iter_file_chunks(file, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """Yield a file-like object's content chunk by chunk"""
+    file.seek(0)
+    while chunk := file.read(chunk_size):
+        yield chunk
+
+def upload_document(file):
+    """Stream a document to the API; returns the ingestion job id, or None on failure"""
     try:
         # Print debug information
         print(f"Uploading file: {file.name}")
         
-        # Create the files dictionary with the correct format
-        files = {
-            "file": (
-                file.name,
-                file.getvalue(),
-                "application/octet-stream"
-            )
-        }
-        
-        # Make the request
+        # A generator body is sent with chunked transfer encoding, so the
+        # file is never copied into a single in-memory buffer
         response = requests.post(
-            f"{API_URL}/upload-doc",
-            files=files
+            f"{API_URL}/upload-doc-stream",
+            params={"filename": file.name},
+            data=iter_file_chunks(file),
+            headers={"Content-Type": "application/octet-stream"}
         )
         
         # Print response for debugging
         print(f"Upload response status: {response.status_code}")
         print(f"Upload response text: {response.text}")
         
-        return response.status_code == 200
+        if response.status_code == 202:
+            return response.json()["job_id"]
+        return None
     except Exception as e:
         print(f"Upload error: {str(e)}")
-        return False
+        return None
+
+def get_job_status(job_id: str):
+    """Get the status of an ingestion job, or None if it cannot be fetched"""
+    try:
+        response = requests.get(f"{API_URL}/jobs/{job_id}")
+        if response.status_code == 200:
+            return response.json()
+        return None
+    except Exception:
+        return None
 
 def get_documents():
     """Get list of uploaded documents"""
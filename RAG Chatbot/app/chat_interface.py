@@ -1,5 +1,5 @@
 import streamlit as st
-from api_utils import chat_with_bot
+from api_utils import stream_chat_with_bot, ChatStreamError
 
 def display_chat_interface(model: str, session_id: str):
     # Display chat messages
@@ -14,17 +14,18 @@ def display_chat_interface(model: str, session_id: str):
             st.markdown(prompt)
 
         with st.chat_message("assistant"):
-            with st.spinner('Thinking...'):
-                try:
-                    response = chat_with_bot(
-                        prompt, 
-                        model,
-                        session_id=session_id
-                    )
-                    if "429" in response or "quota" in response.lower():
-                        st.warning("The API is currently rate limited. Please wait a few seconds and try again.")
-                    else:
-                        st.markdown(response)
-                        st.session_state.messages.append({"role": "assistant", "content": response})
-                except Exception as e:
+            try:
+                # Render tokens as they arrive instead of waiting for the full answer
+                response = st.write_stream(stream_chat_with_bot(
+                    prompt,
+                    model,
+                    session_id=session_id
+                ))
+                st.session_state.messages.append({"role": "assistant", "content": response})
+            except ChatStreamError as e:
+                if e.rate_limited:
+                    st.warning("The API is currently rate limited. Please wait a few seconds and try again.")
+                else:
                     st.error(f"An error occurred: {str(e)}")
+            except Exception as e:
+                st.error(f"Error connecting to API: {str(e)}")
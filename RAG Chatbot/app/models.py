@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from enum import Enum
 from datetime import datetime
+from typing import Dict, Optional
 
 class ModelName(str, Enum):
     GEMINI_PRO = "models/gemini-1.5-pro"
@@ -16,10 +17,17 @@ class QueryResponse(BaseModel):
     session_id: str
     model: ModelName
 
+class IngestionResult(BaseModel):
+    chunks: int
+    characters: int
+    pages: int
+    timings: Dict[str, float] = Field(default_factory=dict)
+
 class DocumentInfo(BaseModel):
     id: int
     filename: str
     upload_timestamp: datetime
+    ingestion: Optional[IngestionResult] = None
 
 class DeleteFileRequest(BaseModel):
     file_id: int 
\ No newline at end of file
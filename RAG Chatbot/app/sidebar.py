@@ -1,7 +1,30 @@
+import time
 import streamlit as st
-from api_utils import upload_document, get_documents, delete_document
+from api_utils import upload_document, get_job_status, get_documents, delete_document
 from models import ModelName
 
+# Seconds between ingestion job status checks
+JOB_POLL_INTERVAL = 0.5
+
+def wait_for_ingestion(job_id: str, filename: str) -> bool:
+    """Poll an ingestion job, showing its stage and progress until it finishes"""
+    progress_bar = st.progress(0, text=f"Queued {filename}...")
+    while True:
+        job = get_job_status(job_id)
+        if job is None:
+            progress_bar.empty()
+            st.error("Lost track of the upload. Please check the document list.")
+            return False
+        if job["status"] == "completed":
+            progress_bar.progress(100, text=f"Indexed {filename}")
+            return True
+        if job["status"] == "failed":
+            progress_bar.empty()
+            st.error(f"Failed to index {filename}: {job['error']}")
+            return False
+        progress_bar.progress(int(job["progress"]), text=f"{job['stage'].capitalize()} {filename}... {job['progress']:.0f}%")
+        time.sleep(JOB_POLL_INTERVAL)
+
 def display_sidebar():
     # Model Selection
     st.header("Select Model")
@@ -24,12 +47,12 @@ def display_sidebar():
     if uploaded_file:
         st.write(f"Selected file: {uploaded_file.name}")
         if st.button("Upload Document"):
-            with st.spinner('Uploading...'):
-                if upload_document(uploaded_file):
-                    st.success(f"Successfully uploaded {uploaded_file.name}")
-                    st.rerun()
-                else:
-                    st.error("Failed to upload document. Please try again.")
+            job_id = upload_document(uploaded_file)
+            if job_id is None:
+                st.error("Failed to upload document. Please try again.")
+            elif wait_for_ingestion(job_id, uploaded_file.name):
+                st.success(f"Successfully uploaded {uploaded_file.name}")
+                st.rerun()
     
     # Document List Section
     st.subheader("Uploaded Documents")
@@ -40,6 +63,13 @@ def display_sidebar():
             col1, col2 = st.columns([4, 1])
             with col1:
                 st.text(doc['filename'])
+                ingestion = doc.get('ingestion')
+                if ingestion:
+                    st.caption(
+                        f"{ingestion['chunks']} chunks · {ingestion['pages']} pages · "
+                        f"{ingestion['characters']:,} chars · "
+                        f"{sum(ingestion['timings'].values()):.1f}s to index"
+                    )
             with col2:
                 if st.button("🗑️", key=f"delete_{doc['id']}", help="Delete document"):
                     if delete_document(doc['id']):